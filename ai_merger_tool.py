@@ -1,83 +1,204 @@
+import time
+
+IMPORT_STARTED = time.perf_counter()  # Start of the module's imports, reported by --profile-startup
+
+import logging
+import sqlite3
 import tkinter as tk
 from tkinter import filedialog, ttk, messagebox, Scrollbar
 import os
-import openai
+import sys
 import threading
+from collections import deque
 from datetime import datetime
 import winsound
-import tiktoken
-from cryptography.fernet import Fernet, InvalidToken
+
+from aimerger import core, dispatcher, fanout
+from aimerger.archive import ResponseArchive
+from aimerger.budget import build_budget, section_text_tokens
+from aimerger.chunking import ChunkPlanError, estimate_prompt_tokens, new_merge_id, pack_chunks, reserved_completion_tokens
+from aimerger.debug_log import LEVELS, LOG_DIR, DebugLog
+from aimerger.dispatcher import Dispatcher, PromptJob
+from aimerger.resend import Snapshot, build_changes_text, load_snapshot, save_snapshot, session_root
+from aimerger.reduction import COLLAPSE_WHITESPACE, DEDUPE_HEADERS, SIGNATURES_ONLY, STRIP_COMMENTS, ReductionPipeline
+from aimerger.model_cache import account_fingerprint, load_cached_models, save_cached_models
+from aimerger.model_registry import get_model
+from aimerger.ingest import DEFAULT_EXCLUDE, DEFAULT_INCLUDE, find_source_files, load_source_files, split_patterns
+from aimerger.journal import RequestJournal
+from aimerger.response_cache import ResponseCache
+from aimerger.startup import StartupProfile
+from aimerger.telemetry import INGEST, REQUEST, Telemetry, summarize_ingest, summarize_requests
+from aimerger.token_index import TokenIndex
+from aimerger.tokens import IncrementalTokenCounter, get_encoding, join_text_tokens, num_tokens_from_messages
+from aimerger.ui_events import APPEND, REPLACE, EventQueue
+
+# openai, cryptography and the tiktoken encoding are loaded by the warmup thread once the window is shown
+IMPORTS_DONE = time.perf_counter()
 
 # Constants
-MAX_TOKEN_LIMIT = 128000
 OPENAI_TIMEOUT = (60, 360)  # (connect_timeout, read_timeout) in seconds
-
-# Dictionary of model names and their corresponding maximum token limits
-# Add new models to this list to make them available in the dropdown (last updated: 20/07/2024)
-MODEL_MAX_TOKENS = {
-    # GPT-4o models
-    "gpt-4o": 128000, 
-    "gpt-4o-2024-05-13": 128000,
-    
-    # GPT-4o mini models
-    "gpt-4o-mini": 128000, 
-    "gpt-4o-mini-2024-07-18": 128000,
-    
-    # GPT-4 Turbo and GPT-4 models
-    "gpt-4-turbo": 128000, 
-    "gpt-4-turbo-2024-04-09": 128000,
-    "gpt-4-turbo-preview": 128000, 
-    "gpt-4-0125-preview": 4096,  
-    "gpt-4-1106-preview": 4096,  
-    "gpt-4": 8192,
-    "gpt-4-0613": 8192, 
-    "gpt-4-0314": 8192,
-    
-    # GPT-4-32k models
-    "gpt-4-32k": 32768, 
-    "gpt-4-32k-0613": 32768, 
-    "gpt-4-32k-0314": 32768,
-    
-    # GPT-3.5 Turbo models
-    "gpt-3.5-turbo-0125": 16385, 
-    "gpt-3.5-turbo": 16385,
-    "gpt-3.5-turbo-1106": 16385, 
-    "gpt-3.5-turbo-instruct": 4096,
-    "gpt-3.5-turbo-16k": 16385, 
-    "gpt-3.5-turbo-0613": 4096,
-    "gpt-3.5-turbo-16k-0613": 16385, 
-    "gpt-3.5-turbo-0301": 4096,
+TOKEN_COUNT_DEBOUNCE_MS = 150  # Delay after the last keystroke before recounting tokens
+UI_UPDATE_INTERVAL_MS = 50  # Interval for applying worker thread updates to the widgets
+FULL_MIDDLE_TEXT_LIMIT = 2_000_000  # Loaded sources above this many characters are only previewed
+PREVIEW_LINES_PER_FILE = 20  # Lines shown per file when the middle part is previewed
+INSERT_BATCH_CHARS = 200_000  # Characters inserted into the middle part per Tk event loop pass
+MAX_DEBUG_LOG_LINES = 20000  # Oldest lines are removed from the debug log field above this
+RESPONSE_WINDOW = 10  # Latest responses kept in the response field, older ones are reloaded from their files
+ARCHIVE_SEARCH_DEBOUNCE_MS = 200  # Delay after the last keystroke before searching the response archive
+BUDGET_BAR_HEIGHT = 16
+BUDGET_MIN_SEGMENT_PX = 2  # Files narrower than this are drawn together in the budget bar
+BUDGET_COLORS = {
+    "frame": "#999999", "start": "#4a90d9", "file": ("#5cb85c", "#3d8b3d"), "end": "#9b59b6",
+    "completion": "#f0ad4e", "free": "#eeeeee", "over": "#d9534f",
 }
+DEFAULT_MODEL = "gpt-3.5-turbo"
+FANOUT_OFF = "Off"
+FANOUT_MODES = {fanout.FIRST_WINS: "First Wins", fanout.COMPARE_ALL: "Compare All"}  # Fan-out mode -> label
+
+# Request scheduling, adjust the rate limits to your OpenAI account's tier
+MAX_CONCURRENT_REQUESTS = 4
+REQUESTS_PER_MINUTE = 500
+TOKENS_PER_MINUTE = 300000
+MAX_REQUEST_RETRIES = 5
 
 
 class Application(tk.Tk):
     def __init__(self):
-        super().__init__()
+        self.startup_profile = StartupProfile(IMPORT_STARTED)
+        self.startup_profile.add("module imports", IMPORT_STARTED, IMPORTS_DONE)
+        with self.startup_profile.phase("Tk init"):
+            super().__init__()
+        self._init_started = time.perf_counter()
         
         self.title("AI Merger")
         self.state("zoomed")
         
         # Initialize application variables
-        self.debug_logs = []
+        self.debug_log = DebugLog()
         self.cs_file_contents = []
-        self.is_request_in_progress = False
+        self.cs_file_names = []
+        self.cs_file_tokens = []
+        self.cs_file_paths = []
+        self.cs_file_encoding = None  # Encoding cs_file_tokens were counted with
+        self.cs_file_text_tokens = None  # TextTokens per file for the budget, None while they are counted
+        self._middle_text_tokens = None  # Their join
+        self._budget_segments = []  # (x0, x1, description) of the drawn budget bar
+        self._load_id = 0
+        self.token_index = TokenIndex()
         self.gpt_response_counter = 0
         self.available_models = []
+        self.jobs = {}
+        self._response_jobs = []  # Jobs with a response this session, oldest first
+        self._rendered_jobs = deque()  # Jobs whose response is in the response field, oldest first
+        self._streamed_text = {}  # job id -> text received so far, until the response is complete
+        self._viewing_job = None  # Job shown on its own instead of the latest responses
+        self._pending_snapshots = {}  # job id -> (session root, sections) saved once the job is done
+        self._comparison_panes = {}  # job id -> (summary variable, text widget) of a compare-all window
+        self._pending_errors = []
+        self._models_refreshing = False
+        
+        # Worker threads never touch widgets, they post events applied on the Tk thread
+        self.ui_events = EventQueue({"piece": APPEND, "load_progress": REPLACE, "archive_progress": REPLACE})
+        self._ui_handlers = {
+            "piece": self._insert_response_text,
+            "status": self._show_job_status,
+            "load_progress": self._show_load_progress,
+            "load_failed": self._show_load_failed,
+            "load_done": self._show_loaded_files,
+            "section_tokens": self._show_section_tokens,
+            "models": self._show_models,
+            "warmed_up": self._finish_startup,
+            "archive_progress": self._show_archive_progress,
+            "archive_imported": self._show_archive_imported,
+        }
+        self.startup_complete = False
+        
+        # Send prompts on a bounded worker pool, updates are applied on the Tk thread
+        with self.startup_profile.phase("open caches"):
+            response_cache = ResponseCache()
+            try:
+                self.archive = ResponseArchive()
+            except sqlite3.Error as e:
+                # E.g. a SQLite build without FTS5, responses are still saved as files
+                self.archive = None
+                self.debug_log.log(f"Response archive unavailable: {e}", logging.WARNING)
+            try:
+                self.journal = RequestJournal()
+            except sqlite3.Error as e:
+                # Requests are still sent, they just cannot be resumed after a crash
+                self.journal = None
+                self.debug_log.log(f"Request journal unavailable: {e}", logging.WARNING)
+        self._archive_search_job = None
+        self._archive_results = {}
+        self.telemetry = Telemetry()
+        self.dispatcher = Dispatcher(
+            max_workers=MAX_CONCURRENT_REQUESTS,
+            requests_per_minute=REQUESTS_PER_MINUTE,
+            tokens_per_minute=TOKENS_PER_MINUTE,
+            max_retries=MAX_REQUEST_RETRIES,
+            cache=response_cache,
+            archive=self.archive,
+            telemetry=self.telemetry,
+            journal=self.journal,
+            on_update=lambda job: self.ui_events.post("status", job, job.status),
+            on_piece=lambda job, piece: self.ui_events.post("piece", job, piece),
+        )
         
         # Initialize token count variables
         self.start_text_token_count_var = tk.StringVar()
         self.final_prompt_token_count_var = tk.StringVar()
         self.end_text_token_count_var = tk.StringVar()
+        self.prompt_token_count_var = tk.StringVar()
+        self.budget_detail_var = tk.StringVar()
+        self.token_counters = {}
+        self._create_token_counters(DEFAULT_MODEL)
+        self._token_count_jobs = {}
         
-        # Load or generate encryption key and API key
-        self.encryption_key = self.load_or_generate_key()
-        self.api_key_loaded = self.load_api_key()
+        # The keys are loaded once cryptography was imported by the warmup thread
+        self.encryption_key = None
+        self.api_key_loaded = ""
         
         # Create UI widgets
-        self._create_widgets()
+        with self.startup_profile.phase("create widgets"):
+            self._create_widgets()
+        self.startup_profile.add("application init", self._init_started)
         
+        self.after(UI_UPDATE_INTERVAL_MS, self._process_ui_queue)
+        self.after_idle(self._start_warmup)
+        self.after_idle(self.search_archive)
+
+    def _start_warmup(self):
+        """Load the heavy dependencies and the tokenizer on a worker thread after the window is shown.
+
+        The API key and model list are set up from the UI queue once that is done.
+        """
+        def warm_up():
+            for name, load in (
+                ("import cryptography", lambda: __import__("cryptography.fernet")),
+                ("import openai", lambda: __import__("openai")),
+                ("load tiktoken encoding", get_encoding),
+            ):
+                try:
+                    with self.startup_profile.phase(name):
+                        load()
+                except Exception as e:
+                    self.add_debug_log(f"Warmup step '{name}' failed: {e}", logging.WARNING)
+            self.ui_events.post("warmed_up", None)
+
+        threading.Thread(target=warm_up, name="warmup", daemon=True).start()
+
+    def _finish_startup(self, key=None, payload=None):
+        """Load the API key and initialize the OpenAI API once the warmup is done."""
+        with self.startup_profile.phase("load API key"):
+            self.encryption_key = self.load_or_generate_key()
+            self.api_key_loaded = self.load_api_key()
+            self.api_key_entry.insert(0, self.api_key_loaded)
         # Initialize OpenAI API and load models if API key is available
-        self.initialize_openai_api()
+        with self.startup_profile.phase("initialize OpenAI API"):
+            self.initialize_openai_api()
+        self.startup_complete = True
+        self._recount_prompt()
+        self.after_idle(self.offer_unfinished_requests)
 
     def _create_widgets(self):
         # Create notebook for tabbed interface
@@ -91,6 +212,11 @@ class Application(tk.Tk):
         self.notebook.add(self.tab2, text="GPT Response")
         self.tab3 = ttk.Frame(self.notebook)
         self.notebook.add(self.tab3, text="Debug Logs")
+        self.tab4 = ttk.Frame(self.notebook)
+        self.notebook.add(self.tab4, text="Requests")
+        self.tab5 = ttk.Frame(self.notebook)
+        self.notebook.add(self.tab5, text="Stats")
+        self.notebook.bind("<<NotebookTabChanged>>", self.refresh_stats)
 
         # Create top frame for API key and model selection
         top_frame = tk.Frame(self.tab1)
@@ -100,7 +226,6 @@ class Application(tk.Tk):
         tk.Label(top_frame, text="API Key: ").pack(side=tk.LEFT, padx=5, pady=5)
         self.api_key_entry = tk.Entry(top_frame, show="*", width=50)
         self.api_key_entry.pack(side=tk.LEFT, padx=5, pady=5)
-        self.api_key_entry.insert(0, self.load_api_key())
         save_api_key_button = tk.Button(
             top_frame,
             text="Save API Key",
@@ -110,7 +235,7 @@ class Application(tk.Tk):
 
         # Model selection dropdown
         self.model_var = tk.StringVar()
-        self.model_var.set("gpt-3.5-turbo")
+        self.model_var.set(DEFAULT_MODEL)
         self.model_dropdown = ttk.Combobox(
             top_frame,
             textvariable=self.model_var,
@@ -119,6 +244,9 @@ class Application(tk.Tk):
         )
         self.model_dropdown.pack(side=tk.LEFT, padx=5, pady=5)
         self.model_dropdown.bind("<<ComboboxSelected>>", self.on_model_change)
+        tk.Button(top_frame, text="Refresh Models", command=self.refresh_models).pack(
+            side=tk.LEFT, padx=5, pady=5
+        )
 
         # Max tokens frame
         self.max_tokens_frame = tk.Frame(top_frame)
@@ -170,11 +298,11 @@ class Application(tk.Tk):
         )
         reset_debug_button.pack(side=tk.RIGHT, padx=5, pady=5)
 
-        # Progress bar
-        self.progress = ttk.Progressbar(
-            top_frame, orient="horizontal", length=200, mode="determinate"
+        # Request status summary, details are shown in the Requests tab
+        self.request_status_var = tk.StringVar(value="No requests")
+        tk.Label(top_frame, textvariable=self.request_status_var).pack(
+            side=tk.RIGHT, padx=5, pady=5
         )
-        self.progress.pack(side=tk.RIGHT, padx=5, pady=5)
 
         # Text fields for start, middle, and end message parts
         tk.Label(self.tab1, text="Start Message Part", anchor="w").pack(
@@ -184,9 +312,35 @@ class Application(tk.Tk):
         self.start_text_field.pack(fill=tk.X, padx=5, pady=5)
         self.start_text_field.bind("<KeyRelease>", self.update_start_text_token_count)
 
+        # Folder picker with the globs selecting the source files to merge
+        source_frame = tk.Frame(self.tab1)
+        source_frame.pack(pady=10)
         tk.Button(
-            self.tab1, text="Open File Explorer", command=self.open_file_explorer
-        ).pack(pady=10)
+            source_frame, text="Open Folder", command=self.open_file_explorer
+        ).pack(side=tk.LEFT, padx=5)
+        tk.Label(source_frame, text="Include:").pack(side=tk.LEFT)
+        self.include_var = tk.StringVar(value=";".join(DEFAULT_INCLUDE))
+        tk.Entry(source_frame, textvariable=self.include_var, width=20).pack(side=tk.LEFT, padx=5)
+        tk.Label(source_frame, text="Exclude:").pack(side=tk.LEFT)
+        self.exclude_var = tk.StringVar(value=";".join(DEFAULT_EXCLUDE))
+        tk.Entry(source_frame, textvariable=self.exclude_var, width=30).pack(side=tk.LEFT, padx=5)
+        self.load_status_var = tk.StringVar()
+        tk.Label(source_frame, textvariable=self.load_status_var).pack(side=tk.LEFT, padx=5)
+
+        # Reduction steps applied to the loaded files, changing one reloads them
+        reduction_frame = tk.Frame(self.tab1)
+        reduction_frame.pack()
+        self.reduction_vars = {}
+        for step, label in (
+            (STRIP_COMMENTS, "Strip Comments"),
+            (COLLAPSE_WHITESPACE, "Collapse Whitespace"),
+            (DEDUPE_HEADERS, "Deduplicate Headers"),
+            (SIGNATURES_ONLY, "Signatures Only"),
+        ):
+            self.reduction_vars[step] = tk.BooleanVar(value=False)
+            tk.Checkbutton(
+                reduction_frame, text=label, variable=self.reduction_vars[step], command=self.reload_files
+            ).pack(side=tk.LEFT, padx=5)
 
         tk.Label(self.tab1, text="Middle Message Part", anchor="w").pack(
             fill="x", padx=5, pady=5
@@ -202,17 +356,153 @@ class Application(tk.Tk):
         self.end_text_field.pack(fill=tk.X, padx=5, pady=5)
         self.end_text_field.bind("<KeyRelease>", self.update_end_text_token_count)
 
-        # Debug mode checkbox
+        # Token counts of the message parts and the savings of the last diff-only send
+        token_frame = tk.Frame(self.tab1)
+        token_frame.pack(fill=tk.X, padx=5)
+        for label, count_var in (
+            ("Start tokens:", self.start_text_token_count_var),
+            ("Middle tokens:", self.final_prompt_token_count_var),
+            ("End tokens:", self.end_text_token_count_var),
+        ):
+            tk.Label(token_frame, text=label).pack(side=tk.LEFT)
+            tk.Label(token_frame, textvariable=count_var, width=8, anchor="w").pack(side=tk.LEFT)
+        tk.Label(token_frame, text="Prompt:").pack(side=tk.LEFT)
+        tk.Label(token_frame, textvariable=self.prompt_token_count_var, anchor="w").pack(side=tk.LEFT)
+        self.resend_savings_var = tk.StringVar()
+        tk.Label(token_frame, textvariable=self.resend_savings_var).pack(side=tk.LEFT, padx=5)
+
+        # Share of the model's context window taken by each prompt part and the completion
+        budget_frame = tk.Frame(self.tab1)
+        budget_frame.pack(fill=tk.X, padx=5)
+        self.budget_bar = tk.Canvas(budget_frame, height=BUDGET_BAR_HEIGHT, highlightthickness=0)
+        self.budget_bar.pack(fill=tk.X)
+        self.budget_bar.bind("<Configure>", lambda event: self._refresh_budget())
+        self.budget_bar.bind("<Motion>", self._show_budget_segment)
+        self.budget_bar.bind("<Leave>", lambda event: self.budget_detail_var.set(""))
+        tk.Label(budget_frame, textvariable=self.budget_detail_var, anchor="w").pack(fill=tk.X)
+
+        # Send option checkboxes
+        options_frame = tk.Frame(self.tab1)
+        options_frame.pack(pady=5)
+
         self.debug_var = tk.BooleanVar()
-        tk.Checkbutton(self.tab1, text="Debug Mode", variable=self.debug_var).pack(
-            pady=5
+        tk.Checkbutton(options_frame, text="Debug Mode", variable=self.debug_var).pack(
+            side=tk.LEFT, padx=5
+        )
+
+        self.stream_var = tk.BooleanVar(value=True)
+        tk.Checkbutton(options_frame, text="Stream Response", variable=self.stream_var).pack(
+            side=tk.LEFT, padx=5
         )
 
-        # Send to GPT button
+        # Unchecked requests always go to the API
+        self.use_cache_var = tk.BooleanVar(value=True)
+        tk.Checkbutton(
+            options_frame, text="Use Response Cache", variable=self.use_cache_var
+        ).pack(side=tk.LEFT, padx=5)
+
+        # Merges over the model's limit are split into several prompts
+        self.auto_chunk_var = tk.BooleanVar(value=True)
+        tk.Checkbutton(
+            options_frame, text="Auto Chunk Large Merges", variable=self.auto_chunk_var
+        ).pack(side=tk.LEFT, padx=5)
+
+        self.chunk_sequence_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(
+            options_frame, text="Send Chunks in Sequence", variable=self.chunk_sequence_var
+        ).pack(side=tk.LEFT, padx=5)
+
+        # Resends only the diffs of the files changed since the last response for this folder
+        self.changes_only_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(
+            options_frame, text="Send Only Changes", variable=self.changes_only_var
+        ).pack(side=tk.LEFT, padx=5)
+
+        # Send buttons
+        send_frame = tk.Frame(self.tab1)
+        send_frame.pack(pady=10)
         self.send_button = tk.Button(
-            self.tab1, text="Send to GPT", command=self.threaded_send_prompt
+            send_frame, text="Send to GPT", command=self.threaded_send_prompt
+        )
+        self.send_button.pack(side=tk.LEFT, padx=5)
+        tk.Button(
+            send_frame, text="Send per File", command=self.send_prompt_per_file
+        ).pack(side=tk.LEFT, padx=5)
+
+        # Fan-out sends the same prompt to every model checked in the menu
+        tk.Label(send_frame, text="Fan-out:").pack(side=tk.LEFT, padx=(15, 0))
+        self.fanout_mode_var = tk.StringVar(value=FANOUT_OFF)
+        ttk.Combobox(
+            send_frame, textvariable=self.fanout_mode_var, values=[FANOUT_OFF] + list(FANOUT_MODES.values()), state="readonly", width=12
+        ).pack(side=tk.LEFT, padx=5)
+        self.fanout_model_vars = {}
+        fanout_models_button = tk.Menubutton(send_frame, text="Models to Compare", relief=tk.RAISED)
+        self.fanout_models_menu = tk.Menu(fanout_models_button, tearoff=False)
+        fanout_models_button["menu"] = self.fanout_models_menu
+        fanout_models_button.pack(side=tk.LEFT, padx=5)
+
+        # Response archive search, packed first so the response field takes the remaining space
+        archive_frame = tk.LabelFrame(self.tab2, text="Response Archive")
+        archive_frame.pack(side=tk.BOTTOM, fill=tk.X, padx=5, pady=5)
+        archive_search_frame = tk.Frame(archive_frame)
+        archive_search_frame.pack(fill=tk.X)
+        tk.Label(archive_search_frame, text="Search:").pack(side=tk.LEFT, padx=5, pady=5)
+        self.archive_query_var = tk.StringVar()
+        archive_query_entry = tk.Entry(archive_search_frame, textvariable=self.archive_query_var, width=50)
+        archive_query_entry.pack(side=tk.LEFT, padx=5, pady=5)
+        archive_query_entry.bind("<KeyRelease>", self.schedule_archive_search)
+        tk.Label(archive_search_frame, text="Model:").pack(side=tk.LEFT, padx=5, pady=5)
+        self.archive_model_var = tk.StringVar()
+        self.archive_model_dropdown = ttk.Combobox(
+            archive_search_frame, textvariable=self.archive_model_var, state="readonly", width=30,
+            postcommand=self._update_archive_models,
         )
-        self.send_button.pack(pady=10)
+        self.archive_model_dropdown.pack(side=tk.LEFT, padx=5, pady=5)
+        self.archive_model_dropdown.bind("<<ComboboxSelected>>", self.search_archive)
+        tk.Button(
+            archive_search_frame, text="Import Responses Folder", command=self.import_responses
+        ).pack(side=tk.LEFT, padx=5, pady=5)
+        self.archive_status_var = tk.StringVar()
+        tk.Label(archive_search_frame, textvariable=self.archive_status_var).pack(side=tk.LEFT, padx=5)
+
+        archive_results_frame = tk.Frame(archive_frame)
+        archive_results_frame.pack(fill=tk.X)
+        self.archive_view = ttk.Treeview(
+            archive_results_frame,
+            columns=("date", "model", "name", "tokens", "latency", "match"),
+            show="headings",
+            height=8,
+        )
+        for column, heading, width in (
+            ("date", "Date", 130),
+            ("model", "Model", 150),
+            ("name", "Request", 180),
+            ("tokens", "Tokens", 90),
+            ("latency", "Latency", 70),
+            ("match", "Match", 400),
+        ):
+            self.archive_view.heading(column, text=heading)
+            self.archive_view.column(column, width=width, stretch=column == "match")
+        self.archive_view.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        self.archive_view.bind("<<TreeviewSelect>>", self.show_archived_response)
+        self.archive_preview = tk.Text(archive_results_frame, wrap=tk.WORD, height=10, width=80)
+        self.archive_preview.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=5)
+
+        # Responses of this session, selecting an older one loads it from its file
+        response_list_frame = tk.Frame(self.tab2)
+        response_list_frame.pack(side=tk.LEFT, fill=tk.Y)
+        tk.Button(
+            response_list_frame, text="Show Latest", command=self.show_latest_responses
+        ).pack(fill=tk.X, padx=5, pady=5)
+        self.response_list = ttk.Treeview(
+            response_list_frame, columns=("response", "model"), show="headings", selectmode="browse"
+        )
+        self.response_list.heading("response", text="Response")
+        self.response_list.heading("model", text="Model")
+        self.response_list.column("response", width=200)
+        self.response_list.column("model", width=120)
+        self.response_list.pack(fill=tk.Y, expand=True, padx=5)
+        self.response_list.bind("<<TreeviewSelect>>", self.show_selected_response)
 
         # GPT Response field
         yscrollbar = Scrollbar(self.tab2)
@@ -225,6 +515,21 @@ class Application(tk.Tk):
 
         yscrollbar.config(command=self.gpt_response_field.yview)
 
+        # Debug log level filter and file sink
+        debug_options_frame = tk.Frame(self.tab3)
+        debug_options_frame.pack(fill=tk.X)
+        tk.Label(debug_options_frame, text="Log Level:").pack(side=tk.LEFT, padx=5, pady=5)
+        self.debug_level_var = tk.StringVar(value="DEBUG")
+        debug_level_dropdown = ttk.Combobox(
+            debug_options_frame, textvariable=self.debug_level_var, values=list(LEVELS), state="readonly", width=10
+        )
+        debug_level_dropdown.pack(side=tk.LEFT, padx=5, pady=5)
+        debug_level_dropdown.bind("<<ComboboxSelected>>", self.render_debug_logs)
+        self.log_file_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(
+            debug_options_frame, text="Write Log File", variable=self.log_file_var, command=self.toggle_log_file
+        ).pack(side=tk.LEFT, padx=5, pady=5)
+
         # Debug log field
         self.debug_scrollbar = Scrollbar(self.tab3)
         self.debug_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
@@ -235,16 +540,84 @@ class Application(tk.Tk):
         self.debug_log_field.pack(fill=tk.BOTH, expand=True)
         self.debug_scrollbar.config(command=self.debug_log_field.yview)
 
+        # Request status view
+        requests_options_frame = tk.Frame(self.tab4)
+        requests_options_frame.pack(fill=tk.X)
+        tk.Button(
+            requests_options_frame, text="Unfinished Requests", command=self.show_unfinished_requests
+        ).pack(side=tk.LEFT, padx=5, pady=5)
+        columns = ("name", "model", "status", "tokens", "attempts", "time")
+        self.requests_view = ttk.Treeview(self.tab4, columns=columns, show="headings")
+        for column, heading, width in (
+            ("name", "Request", 300),
+            ("model", "Model", 150),
+            ("status", "Status", 100),
+            ("tokens", "Tokens", 150),
+            ("attempts", "Attempts", 80),
+            ("time", "Time", 80),
+        ):
+            self.requests_view.heading(column, text=heading)
+            self.requests_view.column(column, width=width)
+        requests_scrollbar = Scrollbar(self.tab4, command=self.requests_view.yview)
+        requests_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.requests_view.config(yscrollcommand=requests_scrollbar.set)
+        self.requests_view.pack(fill=tk.BOTH, expand=True)
+
+        # Measured performance per model, from the latest requests in the metrics file
+        stats_options_frame = tk.Frame(self.tab5)
+        stats_options_frame.pack(fill=tk.X)
+        tk.Button(
+            stats_options_frame, text="Export Requests CSV", command=lambda: self.export_metrics(REQUEST)
+        ).pack(side=tk.LEFT, padx=5, pady=5)
+        tk.Button(
+            stats_options_frame, text="Export File Loads CSV", command=lambda: self.export_metrics(INGEST)
+        ).pack(side=tk.LEFT, padx=5, pady=5)
+        tk.Button(stats_options_frame, text="Reset Stats", command=self.reset_stats).pack(
+            side=tk.LEFT, padx=5, pady=5
+        )
+        self.ingest_stats_var = tk.StringVar()
+        tk.Label(stats_options_frame, textvariable=self.ingest_stats_var).pack(side=tk.LEFT, padx=5)
+        stats_columns = (
+            ("model", "Model", 180),
+            ("requests", "Requests", 70),
+            ("failed", "Failed", 60),
+            ("cache_hit_rate", "Cache Hits", 80),
+            ("retries", "Retries", 60),
+            ("latency_p50", "Latency p50", 90),
+            ("latency_p95", "Latency p95", 90),
+            ("ttft_p50", "TTFT p50", 80),
+            ("ttft_p95", "TTFT p95", 80),
+            ("connect_p50", "Connect p50", 90),
+            ("tokens_per_second", "Tokens/s", 70),
+            ("prompt_tokens", "Prompt Tokens", 100),
+            ("completion_tokens", "Completion Tokens", 120),
+        )
+        self.stats_view = ttk.Treeview(
+            self.tab5, columns=[column for column, _, _ in stats_columns], show="headings"
+        )
+        for column, heading, width in stats_columns:
+            self.stats_view.heading(column, text=heading)
+            self.stats_view.column(column, width=width)
+        self.stats_view.pack(fill=tk.BOTH, expand=True)
+
     def initialize_openai_api(self):
-        """Initialize the OpenAI API with the loaded API key and update the model dropdown."""
-        if self.api_key_loaded:
-            openai.api_key = self.api_key_loaded
+        """Initialize the OpenAI API with the loaded API key and update the model dropdown.
+
+        Falls back to OPENAI_API_KEY when no key was saved in the application.
+        """
+        import openai
+
+        api_key = self.api_key_loaded or os.environ.get("OPENAI_API_KEY", "")
+        if api_key:
+            openai.api_key = api_key
             self.update_model_dropdown()
         else:
-            self.add_debug_log("API Key is missing or could not be loaded.")
+            self.add_debug_log("API Key is missing or could not be loaded.", logging.WARNING)
 
     def handle_save_api_key_button_click(self):
         """Handle the click event for the Save API Key button."""
+        import openai
+
         api_key = self.api_key_entry.get()
         self.save_api_key(api_key)
         openai.api_key = api_key  # Set the API key for immediate use
@@ -257,35 +630,185 @@ class Application(tk.Tk):
         self.end_text_field.delete("1.0", tk.END)
 
     def empty_responses(self):
-        """Clear the GPT response field."""
-        self.gpt_response_field.delete("1.0", tk.END)
+        """Clear the GPT response field and the session's response list."""
+        # Responses still in flight are only saved to their files from now on
+        self._clear_response_field()
+        self._response_jobs = []
+        self._viewing_job = None
+        self.response_list.delete(*self.response_list.get_children())
 
     def update_start_text_token_count(self, event=None):
         """Update the token count for the start text field."""
-        text = self.start_text_field.get("1.0", tk.END).strip()
-        token_count = self.num_tokens_from_messages([{"content": text}])
-        self.start_text_token_count_var.set(str(token_count))
+        self._schedule_token_count("start")
 
     def update_final_prompt_token_count(self, event=None):
         """Update the token count for the final prompt field."""
-        text = self.final_prompt.get("1.0", tk.END).strip()
-        token_count = self.num_tokens_from_messages([{"content": text}])
-        self.final_prompt_token_count_var.set(str(token_count))
+        self._schedule_token_count("final")
 
     def update_end_text_token_count(self, event=None):
         """Update the token count for the end text field."""
-        text = self.end_text_field.get("1.0", tk.END).strip()
-        token_count = self.num_tokens_from_messages([{"content": text}])
-        self.end_text_token_count_var.set(str(token_count))
+        self._schedule_token_count("end")
+
+    def _schedule_token_count(self, field_name):
+        """Debounce token counting so a burst of keystrokes triggers a single recount."""
+        job = self._token_count_jobs.pop(field_name, None)
+        if job is not None:
+            self.after_cancel(job)
+        self._token_count_jobs[field_name] = self.after(
+            TOKEN_COUNT_DEBOUNCE_MS, self._refresh_token_count, field_name
+        )
+
+    def _refresh_token_count(self, field_name, refresh_budget=True):
+        """Recount the tokens of a text field, re-encoding only the changed lines.
+
+        The middle part field is not counted while files are loaded, the files
+        are sent instead of its text.
+        """
+        self._token_count_jobs.pop(field_name, None)
+        if field_name == "final" and self.cs_file_contents:
+            return
+        widget, count_var = {
+            "start": (self.start_text_field, self.start_text_token_count_var),
+            "final": (self.final_prompt, self.final_prompt_token_count_var),
+            "end": (self.end_text_field, self.end_text_token_count_var),
+        }[field_name]
+        text = widget.get("1.0", tk.END).strip()
+        token_count = self.token_counters[field_name].count(text)
+        count_var.set(str(token_count))
+        if refresh_budget:
+            self._refresh_budget()
+
+    def _create_token_counters(self, model_name):
+        """Count the message parts with a model's encoding from now on."""
+        self.token_counters = {name: IncrementalTokenCounter(model_name) for name in ("start", "final", "end")}
+
+    def _recount_prompt(self):
+        """Count every message part for the selected model and show the prompt's budget."""
+        model_name = self.model_var.get()
+        if self.token_counters["start"].model != model_name:
+            self._create_token_counters(model_name)
+        for field_name in self.token_counters:
+            self._refresh_token_count(field_name, refresh_budget=False)
+        if self.cs_file_contents and self.cs_file_encoding != get_encoding(model_name).name:
+            self._recount_sections(model_name)
+        self._refresh_budget()
+
+    def _recount_sections(self, model_name):
+        """Count the loaded files with a model's encoding on a worker thread."""
+        load_id = self._load_id
+        sections = self.cs_file_contents
+        self.cs_file_text_tokens = self._middle_text_tokens = None
+
+        def recount():
+            encoding = get_encoding(model_name)
+            section_tokens = section_text_tokens(model_name, sections)
+            self.ui_events.post("section_tokens", load_id, (encoding.name, section_tokens))
+
+        threading.Thread(target=recount, name="section-count", daemon=True).start()
+
+    def _show_section_tokens(self, load_id, result):
+        """Take over the loaded files' token counts for the selected model's encoding."""
+        encoding_name, section_tokens = result
+        if load_id != self._load_id or encoding_name != get_encoding(self.model_var.get()).name:
+            return
+        self.cs_file_encoding = encoding_name
+        self.cs_file_tokens = [tokens.tokens for tokens in section_tokens]
+        self.cs_file_text_tokens = section_tokens
+        self._middle_text_tokens = join_text_tokens(get_encoding(self.model_var.get()), section_tokens)
+        self.final_prompt_token_count_var.set(str(self._middle_text_tokens.tokens))
+        self._refresh_budget()
+
+    def _refresh_budget(self):
+        """Recompute the prompt's exact token budget for the selected model and redraw the budget bar."""
+        if not self.startup_complete:
+            return
+        model_name = self.model_var.get()
+        if self.cs_file_contents:
+            if self._middle_text_tokens is None:
+                self.prompt_token_count_var.set("counting...")
+                return
+            middle_parts = list(zip(self.cs_file_names, self.cs_file_text_tokens))
+            middle = self._middle_text_tokens
+        else:
+            middle_parts = [("Middle part", self.token_counters["final"].text_tokens())]
+            middle = None
+        budget = build_budget(
+            model_name,
+            self.token_counters["start"].text_tokens(),
+            middle_parts,
+            self.token_counters["end"].text_tokens(),
+            middle,
+        )
+        if budget.fits:
+            self.prompt_token_count_var.set(
+                f"{budget.prompt_tokens} of {budget.context_window} tokens, "
+                f"{budget.completion_tokens} left for the completion"
+            )
+        else:
+            self.prompt_token_count_var.set(
+                f"{budget.prompt_tokens} of {budget.context_window} tokens, "
+                f"{budget.prompt_tokens - budget.context_window + 1} over the limit"
+            )
+        self._draw_budget_bar(budget)
+
+    def _draw_budget_bar(self, budget):
+        """Draw the context window as a bar split into the prompt parts, the completion and the free tokens.
+
+        Files too narrow to see are drawn together as one segment.
+        """
+        bar = self.budget_bar
+        bar.delete("all")
+        width = bar.winfo_width()
+        scale = width / max(budget.context_window, budget.prompt_tokens + 1)
+
+        segments = [
+            ("Chat framing", max(budget.frame_tokens, 0), BUDGET_COLORS["frame"]),
+            ("Start message", budget.start_tokens, BUDGET_COLORS["start"]),
+        ]
+        group_names, group_tokens, file_segments = [], 0, 0
+        for number, (name, tokens) in enumerate(budget.middle_tokens):
+            group_names.append(name)
+            group_tokens += tokens
+            if group_tokens * scale >= BUDGET_MIN_SEGMENT_PX or number == len(budget.middle_tokens) - 1:
+                description = group_names[0] if len(group_names) == 1 else f"{len(group_names)} files from {group_names[0]}"
+                segments.append((description, group_tokens, BUDGET_COLORS["file"][file_segments % 2]))
+                group_names, group_tokens = [], 0
+                file_segments += 1
+        segments.append(("End message", budget.end_tokens, BUDGET_COLORS["end"]))
+        segments.append(("Reserved for the completion", budget.completion_tokens, BUDGET_COLORS["completion"]))
+        segments.append(("Free", budget.free_tokens, BUDGET_COLORS["free"]))
+
+        self._budget_segments = []
+        x = 0.0
+        for description, tokens, color in segments:
+            x_end = x + tokens * scale
+            bar.create_rectangle(x, 0, x_end, BUDGET_BAR_HEIGHT, fill=color, width=0)
+            self._budget_segments.append((x, x_end, f"{description}: {tokens} tokens"))
+            x = x_end
+        if not budget.fits:
+            # Everything right of the model's context window does not fit
+            bar.create_rectangle(
+                budget.context_window * scale, 0, width, BUDGET_BAR_HEIGHT, outline=BUDGET_COLORS["over"], width=2
+            )
+
+    def _show_budget_segment(self, event):
+        """Name the budget bar segment under the mouse pointer."""
+        for x_start, x_end, description in self._budget_segments:
+            if x_start <= event.x < x_end:
+                self.budget_detail_var.set(description)
+                return
+        self.budget_detail_var.set("")
 
     def on_model_change(self, event=None):
         """Handle the event when the model is changed in the dropdown."""
         if self.use_max_tokens_var.get():
             self.use_max_tokens()
+        if self.startup_complete:
+            self._recount_prompt()
 
     def use_max_tokens(self):
         """Set the max tokens value based on the selected model."""
-        model_max_tokens = MODEL_MAX_TOKENS.get(self.model_var.get(), MAX_TOKEN_LIMIT)
+        model_max_tokens = core.get_model_max_tokens(self.model_var.get())
         self.max_tokens_var.set(model_max_tokens)
         self.max_tokens_entry.config(
             state="disabled" if self.use_max_tokens_var.get() else "normal"
@@ -293,15 +816,47 @@ class Application(tk.Tk):
 
     def reset_debug_logs(self):
         """Clear all debug logs."""
-        self.debug_logs.clear()
+        self.debug_log.clear()
         self.debug_log_field.delete("1.0", tk.END)
 
+    def toggle_log_file(self):
+        """Start or stop writing the debug log to a rotating file in the Logs directory."""
+        path = os.path.join(LOG_DIR, "debug.log") if self.log_file_var.get() else None
+        self.debug_log.set_file_sink(path)
+        if path:
+            self.add_debug_log(f"Writing debug log to {path}.")
+
+    def render_debug_logs(self, event=None):
+        """Show the buffered debug log entries at or above the selected level."""
+        self.debug_log.drain()
+        min_level = LEVELS[self.debug_level_var.get()]
+        lines = [entry.format() for entry in self.debug_log.entries(min_level)]
+        self.debug_log_field.delete("1.0", tk.END)
+        self.debug_log_field.insert(tk.END, "".join(f"{line}\n" for line in lines[-MAX_DEBUG_LOG_LINES:]))
+        self.debug_log_field.see(tk.END)
+
+    def _flush_debug_log(self):
+        """Append the entries logged since the last flush to the debug log field."""
+        min_level = LEVELS[self.debug_level_var.get()]
+        lines = [entry.format() for entry in self.debug_log.drain() if entry.level >= min_level]
+        if not lines:
+            return
+        at_bottom = self.debug_log_field.yview()[1] >= 1.0
+        self.debug_log_field.insert(tk.END, "".join(f"{line}\n" for line in lines))
+        line_count = int(self.debug_log_field.index("end-1c").split(".")[0])
+        if line_count > MAX_DEBUG_LOG_LINES:
+            self.debug_log_field.delete("1.0", f"{line_count - MAX_DEBUG_LOG_LINES + 1}.0")
+        if at_bottom:
+            self.debug_log_field.see(tk.END)
+
     def load_or_generate_key(self):
         """Load the encryption key from file or generate a new one if not found."""
         try:
             with open("encryption_key.key", "rb") as f:
                 return f.read()
         except FileNotFoundError:
+            from cryptography.fernet import Fernet
+
             key = Fernet.generate_key()
             with open("encryption_key.key", "wb") as f:
                 f.write(key)
@@ -309,6 +864,8 @@ class Application(tk.Tk):
 
     def decrypt_key(self, key, encrypted_api_key):
         """Decrypt the API key using the encryption key."""
+        from cryptography.fernet import Fernet, InvalidToken
+
         cipher_suite = Fernet(key)
         try:
             return cipher_suite.decrypt(encrypted_api_key).decode()
@@ -326,60 +883,105 @@ class Application(tk.Tk):
 
     def get_available_models(self):
         """Fetch available models from OpenAI API."""
+        import openai
+
         if not openai.api_key:
-            self.add_debug_log("No API key set. Unable to fetch models.")
+            self.add_debug_log("No API key set. Unable to fetch models.", logging.WARNING)
             return []
         
         try:
-            response = openai.Model.list()
-            allowed_models = set(MODEL_MAX_TOKENS.keys())
-            models = [model["id"] for model in response["data"] if model["id"] in allowed_models]
-            models.sort()
-            return models
+            return core.list_models()
         except openai.error.AuthenticationError:
-            self.add_debug_log("Invalid API key. Unable to fetch models.")
+            self.add_debug_log("Invalid API key. Unable to fetch models.", logging.ERROR)
             return []
         except Exception as e:
-            self.add_debug_log(f"Error fetching models: {str(e)}")
+            self.add_debug_log(f"Error fetching models: {str(e)}", logging.ERROR)
             return []
 
     def update_model_dropdown(self):
-        """Update the model dropdown with the latest available models."""
-        try:
-            available_models = self.get_available_models()
-            if available_models:
-                self.model_dropdown['values'] = available_models
-                self.model_var.set(available_models[0])  # Set the first model as default
-                self.add_debug_log("Model dropdown updated successfully.")
-            else:
-                self.add_debug_log("No models available.")
-        except Exception as e:
-            self.add_debug_log(f"Error updating model dropdown: {str(e)}")
+        """Fill the model dropdown from the cached model list, refreshing it in the background when stale."""
+        import openai
+
+        models, fresh = load_cached_models(account_fingerprint(openai.api_key, openai.api_base))
+        if models:
+            self._set_available_models(models)
+            self.add_debug_log("Model dropdown filled from the cached model list.")
+        if not fresh:
+            self.refresh_models()
+
+    def refresh_models(self):
+        """Fetch the model list on a worker thread, the dropdown is updated when it arrives."""
+        import openai
+
+        if not openai.api_key:
+            self.add_debug_log("No API key set. Unable to fetch models.", logging.WARNING)
+            return
+        if self._models_refreshing:
+            return
+        self._models_refreshing = True
+        account = account_fingerprint(openai.api_key, openai.api_base)
+
+        def fetch():
+            models = self.get_available_models()
+            if models:
+                try:
+                    save_cached_models(account, models)
+                except OSError as e:
+                    self.add_debug_log(f"Error caching the model list: {e}", logging.WARNING)
+            self.ui_events.post("models", account, models)
+
+        threading.Thread(target=fetch, name="model-list", daemon=True).start()
+
+    def _show_models(self, account, models):
+        """Apply a fetched model list unless the API key changed while it was fetched."""
+        import openai
+
+        self._models_refreshing = False
+        if account != account_fingerprint(openai.api_key, openai.api_base):
+            self.refresh_models()
+            return
+        if models:
+            self._set_available_models(models)
+            self.add_debug_log("Model dropdown updated successfully.")
+        else:
+            self.add_debug_log("No models available.", logging.WARNING)
+
+    def _set_available_models(self, models):
+        """Offer the models in the dropdown, keeping the selected model if it is still available."""
+        self.available_models = models
+        self.model_dropdown['values'] = models
+        if self.model_var.get() not in models:
+            self.model_var.set(models[0])
+            self.on_model_change()
+        self.fanout_models_menu.delete(0, tk.END)
+        for model_name in models:
+            variable = self.fanout_model_vars.setdefault(model_name, tk.BooleanVar(value=False))
+            self.fanout_models_menu.add_checkbutton(label=model_name, variable=variable)
 
     def is_chat_model(self, model_name):
         """Determine if the given model is a chat model."""
-        chat_models = [
-            "gpt-3.5-turbo", "gpt-3.5-turbo-0613", "gpt-3.5-turbo-1106", 
-            "gpt-3.5-turbo-16k", "gpt-3.5-turbo-instruct", "gpt-3.5-turbo-16k-0613",
-            "gpt-4", "gpt-4-0613", "gpt-4-0314"
-        ]
-        return model_name in chat_models
+        return get_model(model_name).chat
 
-    def add_debug_log(self, message):
-        """Add a message to the debug log and update the debug log field."""
-        self.debug_logs.append(message)
-        self.debug_log_field.delete("1.0", tk.END)
-        for log in self.debug_logs:
-            self.debug_log_field.insert(tk.END, f"{log}\n")
-        self.debug_log_field.insert(tk.END, "-----\n")
+    def add_debug_log(self, message, level=logging.INFO):
+        """Add a message to the debug log, the field is updated from the UI queue loop.
+
+        Safe to call from worker threads.
+        """
+        self.debug_log.log(message, level)
 
     def encrypt_key(self, key, api_key):
         """Encrypt the API key using the encryption key."""
+        from cryptography.fernet import Fernet
+
         cipher_suite = Fernet(key)
         return cipher_suite.encrypt(api_key.encode())
 
     def save_api_key(self, api_key):
         """Save the encrypted API key to file."""
+        import openai
+
+        if self.encryption_key is None:
+            self.encryption_key = self.load_or_generate_key()
         encrypted_api_key = self.encrypt_key(self.encryption_key, api_key)
         file_path = os.path.join(os.path.dirname(__file__), "api_key.txt")
         with open(file_path, "wb") as f:
@@ -390,52 +992,162 @@ class Application(tk.Tk):
     def load_standard_messages(self):
         """Load standard start and end messages from files in the active_templates directory."""
         try:
-            dir_path = os.path.dirname(os.path.realpath(__file__))
-            templates_dir = os.path.join(dir_path, "active_templates")
-            
-            with open(os.path.join(templates_dir, "start_message.txt"), "r", encoding="utf-8") as f:
-                start_message = f.read()
+            start_message, end_message = core.load_templates()
             self.start_text_field.delete("1.0", tk.END)
             self.start_text_field.insert(tk.END, start_message)
     
-            with open(os.path.join(templates_dir, "end_message.txt"), "r", encoding="utf-8") as f:
-                end_message = f.read()
             self.end_text_field.delete("1.0", tk.END)
             self.end_text_field.insert(tk.END, end_message)
     
             self.add_debug_log("Standard Start/End messages loaded from active_templates directory.")
     
         except FileNotFoundError as e:
-            self.add_debug_log(f"Error loading standard messages from active_templates: {e}")
+            self.add_debug_log(f"Error loading standard messages from active_templates: {e}", logging.ERROR)
         except Exception as e:
-            self.add_debug_log(f"Unexpected error loading standard messages: {e}")
+            self.add_debug_log(f"Unexpected error loading standard messages: {e}", logging.ERROR)
 
     def read_cs_files(self, filenames):
-        """Read selected C# files and update the final prompt field."""
-        self.cs_file_contents = []
-        self.final_prompt.delete("1.0", tk.END)
-        for filename in filenames:
-            with open(filename, "r", encoding="utf-8") as f:
-                file_content = f.read()
-            self.cs_file_contents.append(
-                f"--- {os.path.basename(filename)} ---\n{file_content}"
+        """Read the given source files in the background and update the final prompt field."""
+        filenames = list(filenames)
+        self._start_file_load(lambda: filenames)
+
+    def reload_files(self):
+        """Load the current files again, e.g. with other reduction steps."""
+        if self.cs_file_paths:
+            self.read_cs_files(self.cs_file_paths)
+
+    def open_file_explorer(self):
+        """Select a folder and load the source files matching the include and exclude globs."""
+        directory = filedialog.askdirectory()
+        if not directory:
+            return
+        include = split_patterns(self.include_var.get()) or list(DEFAULT_INCLUDE)
+        exclude = split_patterns(self.exclude_var.get())
+        self._start_file_load(lambda: find_source_files(directory, include, exclude))
+
+    def _start_file_load(self, list_files):
+        """Find, read and token count files on a worker thread, reporting through UI events.
+
+        Results of a load are dropped if another load was started in the meantime.
+        """
+        self._load_id += 1
+        load_id = self._load_id
+        self.load_status_var.set("Searching files...")
+        reduction = ReductionPipeline([step for step, var in self.reduction_vars.items() if var.get()])
+        model_name = self.model_var.get()
+
+        def load():
+            started = time.perf_counter()
+            try:
+                encoding = get_encoding(model_name)
+                files, errors = load_source_files(
+                    list_files(),
+                    on_progress=lambda done, total: self.ui_events.post("load_progress", load_id, (done, total)),
+                    index=self.token_index,
+                    reduction=reduction,
+                    encoding=encoding,
+                )
+            except Exception as e:
+                self.ui_events.post("load_failed", load_id, e)
+                return
+            self.telemetry.record(
+                INGEST,
+                files=len(files),
+                errors=len(errors),
+                bytes=sum(len(source_file.section) for source_file in files),
+                tokens=sum(source_file.tokens for source_file in files),
+                saved_tokens=sum(source_file.original_tokens - source_file.tokens for source_file in files),
+                seconds=time.perf_counter() - started,
             )
-            self.final_prompt.insert(
-                tk.END, f"--- {os.path.basename(filename)} ---\n{file_content}\n"
+            section_tokens = section_text_tokens(
+                model_name,
+                [source_file.section for source_file in files],
+                [source_file.tokens for source_file in files],
             )
+            self.ui_events.post("load_done", load_id, (files, errors, encoding.name, section_tokens))
 
-        self.add_debug_log("Selected and read .cs files.")
+        threading.Thread(target=load, name="file-load", daemon=True).start()
 
-    def open_file_explorer(self):
-        """Open file explorer to select C# files."""
-        filenames = filedialog.askopenfilenames(filetypes=[("C# files", "*.cs")])
-        self.read_cs_files(filenames)
+    def _show_load_progress(self, load_id, progress):
+        """Show how many files of a background load are done."""
+        if load_id == self._load_id:
+            done, total = progress
+            self.load_status_var.set(f"Loading files: {done}/{total}")
+
+    def _show_load_failed(self, load_id, error):
+        """Report a background file load that failed as a whole."""
+        if load_id == self._load_id:
+            self.load_status_var.set("Loading files failed.")
+            self.add_debug_log(f"Error loading source files: {error}", logging.ERROR)
+
+    def _show_loaded_files(self, load_id, result):
+        """Store loaded files and fill the middle part, previewing it if the sources are large."""
+        if load_id != self._load_id:
+            return
+        files, errors, encoding_name, section_tokens = result
+        for path, error in errors:
+            self.add_debug_log(f"Error reading {path}: {error}", logging.ERROR)
+        self.cs_file_contents = [source_file.section for source_file in files]
+        self.cs_file_names = [source_file.name for source_file in files]
+        self.cs_file_tokens = [source_file.tokens for source_file in files]
+        self.cs_file_paths = [source_file.path for source_file in files]
+        self.cs_file_encoding = encoding_name
+        self.cs_file_text_tokens = self._middle_text_tokens = None
+        self._show_section_tokens(load_id, (encoding_name, section_tokens))
+        if self._middle_text_tokens is None:
+            # The model was changed to another encoding during the load
+            self._recount_sections(self.model_var.get())
+            total_tokens = sum(self.cs_file_tokens)
+        else:
+            total_tokens = self._middle_text_tokens.tokens
+        saved_tokens = sum(source_file.original_tokens - source_file.tokens for source_file in files)
+        for source_file in files:
+            if source_file.tokens < source_file.original_tokens:
+                self.add_debug_log(
+                    f"Reduced {source_file.name}: {source_file.original_tokens} -> {source_file.tokens} tokens.",
+                    logging.DEBUG,
+                )
+
+        total_chars = sum(len(section) for section in self.cs_file_contents)
+        if total_chars <= FULL_MIDDLE_TEXT_LIMIT:
+            texts = [f"{section}\n" for section in self.cs_file_contents]
+        else:
+            # The full text is sent from cs_file_contents, the field only shows the start of each file
+            texts = []
+            for source_file in files:
+                lines = source_file.section.split("\n", PREVIEW_LINES_PER_FILE + 1)
+                preview = "\n".join(lines[:PREVIEW_LINES_PER_FILE + 1])
+                more = "\n[...]" if len(lines) > PREVIEW_LINES_PER_FILE + 1 else ""
+                texts.append(f"{preview}{more}\n[{source_file.tokens} tokens]\n")
+            self.add_debug_log("Sources too large to display, the middle part only shows a preview of each file.")
+
+        self.final_prompt.delete("1.0", tk.END)
+        self.token_counters["final"].reset()
+        self.final_prompt_token_count_var.set(str(total_tokens))
+        self._insert_middle_text(load_id, texts, 0)
+
+        saved = f", {saved_tokens} saved" if saved_tokens else ""
+        self.load_status_var.set(f"{len(files)} files, {total_tokens} tokens{saved}")
+        self.add_debug_log(f"Selected and read {len(files)} files ({total_tokens} tokens{saved}).")
+
+    def _insert_middle_text(self, load_id, texts, index):
+        """Insert texts into the middle part in batches so the window stays responsive."""
+        if load_id != self._load_id:
+            return
+        batch, size = [], 0
+        while index < len(texts) and size < INSERT_BATCH_CHARS:
+            batch.append(texts[index])
+            size += len(texts[index])
+            index += 1
+        self.final_prompt.insert(tk.END, "".join(batch))
+        if index < len(texts):
+            self.after(1, self._insert_middle_text, load_id, texts, index)
 
     def save_prompt(self):
         """Save the current prompt to a file."""
         start_text = self.start_text_field.get("1.0", tk.END).strip()
         end_text = self.end_text_field.get("1.0", tk.END).strip()
-        final_prompt = f"{start_text}\n{''.join(self.cs_file_contents)}\n{end_text}"
+        final_prompt = core.build_prompt(start_text, "".join(self.cs_file_contents), end_text)
 
         filename = filedialog.asksaveasfilename(
             defaultextension=".txt",
@@ -451,122 +1163,799 @@ class Application(tk.Tk):
 
     def num_tokens_from_messages(self, messages, model="gpt-3.5-turbo-0613"):
         """Calculate the number of tokens in a list of messages."""
-        try:
-            encoding = tiktoken.encoding_for_model(model)
-        except KeyError:
-            encoding = tiktoken.get_encoding("cl100k_base")
+        return num_tokens_from_messages(messages, model)
 
-        num_tokens = 0
-        for message in messages:
-            num_tokens += 4  # Approximate overhead for each message
-            for key, value in message.items():
-                num_tokens += len(encoding.encode(value))
-                if key == "name":
-                    num_tokens -= 1  # Adjustment if "name" key exists
-        num_tokens += 2  # Approximate overhead for start and end of messages
+    def threaded_send_prompt(self):
+        """Queue the current prompt to be sent to GPT on a worker thread."""
+        if self.fanout_mode_var.get() != FANOUT_OFF:
+            self.send_fanout()
+            return
+        if self.cs_file_contents and self.changes_only_var.get():
+            self.send_changed_files()
+            return
+        if self.cs_file_contents:
+            self._send_loaded_files()
+            return
+        self.send_prompt_to_gpt([("Merged prompt", self.final_prompt.get("1.0", tk.END).strip())])
+
+    def _send_loaded_files(self):
+        """Queue the merge of the loaded files, chunked if enabled, and return its jobs."""
+        if self.auto_chunk_var.get():
+            return self.send_chunked_prompt()
+        return self.send_prompt_to_gpt(
+            [("Merged prompt", "".join(self.cs_file_contents))],
+            token_estimates=[self._estimate_prompt_tokens(self.cs_file_tokens)],
+            sources=[self.cs_file_paths],
+        )
+
+    def send_changed_files(self):
+        """Queue the diffs of the files changed since the last response instead of the whole merge.
+
+        Without a previous response for the folder the full merge is sent. Once
+        the request is done its files and response become the snapshot the next
+        send is diffed against.
+        """
+        root = session_root(self.cs_file_paths)
+        sections = {os.path.abspath(path): section for path, section in zip(self.cs_file_paths, self.cs_file_contents)}
+        snapshot = load_snapshot(root)
+        middle_text = build_changes_text(root, snapshot, sections) if snapshot else None
+        if snapshot and middle_text is None:
+            messagebox.showinfo("GPT Request", "No files changed since the last response.")
+            return
+        if middle_text is not None:
+            start_text = self.start_text_field.get("1.0", tk.END).strip()
+            end_text = self.end_text_field.get("1.0", tk.END).strip()
+            model_name = self.model_var.get()
+            prompt_tokens = core.count_prompt_tokens(core.build_prompt(start_text, middle_text, end_text), model_name)
+            full_estimate = self._estimate_prompt_tokens(self.cs_file_tokens)
+            if full_estimate is None:
+                full_tokens = core.count_prompt_tokens(
+                    core.build_prompt(start_text, "".join(self.cs_file_contents), end_text), model_name
+                )
+            else:
+                full_tokens = full_estimate[0]
+            if prompt_tokens >= full_tokens:
+                self.add_debug_log(f"Changes need {prompt_tokens} prompt tokens, sending the full merge instead.")
+                middle_text = None
+
+        if middle_text is None:
+            if snapshot is None:
+                self.add_debug_log(f"No previous response for {root}, sending the full merge.")
+            self.resend_savings_var.set("")
+            jobs = self._send_loaded_files()
+        else:
+            saved_tokens = full_tokens - prompt_tokens
+            self.resend_savings_var.set(
+                f"Changes only: {prompt_tokens} tokens, {saved_tokens} saved "
+                f"({saved_tokens / full_tokens:.0%} of a full resend)"
+            )
+            self.add_debug_log(
+                f"Sending changes only: {prompt_tokens} instead of {full_tokens} prompt tokens."
+            )
+            jobs = self.send_prompt_to_gpt(
+                [("Changes since last response", middle_text)],
+                token_estimates=[(prompt_tokens, 0)],
+                sources=[self.cs_file_paths],
+            )
 
-        return num_tokens
+        # A merge split into several prompts has no single response to diff against later
+        if len(jobs) == 1:
+            self._pending_snapshots[jobs[0].job_id] = (root, sections)
 
-    def threaded_send_prompt(self):
-        """Start a new thread to send the prompt to GPT."""
-        if self.is_request_in_progress:
-            messagebox.showinfo(
-                "GPT Request", "Another request is already in progress."
+    def send_fanout(self):
+        """Send the merge, or the prompt as is, to every model checked for fan-out.
+
+        The prompt is counted once and models whose limit it exceeds are
+        skipped. In first-wins mode the other requests are cancelled once one
+        model answered, in compare-all mode the answers are shown side by side.
+        """
+        models = [
+            model_name for model_name in self.available_models
+            if self.fanout_model_vars.get(model_name) and self.fanout_model_vars[model_name].get()
+        ]
+        if len(models) < 2:
+            messagebox.showinfo("GPT Request", "Check at least two models under Models to Compare.")
+            return
+        if self.cs_file_contents:
+            middle_text = "".join(self.cs_file_contents)
+            sources = [self.cs_file_paths]
+        else:
+            middle_text = self.final_prompt.get("1.0", tk.END).strip()
+            sources = None
+        start_text = self.start_text_field.get("1.0", tk.END).strip()
+        end_text = self.end_text_field.get("1.0", tk.END).strip()
+        prompt_tokens = fanout.count_prompt_tokens(core.build_prompt(start_text, middle_text, end_text), models)
+
+        models, skipped = fanout.split_models_by_budget(prompt_tokens, models)
+        for model_name, model_tokens, limit in skipped:
+            self.add_debug_log(
+                f"Skipping {model_name}: the prompt has {model_tokens} tokens, the model's limit is {limit}.",
+                logging.WARNING,
             )
+        if not models:
+            messagebox.showerror("Error", "The prompt has more tokens than any checked model allows.")
             return
 
-        self.is_request_in_progress = True
-        self.send_button.config(state="disabled")
-        threading.Thread(target=self.send_prompt_to_gpt, daemon=True).start()
+        first_wins = self.fanout_mode_var.get() == FANOUT_MODES[fanout.FIRST_WINS]
+        jobs = self.send_prompt_to_gpt(
+            [("Merged prompt", middle_text)],
+            token_estimates=[{model_name: (prompt_tokens[model_name], 0) for model_name in models}],
+            sources=sources,
+            models=models,
+            first_wins=first_wins,
+        )
+        if jobs and not first_wins:
+            self._open_comparison(jobs)
+
+    def _open_comparison(self, jobs):
+        """Open a window showing the answers of a compare-all send side by side as they finish."""
+        window = tk.Toplevel(self)
+        window.title(f"Compare {len(jobs)} Models")
+        for job in jobs:
+            pane = tk.LabelFrame(window, text=job.model_name)
+            pane.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=5, pady=5)
+            summary_var = tk.StringVar(value="Waiting for the answer...")
+            tk.Label(pane, textvariable=summary_var, anchor="w", justify=tk.LEFT).pack(fill=tk.X)
+            text = tk.Text(pane, wrap=tk.WORD, width=50, height=30)
+            text.pack(fill=tk.BOTH, expand=True)
+            self._comparison_panes[job.job_id] = (summary_var, text)
+
+        def forget_panes():
+            for job in jobs:
+                self._comparison_panes.pop(job.job_id, None)
+            window.destroy()
+
+        window.protocol("WM_DELETE_WINDOW", forget_panes)
+
+    def _show_comparison_result(self, job):
+        """Fill a finished job's pane in its comparison window."""
+        pane = self._comparison_panes.pop(job.job_id, None)
+        if pane is None:
+            return
+        summary_var, text = pane
+        summary_var.set(fanout.format_job_summary(job))
+        if job.status == dispatcher.DONE:
+            text.insert(tk.END, job.result or "")
+
+    def _section_tokens(self, model_name):
+        """Return the loaded files' token counts if they were counted with the model's encoding, else None."""
+        if self.cs_file_encoding != get_encoding(model_name).name:
+            return None
+        return self.cs_file_tokens
+
+    def _estimate_prompt_tokens(self, section_tokens):
+        """Estimate the prompt tokens around loaded sections from their indexed token counts.
+
+        Returns None while the files' counts are for another model's encoding,
+        the prompt is then counted when it is sent.
+        """
+        model_name = self.model_var.get()
+        if self._section_tokens(model_name) is None:
+            return None
+        start_text = self.start_text_field.get("1.0", tk.END).strip()
+        end_text = self.end_text_field.get("1.0", tk.END).strip()
+        return estimate_prompt_tokens(start_text, end_text, section_tokens, model_name)
 
-    def send_prompt_to_gpt(self):
-        """Send the constructed prompt to GPT and handle the response."""
-        if self.debug_var.get():
-            self.add_debug_log("Debug mode is enabled. Prompt will not be sent to GPT.")
-            start_text = self.start_text_field.get("1.0", tk.END).strip()
-            middle_text = ("".join(self.cs_file_contents) if self.cs_file_contents else self.final_prompt.get("1.0", tk.END).strip())
-            end_text = self.end_text_field.get("1.0", tk.END).strip()
-            final_prompt = f"{start_text}\n{middle_text}\n{end_text}"
-            self.add_debug_log("Debug Prompt Content:")
-            self.add_debug_log(final_prompt)
-            self.is_request_in_progress = False
-            self.send_button.config(state="normal")
+    def send_prompt_per_file(self):
+        """Queue one prompt per loaded file, each between the start and end messages."""
+        if not self.cs_file_contents:
+            messagebox.showinfo("GPT Request", "No files loaded.")
             return
+        self.send_prompt_to_gpt(
+            list(zip(self.cs_file_names, self.cs_file_contents)),
+            token_estimates=[self._estimate_prompt_tokens([tokens]) for tokens in self.cs_file_tokens],
+            sources=[[path] for path in self.cs_file_paths],
+        )
 
+    def send_chunked_prompt(self):
+        """Split the loaded files into prompts that fit the model's limit and queue them."""
+        start_text = self.start_text_field.get("1.0", tk.END).strip()
+        end_text = self.end_text_field.get("1.0", tk.END).strip()
+        model_name = self.model_var.get()
         try:
-            self.progress["value"] = 0
-            self.update_idletasks()
+            chunks = pack_chunks(
+                start_text, end_text, self.cs_file_contents, model_name, section_tokens=self._section_tokens(model_name)
+            )
+        except ChunkPlanError as e:
+            messagebox.showerror("Error", str(e))
+            self.add_debug_log(str(e), logging.ERROR)
+            return []
 
-            start_text = self.start_text_field.get("1.0", tk.END).strip()
-            middle_text = ("".join(self.cs_file_contents) if self.cs_file_contents else self.final_prompt.get("1.0", tk.END).strip())
-            end_text = self.end_text_field.get("1.0", tk.END).strip()
-            final_prompt = f"{start_text}\n{middle_text}\n{end_text}"
+        if len(chunks) == 1:
+            middle_text, token_estimate = chunks[0]
+            return self.send_prompt_to_gpt(
+                [("Merged prompt", middle_text)], token_estimates=[token_estimate], sources=[self.cs_file_paths]
+            )
 
-            total_prompt_tokens = self.num_tokens_from_messages([{"content": final_prompt}])
-            model_max_tokens = MODEL_MAX_TOKENS.get(self.model_var.get(), MAX_TOKEN_LIMIT)
-            max_tokens = min(model_max_tokens, 4096)  # Use the smaller of model max tokens or 4096 as a safeguard
+        merge_id = new_merge_id()
+        self.add_debug_log(
+            f"Merge exceeds the model's limit, split into {len(chunks)} prompts ({merge_id})."
+        )
+        return self.send_prompt_to_gpt(
+            [
+                (f"{merge_id} chunk {number}/{len(chunks)}", middle_text)
+                for number, (middle_text, _) in enumerate(chunks, start=1)
+            ],
+            merge_id=merge_id,
+            max_tokens=reserved_completion_tokens(model_name),
+            sequential=self.chunk_sequence_var.get(),
+            token_estimates=[token_estimate for _, token_estimate in chunks],
+            sources=[self.cs_file_paths] * len(chunks),
+        )
 
-            if total_prompt_tokens > model_max_tokens:
-                messagebox.showerror("Error", "Prompt token count exceeds the model's limit.")
-                self.add_debug_log("Prompt token count exceeds the model's limit.")
-                self.is_request_in_progress = False
-                return
+    def send_prompt_to_gpt(self, middle_parts, merge_id=None, max_tokens=None, sequential=False,
+                           token_estimates=None, sources=None, models=None, first_wins=False):
+        """Build a prompt for every (name, middle text) pair and queue it for each of models.
 
-            self.add_debug_log("Sending prompt to GPT...")
-            self.add_debug_log("Prompt Content:")
-            self.add_debug_log(final_prompt)
+        With first_wins set the first answer cancels the other requests. Returns the
+        queued jobs, none in debug mode.
+        """
+        start_text = self.start_text_field.get("1.0", tk.END).strip()
+        end_text = self.end_text_field.get("1.0", tk.END).strip()
+        prompts = [
+            (name, core.build_prompt(start_text, middle_text, end_text))
+            for name, middle_text in middle_parts
+        ]
 
-            response = openai.ChatCompletion.create(
-                model=self.model_var.get(),
-                messages=[{"role": "system", "content": final_prompt}],
-                max_tokens=max_tokens,
-            )
+        if self.debug_var.get():
+            self.add_debug_log("Debug mode is enabled. Prompt will not be sent to GPT.")
+            for _, final_prompt in prompts:
+                self.add_debug_log(f"Debug Prompt Content:\n{final_prompt}")
+            return []
 
+        if token_estimates is None:
+            token_estimates = [None] * len(prompts)
+        if sources is None:
+            sources = [()] * len(prompts)
+
+        jobs = []
+        for (name, final_prompt), token_estimate, part_sources in zip(prompts, token_estimates, sources):
+            for model_name in models or [self.model_var.get()]:
+                self.gpt_response_counter += 1
+                job = PromptJob(
+                    name,
+                    final_prompt,
+                    model_name,
+                    response_number=self.gpt_response_counter,
+                    stream=self.stream_var.get(),
+                    max_tokens=max_tokens,
+                    use_cache=self.use_cache_var.get(),
+                    merge_id=merge_id,
+                    token_estimate=token_estimate.get(model_name) if isinstance(token_estimate, dict) else token_estimate,
+                    sources=part_sources,
+                )
+                self._track_job(job)
+                self.add_debug_log(f"Sending prompt to GPT... (request {job.job_id}: {name})")
+                self.add_debug_log(f"Prompt Content:\n{final_prompt}", logging.DEBUG)
+                jobs.append(job)
+
+        if first_wins:
+            self.dispatcher.submit_first_wins(jobs)
+        elif sequential:
+            self.dispatcher.submit_sequence(jobs)
+        else:
+            for job in jobs:
+                self.dispatcher.submit(job)
+        return jobs
+
+    def _track_job(self, job):
+        """Show a job in the Requests tab until the application is closed."""
+        self.jobs[job.job_id] = job
+        self.requests_view.insert("", tk.END, iid=str(job.job_id))
+
+    def _unfinished_entries(self):
+        """Return the journaled requests that are not being sent right now."""
+        active = {
+            job.journal_id for job in self.jobs.values()
+            if job.status in (dispatcher.QUEUED, dispatcher.RUNNING, dispatcher.RETRYING)
+        }
+        return [entry for entry in self.journal.unfinished() if entry.entry_id not in active]
+
+    def offer_unfinished_requests(self):
+        """Offer to resume or resend the requests an earlier session left unfinished."""
+        if self.journal is None:
+            return
+        entries = self._unfinished_entries()
+        if entries:
+            self.add_debug_log(f"{len(entries)} requests did not finish in an earlier session.", logging.WARNING)
+            self.show_unfinished_requests(entries)
+
+    def show_unfinished_requests(self, entries=None):
+        """Open a window listing the unfinished requests to resume, resend or discard them."""
+        if self.journal is None:
+            messagebox.showinfo("Unfinished Requests", "The request journal is unavailable.")
+            return
+        if entries is None:
+            entries = self._unfinished_entries()
+        if not entries:
+            messagebox.showinfo("Unfinished Requests", "All requests finished.")
+            return
+        entries_by_id = {str(entry.entry_id): entry for entry in entries}
+
+        window = tk.Toplevel(self)
+        window.title("Unfinished Requests")
+        tk.Label(
+            window,
+            text="These requests did not finish. Resume continues the answer received so far, Resend starts over.",
+            anchor="w",
+        ).pack(fill=tk.X, padx=5, pady=5)
+        view = ttk.Treeview(window, columns=("name", "model", "status", "received", "updated"), show="headings")
+        for column, heading, width in (
+            ("name", "Request", 250),
+            ("model", "Model", 150),
+            ("status", "Status", 80),
+            ("received", "Received", 120),
+            ("updated", "Last Update", 140),
+        ):
+            view.heading(column, text=heading)
+            view.column(column, width=width)
+        for entry_id, entry in entries_by_id.items():
+            view.insert("", tk.END, iid=entry_id, values=(
+                entry.name,
+                entry.model_name,
+                entry.status,
+                f"{len(entry.partial)} characters",
+                datetime.fromtimestamp(entry.updated).strftime("%Y-%m-%d %H:%M:%S"),
+            ))
+        view.selection_set(view.get_children())
+        view.pack(fill=tk.BOTH, expand=True, padx=5)
+
+        def handle(resume):
+            selected = [entries_by_id[entry_id] for entry_id in view.selection()]
+            if not selected:
+                return
+            if resume is None:
+                if not messagebox.askokcancel(
+                    "Discard Requests", f"Remove {len(selected)} requests from the journal?", parent=window
+                ):
+                    return
+                for entry in selected:
+                    self.journal.discard(entry.entry_id)
+            else:
+                self.send_unfinished_requests(selected, resume)
+            view.delete(*[str(entry.entry_id) for entry in selected])
+            if not view.get_children():
+                window.destroy()
+
+        buttons_frame = tk.Frame(window)
+        buttons_frame.pack(fill=tk.X)
+        for text, resume in (("Resume", True), ("Resend", False), ("Discard", None)):
+            tk.Button(buttons_frame, text=text, command=lambda resume=resume: handle(resume)).pack(
+                side=tk.LEFT, padx=5, pady=5
+            )
+        tk.Button(buttons_frame, text="Close", command=window.destroy).pack(side=tk.RIGHT, padx=5, pady=5)
+
+    def send_unfinished_requests(self, entries, resume=True):
+        """Queue journaled requests again, continuing their partial answers with resume set."""
+        for entry in entries:
+            job = self.journal.restore_job(entry, resume=resume)
+            if job is None:
+                self.add_debug_log(f"Unfinished request {entry.entry_id} has no prompt, discarding it.", logging.WARNING)
+                self.journal.discard(entry.entry_id)
+                continue
             self.gpt_response_counter += 1
-            response_text = f"--- Response {self.gpt_response_counter} ---\n{response['choices'][0]['message']['content']}\n"
+            job.response_number = self.gpt_response_counter
+            self._track_job(job)
+            self.add_debug_log(
+                f"{'Resuming' if resume else 'Resending'} unfinished request {entry.entry_id}... "
+                f"(request {job.job_id}: {job.name})"
+            )
+            self.dispatcher.submit(job)
 
-            self.gpt_response_field.insert(tk.END, response_text)
-            self.progress["value"] = 100
-            self.update_idletasks()
-            winsound.MessageBeep(winsound.MB_ICONASTERISK)
+    def _process_ui_queue(self):
+        """Apply the events posted by worker threads to the widgets on the Tk thread.
 
-            if self.debug_var.get():
-                self.add_debug_log("Received GPT response.")
+        Streamed pieces and progress are coalesced by the event queue, so every
+        pass inserts at most one block of text per response.
+        """
+        try:
+            for kind, key, payload in self.ui_events.drain():
+                try:
+                    self._ui_handlers[kind](key, payload)
+                except Exception as e:
+                    self.add_debug_log(f"Error applying {kind} update: {e}", logging.ERROR)
+            self._flush_debug_log()
+        finally:
+            self.after(UI_UPDATE_INTERVAL_MS, self._process_ui_queue)
+
+    def _show_error(self, message):
+        """Show an error dialog once the current UI pass is done, merging errors raised meanwhile.
+
+        The dialog is modal, showing it from an update handler would hold back
+        the remaining updates of the pass until it is closed.
+        """
+        self._pending_errors.append(message)
+        if len(self._pending_errors) == 1:
+            self.after_idle(self._show_pending_errors)
+
+    def _show_pending_errors(self):
+        messages, self._pending_errors = self._pending_errors, []
+        messagebox.showerror("Error", "\n\n".join(messages))
+
+    def _response_marks(self, job):
+        """Return the marks around the content of a job's response in the response field."""
+        return f"job{job.job_id}_start", f"job{job.job_id}_end"
+
+    def _start_response(self, job):
+        """Add a job's response to the response list and, unless an older one is shown, the field.
+
+        A retried request starts over from the partial answer it continues.
+        """
+        if job.job_id in self._streamed_text:
+            self._streamed_text[job.job_id] = [job.partial]
+            if job in self._rendered_jobs:
+                self.gpt_response_field.delete(*self._response_marks(job))
+                self.gpt_response_field.insert(self._response_marks(job)[1], job.partial)
+            return
 
-            self.save_gpt_response(response_text, self.model_var.get())
-            self.is_request_in_progress = False
+        self._streamed_text[job.job_id] = [job.partial]
+        self._response_jobs.append(job)
+        self.response_list.insert(
+            "", tk.END, iid=str(job.job_id), values=(f"#{job.response_number} {job.name}", job.model_name)
+        )
+        if self._viewing_job is None:
+            self._render_response(job, job.partial)
+            self._trim_responses()
+
+    def _render_response(self, job, text):
+        """Append a response to the field, its content goes between two marks.
+
+        Every response keeps its own region so several responses can be streamed
+        into the field at the same time.
+        """
+        start_mark, end_mark = self._response_marks(job)
+        self.gpt_response_field.insert(tk.END, core.format_response_header(job.response_number))
+        self.gpt_response_field.mark_set(start_mark, "end-1c")
+        self.gpt_response_field.mark_gravity(start_mark, tk.LEFT)
+        self.gpt_response_field.insert(tk.END, "\n")
+        self.gpt_response_field.mark_set(end_mark, "end-2c")
+        self.gpt_response_field.mark_gravity(end_mark, tk.RIGHT)
+        self.gpt_response_field.insert(end_mark, text)
+        self._rendered_jobs.append(job)
+
+    def _remove_rendered_response(self, job):
+        """Delete a response and its header from the field."""
+        start_mark, end_mark = self._response_marks(job)
+        header = core.format_response_header(job.response_number)
+        self.gpt_response_field.delete(f"{start_mark} - {len(header)}c", f"{end_mark} + 1c")
+        self.gpt_response_field.mark_unset(start_mark, end_mark)
+        self._rendered_jobs.remove(job)
+
+    def _trim_responses(self):
+        """Remove the oldest complete responses from the field while it holds more than RESPONSE_WINDOW."""
+        if self._viewing_job is not None:
+            return
+        excess = len(self._rendered_jobs) - RESPONSE_WINDOW
+        for job in [job for job in self._rendered_jobs if job.job_id not in self._streamed_text][:max(excess, 0)]:
+            self._remove_rendered_response(job)
 
-        except Exception as e:
-            self.add_debug_log(f"An error occurred: {e}")
-            self.is_request_in_progress = False
-            self.progress["value"] = 0
-            self.update_idletasks()
+    def _clear_response_field(self):
+        """Empty the response field."""
+        self.gpt_response_field.delete("1.0", tk.END)
+        for job in self._rendered_jobs:
+            self.gpt_response_field.mark_unset(*self._response_marks(job))
+        self._rendered_jobs.clear()
+
+    def _response_text(self, job):
+        """Return a response's content, reading it from its file once the response is complete."""
+        if job.job_id in self._streamed_text:
+            return "".join(self._streamed_text[job.job_id])
+        try:
+            with open(job.file_path, "r", encoding="utf-8") as f:
+                text = f.read()
+        except OSError as e:
+            return f"[Unable to load the response: {e}]"
+        # Drop the header line and the newline closing the response
+        return text.split("\n", 1)[-1][:-1]
+
+    def show_selected_response(self, event=None):
+        """Scroll to the selected response, or show it on its own if it is no longer in the field."""
+        selection = self.response_list.selection()
+        if not selection:
+            return
+        job = self.jobs[int(selection[0])]
+        if job not in self._rendered_jobs:
+            self._clear_response_field()
+            self._viewing_job = job
+            self._render_response(job, self._response_text(job))
+        self.gpt_response_field.see(self._response_marks(job)[0])
+
+    def show_latest_responses(self):
+        """Show the latest RESPONSE_WINDOW responses again after viewing an older one."""
+        self._clear_response_field()
+        self._viewing_job = None
+        self.response_list.selection_remove(self.response_list.selection())
+        for job in self._response_jobs[-RESPONSE_WINDOW:]:
+            self._render_response(job, self._response_text(job))
+        self.gpt_response_field.see(tk.END)
+
+    def _insert_response_text(self, job, text):
+        """Insert text at the end of a job's response."""
+        if job.job_id in self._streamed_text:
+            self._streamed_text[job.job_id].append(text)
+        if job in self._rendered_jobs:
+            _, end_mark = self._response_marks(job)
+            # Follow the output only while the view is at the end, several responses may be streaming
+            at_bottom = self.gpt_response_field.yview()[1] >= 1.0
+            self.gpt_response_field.insert(end_mark, text)
+            if at_bottom:
+                self.gpt_response_field.see(tk.END)
+        self._update_job_row(job)
+
+    def _end_response(self, job, keep):
+        """Mark a job's response complete, removing it from the field and the list unless keep is set.
+
+        A complete response is read from its file when it is shown again.
+        """
+        if self._streamed_text.pop(job.job_id, None) is None:
+            return
+        if not keep:
+            if job in self._rendered_jobs:
+                self._remove_rendered_response(job)
+            if job in self._response_jobs:
+                self._response_jobs.remove(job)
+                self.response_list.delete(str(job.job_id))
+        self._trim_responses()
+
+    def _update_job_row(self, job, status=None):
+        """Refresh a job's row in the Requests tab."""
+        received = f"{job.received_tokens}/{job.max_tokens}" if job.max_tokens else ""
+        elapsed = f"{job.elapsed:.1f}s" if job.elapsed is not None else ""
+        self.requests_view.item(
+            str(job.job_id),
+            values=(
+                job.name,
+                job.model_name,
+                status or job.status,
+                received,
+                job.attempts,
+                elapsed,
+            ),
+        )
+
+    def _show_job_status(self, job, status):
+        """React to a job's state change on the Tk thread."""
+        self._update_job_row(job, "cached" if job.cached and status == dispatcher.DONE else status)
+
+        if status == dispatcher.RUNNING:
+            self._start_response(job)
+        elif status == dispatcher.RETRYING:
+            self.add_debug_log(f"Request {job.job_id} failed ({job.error}), retrying...", logging.WARNING)
+        elif status == dispatcher.DONE:
+            if job.cached:
+                self._start_response(job)
+                self.add_debug_log(
+                    f"Cache hit for request {job.job_id}: response served from cache (key {job.cache_key[:12]})."
+                )
+            if not job.stream or job.cached:
+                # A continued answer was shown up to its partial part when it started
+                self._insert_response_text(job, job.result[len(job.partial):])
+            self._end_response(job, keep=True)
+            winsound.MessageBeep(winsound.MB_ICONASTERISK)
+            if self.debug_var.get():
+                self.add_debug_log(f"Received GPT response for request {job.job_id}.")
+            self.add_debug_log(f"GPT response saved to {job.file_path}.")
+            if job.archive_error:
+                self.add_debug_log(f"Error archiving response {job.job_id}: {job.archive_error}", logging.WARNING)
+            pending_snapshot = self._pending_snapshots.pop(job.job_id, None)
+            if pending_snapshot:
+                root, sections = pending_snapshot
+                threading.Thread(
+                    target=save_snapshot, args=(root, Snapshot(sections, job.result)), name="save-snapshot", daemon=True
+                ).start()
+        elif status == dispatcher.CANCELLED:
+            self._end_response(job, keep=False)
+            self._pending_snapshots.pop(job.job_id, None)
+            self.add_debug_log(f"Request {job.job_id} ({job.model_name}) cancelled, another model answered first.")
+        elif status == dispatcher.FAILED:
+            self._end_response(job, keep=False)
+            self._pending_snapshots.pop(job.job_id, None)
+            if isinstance(job.error, core.PromptTooLargeError):
+                self._show_error(str(job.error))
+                self.add_debug_log(str(job.error), logging.ERROR)
+            else:
+                self.add_debug_log(f"An error occurred: {job.error}", logging.ERROR)
+            if self.journal is not None and dispatcher.is_resendable_error(job.error):
+                self.add_debug_log(
+                    f"Request {job.job_id} can be resumed or resent from Unfinished Requests in the Requests tab."
+                )
             winsound.MessageBeep(winsound.MB_ICONHAND)
-        finally:
-            self.send_button.config(state="normal")
+        if status in (dispatcher.DONE, dispatcher.FAILED, dispatcher.CANCELLED):
+            self._show_comparison_result(job)
+            # The response is kept in its file, finished jobs only hold what the Requests tab shows
+            job.final_prompt = job.result = None
+            job.pieces = []
+            job.partial = ""
+            self.refresh_stats()
+
+        counts = {}
+        for tracked_job in self.jobs.values():
+            counts[tracked_job.status] = counts.get(tracked_job.status, 0) + 1
+        self.request_status_var.set(
+            "Requests: " + ", ".join(f"{count} {state}" for state, count in counts.items())
+        )
+
+    def refresh_stats(self, event=None):
+        """Summarize the recorded metrics in the Stats tab while it is shown."""
+        if self.notebook.select() != str(self.tab5):
+            return
+        self.stats_view.delete(*self.stats_view.get_children())
+        for row in summarize_requests(self.telemetry.records(REQUEST)):
+            values = []
+            for column in self.stats_view["columns"]:
+                value = row[column]
+                if value is None:
+                    values.append("")
+                elif column == "cache_hit_rate":
+                    values.append(f"{value:.0%}")
+                elif column.endswith(("_p50", "_p95")):
+                    values.append(f"{value:.2f}s")
+                elif isinstance(value, float):
+                    values.append(f"{value:.0f}")
+                else:
+                    values.append(value)
+            self.stats_view.insert("", tk.END, values=values)
+
+        ingest = summarize_ingest(self.telemetry.records(INGEST))
+        if ingest:
+            self.ingest_stats_var.set(
+                f"File loads: {ingest['loads']}, p50 {ingest['seconds_p50']:.2f}s, "
+                f"p95 {ingest['seconds_p95']:.2f}s, {ingest['files_per_second'] or 0:.0f} files/s"
+            )
+        else:
+            self.ingest_stats_var.set("")
 
-    def save_gpt_response(self, response_text, model_name):
-        """Save the GPT response to a file."""
-        base_dir = os.path.dirname(os.path.realpath(__file__))
-        responses_dir = os.path.join(
-            base_dir, "Responses", datetime.now().strftime("%Y-%m-%d")
+    def export_metrics(self, kind):
+        """Save the recorded metrics of one kind as CSV."""
+        filename = filedialog.asksaveasfilename(
+            defaultextension=".csv",
+            filetypes=[("CSV files", "*.csv"), ("All files", "*.*")],
         )
-        os.makedirs(responses_dir, exist_ok=True)
+        if not filename:
+            return
+        count = self.telemetry.export_csv(filename, kind)
+        self.add_debug_log(f"Exported {count} {kind} metrics to {filename}.")
+
+    def reset_stats(self):
+        """Delete the recorded metrics."""
+        if messagebox.askokcancel("Reset Stats", f"Delete all metrics in {self.telemetry.path}?"):
+            self.telemetry.clear()
+            self.refresh_stats()
+
+    def schedule_archive_search(self, event=None):
+        """Debounce archive searches so typing a word runs a single query."""
+        if self._archive_search_job is not None:
+            self.after_cancel(self._archive_search_job)
+        self._archive_search_job = self.after(ARCHIVE_SEARCH_DEBOUNCE_MS, self.search_archive)
+
+    def search_archive(self, event=None):
+        """List the archived responses matching the search text, or the latest ones without text."""
+        self._archive_search_job = None
+        if self.archive is None:
+            self.archive_status_var.set("Archive unavailable")
+            return
+        started = time.perf_counter()
+        results = self.archive.search(self.archive_query_var.get(), model=self.archive_model_var.get() or None)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        self.archive_view.delete(*self.archive_view.get_children())
+        self._archive_results = {}
+        for result in results:
+            iid = str(result.response_id)
+            self._archive_results[iid] = result
+            tokens = ""
+            if result.prompt_tokens is not None and result.completion_tokens is not None:
+                tokens = f"{result.prompt_tokens}/{result.completion_tokens}"
+            self.archive_view.insert("", tk.END, iid=iid, values=(
+                datetime.fromtimestamp(result.created).strftime("%Y-%m-%d %H:%M:%S"),
+                result.model,
+                result.name or "",
+                tokens,
+                f"{result.latency:.1f}s" if result.latency is not None else "",
+                (result.snippet or "").replace("\n", " "),
+            ))
+        self.archive_status_var.set(f"{len(results)} responses ({elapsed_ms:.0f} ms)")
+
+    def _update_archive_models(self):
+        """Offer the models with archived responses in the archive's model filter."""
+        if self.archive is not None:
+            self.archive_model_dropdown["values"] = [""] + self.archive.models()
+
+    def show_archived_response(self, event=None):
+        """Show the selected archived response and the files it was requested for."""
+        selection = self.archive_view.selection()
+        if not selection or self.archive is None:
+            return
+        result = self._archive_results[selection[0]]
+        content = self.archive.get_content(result.response_id) or ""
+        details = [f"File: {result.file_path}"] if result.file_path else []
+        if result.sources:
+            details.append("Sources: " + ", ".join(os.path.basename(path) for path in result.sources))
+        self.archive_preview.delete("1.0", tk.END)
+        self.archive_preview.insert(tk.END, "\n".join(details + ["", content]))
+
+    def import_responses(self):
+        """Archive the response files saved before the archive existed, on a worker thread."""
+        if self.archive is None:
+            messagebox.showerror("Error", "The response archive is unavailable.")
+            return
+        directory = filedialog.askdirectory(initialdir=core.RESPONSES_DIR)
+        if not directory:
+            return
+        self.archive_status_var.set("Searching response files...")
+
+        def run_import():
+            try:
+                imported = self.archive.import_tree(
+                    directory,
+                    on_progress=lambda done, total: self.ui_events.post("archive_progress", None, (done, total)),
+                )
+            except Exception as e:
+                self.ui_events.post("archive_imported", directory, e)
+                return
+            self.ui_events.post("archive_imported", directory, imported)
 
-        timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
-        filename = f"{timestamp}-{model_name}-Response.txt"
-        file_path = os.path.join(responses_dir, filename)
+        threading.Thread(target=run_import, name="archive-import", daemon=True).start()
 
-        with open(file_path, "w", encoding="utf-8") as f:
-            f.write(response_text)
+    def _show_archive_progress(self, key, progress):
+        """Show how many response files of a running import are archived."""
+        done, total = progress
+        self.archive_status_var.set(f"Importing responses: {done}/{total}")
 
-        self.add_debug_log(f"GPT response saved to {file_path}.")
+    def _show_archive_imported(self, directory, result):
+        """Report a finished import and refresh the search results."""
+        if isinstance(result, Exception):
+            self.archive_status_var.set("Import failed.")
+            self.add_debug_log(f"Error importing responses from {directory}: {result}", logging.ERROR)
+            return
+        self.add_debug_log(f"Imported {result} responses from {directory} into the archive.")
+        self.search_archive()
 
     def close_window(self):
         """Handle the window close event."""
         if messagebox.askokcancel("Quit", "Do you want to quit?"):
             self.destroy()
 
+    def exit_after_startup(self, timeout=30.0):
+        """Report when the window is shown and when the models are listed, then close.
+
+        Used by benchmarks/bench_startup.py, which times the printed markers.
+        """
+        self.update()
+        print("window", flush=True)
+        deadline = time.monotonic() + timeout
+
+        def wait_for_models():
+            if self.available_models or time.monotonic() > deadline:
+                print("models" if self.available_models else "models-timeout", flush=True)
+                self.destroy()
+            else:
+                self.after(10, wait_for_models)
+
+        wait_for_models()
+
+    def profile_startup(self, timeout=60.0):
+        """Print the duration of every startup phase once the warmup is done, then close."""
+        shown_from = time.perf_counter()
+        self.update()
+        self.startup_profile.add("show window", shown_from)
+        deadline = time.monotonic() + timeout
+
+        def wait_for_warmup():
+            if self.startup_complete or time.monotonic() > deadline:
+                print(self.startup_profile.report())
+                if not self.startup_complete:
+                    print(f"Warmup did not finish within {timeout:.0f} s.")
+                self.destroy()
+            else:
+                self.after(10, wait_for_warmup)
+
+        wait_for_warmup()
+
 if __name__ == "__main__":
     app = Application()
+    if "--profile-startup" in sys.argv[1:]:
+        app.profile_startup()
+    elif "--exit-after-startup" in sys.argv[1:]:
+        app.exit_after_startup()
     app.mainloop()
@@ -0,0 +1,5 @@
+"""Core building blocks of the AI Merger Tool.
+
+The modules in this package must not import tkinter so they can be shared by
+the desktop application and headless tooling alike.
+"""
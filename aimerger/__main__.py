@@ -0,0 +1,5 @@
+import sys
+
+from aimerger.cli import main
+
+sys.exit(main())
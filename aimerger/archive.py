@@ -0,0 +1,262 @@
+"""Searchable archive of every response saved to the Responses directory.
+
+The response files stay the record of what was received. Each one is also
+added to a SQLite database with an FTS5 full-text index over its content and
+the request's metadata, so finding an old answer is an index query instead of
+a scan of tens of thousands of files. import_tree adds responses saved before
+the archive existed.
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from aimerger import core
+from aimerger.model_registry import ModelRegistryError, get_registry
+from aimerger.response_cache import CACHE_DIR
+
+DEFAULT_SEARCH_LIMIT = 200
+IMPORT_BATCH_SIZE = 500  # Files inserted per transaction by import_tree
+
+# <YYYYmmdd-HHMMSS>-<model>[-<n>]-Response.txt as written by core.get_response_file_path
+_RESPONSE_FILE_NAME = re.compile(r"^(\d{8}-\d{6})-(.+)-Response\.txt$")
+_COLLISION_SUFFIX = re.compile(r"-\d+$")
+
+
+class ArchivedResponse:
+    """Metadata of an archived response, with a highlighted snippet for search results."""
+
+    def __init__(self, response_id, created, model, name, file_path, prompt_tokens,
+                 completion_tokens, latency, sources, snippet=None):
+        self.response_id = response_id
+        self.created = created
+        self.model = model
+        self.name = name
+        self.file_path = file_path
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        self.latency = latency
+        self.sources = sources
+        self.snippet = snippet
+
+
+def prompt_hash(final_prompt):
+    """Return the hash a prompt is archived under, to find all answers to the same prompt."""
+    return hashlib.sha256(final_prompt.encode("utf-8")).hexdigest()
+
+
+def build_match_query(text):
+    """Turn free text into an FTS5 query matching all its words, the last one as a prefix.
+
+    Every word is quoted so punctuation and FTS5 operators typed in the
+    search field never make the query invalid.
+    """
+    words = text.split()
+    if not words:
+        return None
+    terms = ['"{}"'.format(word.replace('"', '""')) for word in words]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+def _file_name_model(name):
+    """Return the model of the <model>[-<n>] part of a response file name.
+
+    Dated model ids end in digits like the collision counter, so the counter is
+    only dropped when the name without it is a listed model. Names of models
+    that are not listed are kept whole.
+    """
+    try:
+        registry = get_registry()
+    except ModelRegistryError:
+        return name
+    if name in registry:
+        return name
+    base = _COLLISION_SUFFIX.sub("", name)
+    return base if base in registry else name
+
+
+def parse_response_file_name(file_name):
+    """Return (created, model) from a response file name, or None if it is not one."""
+    match = _RESPONSE_FILE_NAME.match(file_name)
+    if not match:
+        return None
+    try:
+        created = datetime.strptime(match.group(1), "%Y%m%d-%H%M%S").timestamp()
+    except ValueError:
+        return None
+    return created, _file_name_model(match.group(2))
+
+
+class ResponseArchive:
+    """Thread-safe full-text indexed store of responses and their request metadata."""
+
+    def __init__(self, path=None):
+        if path is None:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            path = os.path.join(CACHE_DIR, "archive.sqlite3")
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " id INTEGER PRIMARY KEY,"
+                " file_path TEXT UNIQUE,"
+                " created REAL NOT NULL,"
+                " model TEXT NOT NULL,"
+                " name TEXT,"
+                " prompt_hash TEXT,"
+                " prompt_tokens INTEGER,"
+                " completion_tokens INTEGER,"
+                " latency REAL,"
+                " sources TEXT NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS responses_created ON responses (created)"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS responses_prompt_hash ON responses (prompt_hash)"
+            )
+            # The content is only stored in the full-text table, its rowid is the response id
+            self._connection.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS responses_fts USING fts5(content, name, sources)"
+            )
+
+    def _insert(self, content, model, file_path, created, name, prompt_hash, prompt_tokens,
+                completion_tokens, latency, sources, keep_existing=False):
+        """Insert a response and return its id, None if keep_existing is set and the file is archived."""
+        cursor = self._connection.execute(
+            f"INSERT {'OR IGNORE ' if keep_existing else ''}INTO responses (file_path, created, model, name,"
+            " prompt_hash, prompt_tokens, completion_tokens, latency, sources) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (file_path, created, model, name, prompt_hash, prompt_tokens, completion_tokens,
+             latency, json.dumps(list(sources))),
+        )
+        if cursor.rowcount == 0:
+            return None
+        self._connection.execute(
+            "INSERT INTO responses_fts (rowid, content, name, sources) VALUES (?, ?, ?, ?)",
+            (cursor.lastrowid, content, name or "", " ".join(sources)),
+        )
+        return cursor.lastrowid
+
+    def add(self, content, model, file_path=None, created=None, name=None, prompt_hash=None,
+            prompt_tokens=None, completion_tokens=None, latency=None, sources=()):
+        """Archive a response and return its id, replacing an earlier entry for the same file."""
+        with self._lock, self._connection:
+            if file_path is not None:
+                file_path = os.path.abspath(file_path)
+                self._delete_file(file_path)
+            return self._insert(
+                content, model, file_path, time.time() if created is None else created, name,
+                prompt_hash, prompt_tokens, completion_tokens, latency, sources,
+            )
+
+    def _delete_file(self, file_path):
+        row = self._connection.execute(
+            "SELECT id FROM responses WHERE file_path = ?", (file_path,)
+        ).fetchone()
+        if row:
+            self._connection.execute("DELETE FROM responses WHERE id = ?", row)
+            self._connection.execute("DELETE FROM responses_fts WHERE rowid = ?", row)
+
+    def search(self, text="", model=None, limit=DEFAULT_SEARCH_LIMIT):
+        """Return the archived responses matching text, the most recently archived first.
+
+        Without text the most recent responses are listed. model restricts
+        the results to one model.
+        """
+        query = build_match_query(text)
+        model_filter = " AND r.model = ?" if model else ""
+        model_args = (model,) if model else ()
+        if query is None:
+            sql = (
+                "SELECT r.id, r.created, r.model, r.name, r.file_path, r.prompt_tokens,"
+                " r.completion_tokens, r.latency, r.sources, NULL FROM responses r"
+                f" WHERE 1{model_filter} ORDER BY r.created DESC LIMIT ?"
+            )
+            args = model_args + (limit,)
+        else:
+            sql = (
+                "SELECT r.id, r.created, r.model, r.name, r.file_path, r.prompt_tokens,"
+                " r.completion_tokens, r.latency, r.sources,"
+                " snippet(responses_fts, 0, '[', ']', '...', 12)"
+                " FROM responses_fts JOIN responses r ON r.id = responses_fts.rowid"
+                f" WHERE responses_fts MATCH ?{model_filter} ORDER BY responses_fts.rowid DESC LIMIT ?"
+            )
+            args = (query,) + model_args + (limit,)
+        with self._lock:
+            rows = self._connection.execute(sql, args).fetchall()
+        return [
+            ArchivedResponse(*row[:8], json.loads(row[8]), row[9])
+            for row in rows
+        ]
+
+    def get_content(self, response_id):
+        """Return the content of an archived response, or None if there is no such response."""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT content FROM responses_fts WHERE rowid = ?", (response_id,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def models(self):
+        """Return the models with archived responses."""
+        with self._lock:
+            rows = self._connection.execute("SELECT DISTINCT model FROM responses ORDER BY model").fetchall()
+        return [row[0] for row in rows]
+
+    def count(self):
+        """Return the number of archived responses."""
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def import_tree(self, responses_dir=core.RESPONSES_DIR, on_progress=None):
+        """Archive the response files under responses_dir that are not archived yet.
+
+        Only files named like the saved responses are imported, their model and
+        time are taken from the name. Requests' token counts and sources were
+        not saved with the files and stay unknown. Files archived by a running
+        send while the import reads them are skipped. on_progress(done, total)
+        is called after every batch. Returns the number of imported files.
+        """
+        with self._lock:
+            known = {row[0] for row in self._connection.execute("SELECT file_path FROM responses")}
+        pending = []
+        for directory, _, file_names in os.walk(responses_dir):
+            for file_name in file_names:
+                file_path = os.path.abspath(os.path.join(directory, file_name))
+                parsed = parse_response_file_name(file_name)
+                if parsed and file_path not in known:
+                    pending.append((file_path, parsed))
+        pending.sort()
+
+        imported = 0
+        for start in range(0, len(pending), IMPORT_BATCH_SIZE):
+            batch = []
+            for file_path, (created, model) in pending[start:start + IMPORT_BATCH_SIZE]:
+                try:
+                    with open(file_path, "r", encoding="utf-8") as f:
+                        batch.append((f.read(), model, file_path, created))
+                except (OSError, UnicodeDecodeError):
+                    continue
+            with self._lock, self._connection:
+                for content, model, file_path, created in batch:
+                    response_id = self._insert(
+                        content, model, file_path, created, None, None, None, None, None, (), keep_existing=True
+                    )
+                    imported += response_id is not None
+            if on_progress:
+                on_progress(min(start + IMPORT_BATCH_SIZE, len(pending)), len(pending))
+        return imported
+
+    def close(self):
+        """Close the database connection."""
+        with self._lock:
+            self._connection.close()
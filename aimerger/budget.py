@@ -0,0 +1,75 @@
+"""Exact token budget of a prompt by part, shown before it is sent.
+
+A prompt is counted for the selected model as it is sent: the chat framing,
+the start message, every merged file, the end message and the completion
+tokens requested with it. The parts are counted on their own and joined
+exactly with join_text_tokens, so an edit only recounts the part it changed.
+"""
+from aimerger import core
+from aimerger.model_registry import get_model
+from aimerger.tokens import get_encoding, join_text_tokens, text_tokens
+
+
+class PromptBudget:
+    """Tokens of a prompt by part and the completion tokens it leaves room for.
+
+    middle_tokens holds a (name, tokens) pair per merged file. frame_tokens
+    are the tokens of the chat framing and the line breaks joining the parts.
+    """
+
+    def __init__(self, model_name, context_window, frame_tokens, start_tokens, middle_tokens, end_tokens,
+                 prompt_tokens, completion_tokens):
+        self.model_name = model_name
+        self.context_window = context_window
+        self.frame_tokens = frame_tokens
+        self.start_tokens = start_tokens
+        self.middle_tokens = middle_tokens
+        self.end_tokens = end_tokens
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+
+    @property
+    def fits(self):
+        """True if the prompt leaves room for at least one completion token."""
+        return self.prompt_tokens < self.context_window
+
+    @property
+    def free_tokens(self):
+        """Tokens of the context window used by neither the prompt nor the completion."""
+        return max(self.context_window - self.prompt_tokens - self.completion_tokens, 0)
+
+
+def section_text_tokens(model_name, sections, section_tokens=None):
+    """Return the TextTokens of merged sections, section_tokens are their counts if already known."""
+    encoding = get_encoding(model_name)
+    if section_tokens is None:
+        section_tokens = [None] * len(sections)
+    return [text_tokens(encoding, section, tokens) for section, tokens in zip(sections, section_tokens)]
+
+
+def build_budget(model_name, start, middle_parts, end, middle=None):
+    """Return the PromptBudget of a prompt from the TextTokens of its parts.
+
+    start and end are the TextTokens of the start and end messages as sent,
+    middle_parts a (name, TextTokens) pair per merged file. middle can be
+    given as the join of the middle parts if it was computed before.
+    """
+    encoding = get_encoding(model_name)
+    model = get_model(model_name)
+    if middle is None:
+        middle = join_text_tokens(encoding, [part for _, part in middle_parts])
+    newline = text_tokens(encoding, "\n")
+    content = join_text_tokens(encoding, [start, newline, middle, newline, end])
+    prompt_tokens = core.prompt_frame_tokens(model_name) + content.tokens
+    middle_tokens = [(name, part.tokens) for name, part in middle_parts]
+    parts_tokens = start.tokens + sum(tokens for _, tokens in middle_tokens) + end.tokens
+    return PromptBudget(
+        model_name,
+        model.context_window,
+        prompt_tokens - parts_tokens,
+        start.tokens,
+        middle_tokens,
+        end.tokens,
+        prompt_tokens,
+        max(min(model.max_output_tokens, model.context_window - prompt_tokens), 0),
+    )
@@ -0,0 +1,207 @@
+"""Split merges that are too large for a model into as few prompts as possible.
+
+Every chunk keeps the start and end message parts and fits into the model's
+token limit minus the tokens reserved for the completion. Whole files are
+bin-packed into the chunks; a file that does not fit into a chunk on its own
+is split on class and method boundaries first.
+"""
+import re
+import secrets
+from datetime import datetime
+
+from aimerger import core
+from aimerger.model_registry import get_model
+from aimerger.tokens import DEFAULT_TOKEN_MODEL, count_text_tokens, get_encoding
+
+# Braces deeper than namespace > class > member are not used as split points
+MAX_SPLIT_DEPTH = 2
+
+# Tokens kept free per packed section for merges across section boundaries
+SECTION_TOKEN_MARGIN = 2
+
+_STRINGS_AND_COMMENTS = re.compile(r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'|//.*')
+_SECTION_HEADER = re.compile(r"--- (.*) ---")
+
+
+class ChunkPlanError(ValueError):
+    """Raised when the start and end message parts alone exceed the token budget."""
+
+
+def new_merge_id():
+    """Return an id that groups the responses of one chunked merge."""
+    return f"merge-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{secrets.token_hex(2)}"
+
+
+def reserved_completion_tokens(model_name):
+    """Return the completion tokens reserved per chunk, at most half the model's context window."""
+    model = get_model(model_name)
+    return min(model.max_output_tokens, model.context_window // 2)
+
+
+def _split_points(lines):
+    """Return the indexes of lines a file can be split before without cutting a member."""
+    points = []
+    depth = 0
+    previous = ""
+    for index, line in enumerate(lines):
+        stripped = line.strip()
+        if (
+            index
+            and depth <= MAX_SPLIT_DEPTH
+            and stripped
+            and not stripped.startswith(("{", "}"))
+            and (not previous or previous.endswith(("}", ";", "{")))
+        ):
+            points.append(index)
+        code = _STRINGS_AND_COMMENTS.sub("", line)
+        depth = max(0, depth + code.count("{") - code.count("}"))
+        if stripped:
+            previous = stripped
+        else:
+            previous = ""
+    return points
+
+
+def _split_text(text, budget, encoding):
+    """Split text into pieces of at most budget tokens, halving until they fit."""
+    if count_text_tokens(encoding, text) <= budget or len(text) < 2:
+        return [text]
+    middle = len(text) // 2
+    return _split_text(text[:middle], budget, encoding) + _split_text(text[middle:], budget, encoding)
+
+
+def split_content(content, budget, encoding):
+    """Split file content into pieces of at most budget tokens.
+
+    Pieces end before class or member declarations where possible, otherwise at
+    a line break, and single lines that are too long are cut in between.
+    """
+    lines = content.splitlines(keepends=True)
+    line_tokens = [count_text_tokens(encoding, line) for line in lines]
+    split_points = set(_split_points(lines))
+
+    pieces = []
+    start = 0
+    while start < len(lines):
+        total = 0
+        end = start
+        last_split = None
+        while end < len(lines) and total + line_tokens[end] <= budget:
+            total += line_tokens[end]
+            end += 1
+            if end in split_points:
+                last_split = end
+        if end == len(lines):
+            cut = end
+        elif end == start:
+            # A single line exceeds the budget
+            pieces.extend(_split_text(lines[start], budget, encoding))
+            start += 1
+            continue
+        else:
+            cut = last_split if last_split is not None else end
+
+        piece = "".join(lines[start:cut])
+        # Line counts are an estimate, make sure the joined piece really fits
+        pieces.extend(_split_text(piece, budget, encoding))
+        start = cut
+    return pieces
+
+
+def split_section(section, budget, encoding):
+    """Split an oversized "--- name ---" section into numbered part sections."""
+    header, _, content = section.partition("\n")
+    match = _SECTION_HEADER.fullmatch(header)
+    name = match.group(1) if match else header
+    # Keep room for the "(part i/n)" header of every piece
+    header_tokens = count_text_tokens(encoding, f"--- {name} (part 000/000) ---\n")
+    pieces = split_content(content, budget - header_tokens, encoding)
+    return [
+        f"--- {name} (part {number}/{len(pieces)}) ---\n{piece}"
+        for number, piece in enumerate(pieces, start=1)
+    ]
+
+
+def frame_tokens(start_text, end_text, model_name=DEFAULT_TOKEN_MODEL):
+    """Tokens of a prompt with an empty middle part, including the model's chat framing."""
+    return (
+        count_text_tokens(get_encoding(model_name), core.build_prompt(start_text, "", end_text))
+        + core.prompt_frame_tokens(model_name)
+    )
+
+
+def estimate_prompt_tokens(start_text, end_text, section_tokens, model_name=DEFAULT_TOKEN_MODEL):
+    """Estimate a prompt's tokens from the token counts of its middle sections.
+
+    section_tokens have to be counted with the model's encoding. Returns
+    (tokens, margin); the exact count is within margin of tokens.
+    """
+    tokens = frame_tokens(start_text, end_text, model_name) + sum(section_tokens)
+    return tokens, SECTION_TOKEN_MARGIN * (len(section_tokens) + 1)
+
+
+def pack_chunks(start_text, end_text, sections, model_name, reserved_tokens=None, section_tokens=None):
+    """Pack the merged sections into as few middle parts as possible.
+
+    Returns a list of (middle_text, (tokens, margin)) with the estimated
+    prompt tokens of every chunk. Each middle text, wrapped in the start and
+    end text, fits into the model's limit with reserved_tokens left for the
+    completion. The sections keep their original order inside every chunk.
+    Known section_tokens, in the order of sections, are not counted again.
+    Everything else is counted with the model's encoding.
+    """
+    encoding = get_encoding(model_name)
+    if reserved_tokens is None:
+        reserved_tokens = reserved_completion_tokens(model_name)
+
+    prompt_frame_tokens = frame_tokens(start_text, end_text, model_name)
+    budget = (
+        core.get_model_max_tokens(model_name) - reserved_tokens - prompt_frame_tokens - SECTION_TOKEN_MARGIN
+    )
+    if budget <= SECTION_TOKEN_MARGIN:
+        raise ChunkPlanError("The start and end messages leave no room for files in the model's limit.")
+
+    items = []
+    for number, section in enumerate(sections):
+        known_tokens = section_tokens[number] if section_tokens is not None else None
+        if known_tokens is None:
+            known_tokens = count_text_tokens(encoding, section)
+        tokens = known_tokens + SECTION_TOKEN_MARGIN
+        if tokens <= budget:
+            items.append((tokens, section))
+        else:
+            for part in split_section(section, budget - SECTION_TOKEN_MARGIN, encoding):
+                items.append((count_text_tokens(encoding, part) + SECTION_TOKEN_MARGIN, part))
+
+    # First fit decreasing bin packing, remembering the original position of every item
+    bins = []
+    for position, (tokens, _) in sorted(enumerate(items), key=lambda item: -item[1][0]):
+        for chunk in bins:
+            if chunk["tokens"] + tokens <= budget:
+                chunk["tokens"] += tokens
+                chunk["positions"].append(position)
+                break
+        else:
+            bins.append({"tokens": tokens, "positions": [position]})
+
+    chunks = [sorted(chunk["positions"]) for chunk in bins]
+    chunks.sort(key=lambda positions: positions[0])
+    return [
+        (
+            "".join(items[position][1] for position in positions),
+            (
+                prompt_frame_tokens + sum(items[position][0] - SECTION_TOKEN_MARGIN for position in positions),
+                SECTION_TOKEN_MARGIN * (len(positions) + 1),
+            ),
+        )
+        for positions in chunks
+    ]
+
+
+def plan_chunks(start_text, end_text, sections, model_name, reserved_tokens=None, section_tokens=None):
+    """Pack the merged sections into as few middle parts as possible.
+
+    Returns the middle texts of pack_chunks without their token estimates.
+    """
+    chunks = pack_chunks(start_text, end_text, sections, model_name, reserved_tokens, section_tokens)
+    return [middle_text for middle_text, _ in chunks]
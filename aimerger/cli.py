@@ -0,0 +1,475 @@
+"""Headless command line entry point for merging source files and sending them to GPT.
+
+Example::
+
+    python -m aimerger --model gpt-4o "src/**/*.cs"
+
+The start and end messages are taken from active_templates/ and the response is
+saved to Responses/<date>/ just like in the desktop application. Requests that
+were interrupted are kept in the request journal and can be continued with
+--resume or sent again with --resend.
+"""
+import argparse
+import glob
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import as_completed
+from datetime import datetime
+
+from aimerger import core, dispatcher, tokens
+from aimerger import fanout
+from aimerger.archive import ResponseArchive
+from aimerger.chunking import ChunkPlanError, new_merge_id, plan_chunks, reserved_completion_tokens
+from aimerger.dispatcher import Dispatcher, PromptJob
+from aimerger.ingest import DEFAULT_EXCLUDE, DEFAULT_INCLUDE, find_source_files, load_source_files
+from aimerger.journal import RequestJournal
+from aimerger.reduction import STEPS, ReductionPipeline
+from aimerger.telemetry import INGEST, REQUEST, Telemetry, format_request_summary, summarize_requests
+from aimerger.resend import Snapshot, build_changes_text, load_snapshot, save_snapshot, session_root
+from aimerger.response_cache import ResponseCache
+from aimerger.token_index import TokenIndex
+
+
+def expand_file_patterns(patterns, include=DEFAULT_INCLUDE, exclude=DEFAULT_EXCLUDE):
+    """Expand glob patterns to a sorted list of unique files, keeping pattern order.
+
+    Directories are searched recursively for files matching include but not exclude.
+    """
+    filenames = []
+    seen = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = find_source_files(pattern, include, exclude)
+        elif glob.has_magic(pattern):
+            matches = sorted(glob.glob(pattern, recursive=True))
+        else:
+            matches = [pattern]
+        for filename in matches:
+            path = os.path.abspath(filename)
+            if path not in seen and os.path.isfile(path):
+                seen.add(path)
+                filenames.append(filename)
+    return filenames
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="python -m aimerger",
+        description="Merge source files between the start and end templates and send them to GPT.",
+    )
+    parser.add_argument("files", nargs="*", help="Source files, directories or glob patterns, e.g. 'src/**/*.cs'")
+    parser.add_argument("--include", action="append", help="Glob of files to load from directories, repeatable (default: *.cs)")
+    parser.add_argument("--exclude", action="append", help="Glob of files or folders to skip in directories, repeatable (default: bin/* obj/* .git/* .vs/*)")
+    parser.add_argument("--reduce", metavar="STEPS", default="", help=f"Comma separated reduction steps applied before merging: {', '.join(STEPS)}")
+    parser.add_argument("-m", "--model", dest="models", action="append", help="Model name, repeat to send to several models (default: gpt-3.5-turbo)")
+    parser.add_argument("--fan-out", choices=fanout.MODES, help="With several models: use the first answer and cancel the rest, or compare all answers")
+    parser.add_argument("--per-file", action="store_true", help="Send one prompt per file instead of one merged prompt")
+    parser.add_argument("--chunk", action="store_true", help="Split merges over the model's limit into several prompts")
+    parser.add_argument("--changes-only", action="store_true", help="Send only diffs of the files changed since the last response for these files")
+    parser.add_argument("--sequential", action="store_true", help="Send the chunks of a merge one after another")
+    parser.add_argument("--templates-dir", default=core.TEMPLATES_DIR, help="Directory with start_message.txt and end_message.txt")
+    parser.add_argument("--responses-dir", default=core.RESPONSES_DIR, help="Directory the dated response folders are created in")
+    parser.add_argument("--stream", action="store_true", help="Stream the responses, printing a single response while it is generated")
+    parser.add_argument("--dry-run", action="store_true", help="Print the prompts and their token counts without sending them")
+    parser.add_argument("--list-models", action="store_true", help="List the available models and exit")
+    parser.add_argument("--import-responses", action="store_true", help="Add the responses saved in --responses-dir to the response archive and exit")
+    parser.add_argument("--search", metavar="TEXT", help="Search the response archive and exit, an empty TEXT lists the latest responses")
+    parser.add_argument("--stats", action="store_true", help="Print latency, throughput and cache statistics per model from the recorded metrics and exit")
+    parser.add_argument("--export-metrics", metavar="CSV", help="Write the recorded request metrics to a CSV file and exit")
+    parser.add_argument("--download-encodings", action="store_true", help="Store the tokenizer files for offline use and exit")
+    parser.add_argument("--unfinished", action="store_true", help="List the interrupted requests in the request journal and exit")
+    parser.add_argument("--resume", type=int, nargs="*", metavar="ID", help="Continue interrupted requests from their partial answers, all without IDs")
+    parser.add_argument("--resend", type=int, nargs="*", metavar="ID", help="Send interrupted requests again from the start, all without IDs")
+    parser.add_argument("--discard", type=int, nargs="*", metavar="ID", help="Remove interrupted requests from the request journal, all without IDs")
+    parser.add_argument("--concurrency", type=int, default=4, help="Requests sent at the same time (default: %(default)s)")
+    parser.add_argument("--rpm", type=int, help="Requests per minute limit")
+    parser.add_argument("--tpm", type=int, help="Tokens per minute limit")
+    parser.add_argument("--no-cache", action="store_true", help="Always send the request instead of using a cached response")
+    parser.add_argument("--max-retries", type=int, default=5, help="Retries on rate limit and server errors (default: %(default)s)")
+    return parser
+
+
+def configure_api_key():
+    """Use OPENAI_API_KEY if set, otherwise the key saved by the desktop application."""
+    import openai
+
+    if not openai.api_key:
+        openai.api_key = core.load_stored_api_key() or None
+    return bool(openai.api_key)
+
+
+def build_prompts(args, start_text, end_text, sections, filenames, model_name):
+    """Return (name, final prompt, merge id, max tokens, sources) tuples to send to a model.
+
+    With --chunk every merge that is too large for the model is split into
+    several prompts sharing a merge id.
+    """
+    if args.per_file:
+        groups = [
+            (os.path.basename(filename), [section], [filename]) for filename, section in zip(filenames, sections)
+        ]
+    else:
+        groups = [("Merged prompt", sections, filenames)]
+
+    prompts = []
+    for name, group, sources in groups:
+        chunks = plan_chunks(start_text, end_text, group, model_name) if args.chunk and group else []
+        if len(chunks) <= 1:
+            middle_text = chunks[0] if chunks else "".join(group)
+            prompts.append((name, core.build_prompt(start_text, middle_text, end_text), None, None, sources))
+            continue
+
+        merge_id = new_merge_id()
+        max_tokens = reserved_completion_tokens(model_name)
+        print(f"{name} [{model_name}]: split into {len(chunks)} prompts ({merge_id}).", file=sys.stderr)
+        for number, chunk in enumerate(chunks, start=1):
+            final_prompt = core.build_prompt(start_text, chunk, end_text)
+            prompts.append((f"{name} chunk {number}/{len(chunks)}", final_prompt, merge_id, max_tokens, sources))
+    return prompts
+
+
+def open_archive():
+    """Return the response archive, or None if SQLite cannot open it, e.g. without FTS5."""
+    try:
+        return ResponseArchive()
+    except sqlite3.Error as e:
+        print(f"Response archive unavailable: {e}", file=sys.stderr)
+        return None
+
+
+def open_journal():
+    """Return the request journal, or None if SQLite cannot open it."""
+    try:
+        return RequestJournal()
+    except sqlite3.Error as e:
+        print(f"Request journal unavailable: {e}", file=sys.stderr)
+        return None
+
+
+def select_entries(journal, entry_ids):
+    """Return the unfinished journal entries with the given ids, all of them without ids."""
+    entries = journal.unfinished()
+    if entry_ids:
+        entries = [entry for entry in entries if entry.entry_id in entry_ids]
+    return entries
+
+
+def print_unfinished(entries):
+    """Print one line per unfinished request."""
+    for entry in entries:
+        updated = datetime.fromtimestamp(entry.updated).strftime("%Y-%m-%d %H:%M:%S")
+        print(f"{entry.entry_id:>5}  {updated}  {entry.status:<9} {entry.model_name}  {entry.name}  "
+              f"{len(entry.partial)} characters received")
+        if entry.error:
+            print(f"       {entry.error}")
+
+
+def restore_jobs(journal, entries, resume):
+    """Return jobs continuing or resending journal entries, skipping entries whose prompt is missing."""
+    jobs = []
+    for entry in entries:
+        job = journal.restore_job(entry, resume=resume)
+        if job is None:
+            print(f"Skipping request {entry.entry_id}: its prompt is missing from the journal.", file=sys.stderr)
+            continue
+        jobs.append(job)
+    return jobs
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    models = args.models or ["gpt-3.5-turbo"]
+
+    if args.list_models:
+        if not configure_api_key():
+            print("No API key set. Unable to fetch models.", file=sys.stderr)
+            return 1
+        for model in core.list_models():
+            print(model)
+        return 0
+
+    if args.import_responses:
+        archive = open_archive()
+        if archive is None:
+            return 1
+        imported = archive.import_tree(args.responses_dir)
+        print(f"Imported {imported} responses from {args.responses_dir}.", file=sys.stderr)
+        return 0
+
+    if args.search is not None:
+        model = args.models[0] if args.models else None
+        archive = open_archive()
+        if archive is None:
+            return 1
+        for result in archive.search(args.search, model=model):
+            created = datetime.fromtimestamp(result.created).strftime("%Y-%m-%d %H:%M:%S")
+            print(f"{created}  {result.model}  {result.file_path}")
+            if result.snippet:
+                print(f"    {' '.join(result.snippet.split())}")
+        return 0
+
+    if args.stats:
+        print(format_request_summary(summarize_requests(Telemetry().records(REQUEST))))
+        return 0
+
+    if args.export_metrics:
+        count = Telemetry().export_csv(args.export_metrics)
+        print(f"Exported {count} request metrics to {args.export_metrics}.", file=sys.stderr)
+        return 0
+
+    if args.download_encodings:
+        try:
+            print(f"Tokenizer files stored in {tokens.download_encodings()}.", file=sys.stderr)
+        except Exception as e:
+            print(f"Error downloading the tokenizer files: {e}", file=sys.stderr)
+            return 1
+        return 0
+
+    if args.unfinished or args.discard is not None or args.resume is not None or args.resend is not None:
+        journal = open_journal()
+        if journal is None:
+            return 1
+    if args.unfinished:
+        print_unfinished(journal.unfinished())
+        return 0
+
+    if args.discard is not None:
+        entries = select_entries(journal, args.discard)
+        for entry in entries:
+            journal.discard(entry.entry_id)
+        print(f"Discarded {len(entries)} unfinished requests.", file=sys.stderr)
+        return 0
+
+    if args.resume is not None or args.resend is not None:
+        resume = args.resume is not None
+        entries = select_entries(journal, args.resume if resume else args.resend)
+        if not entries:
+            print("No unfinished requests to send.", file=sys.stderr)
+            return 0
+        if not configure_api_key():
+            print("API Key is missing or could not be loaded.", file=sys.stderr)
+            return 1
+        jobs = restore_jobs(journal, entries, resume)
+        print(f"{'Resuming' if resume else 'Resending'} {len(jobs)} unfinished requests.", file=sys.stderr)
+        return send_jobs(args, jobs, Telemetry(), journal)
+
+    filenames = expand_file_patterns(args.files, args.include or DEFAULT_INCLUDE, args.exclude or DEFAULT_EXCLUDE)
+    if args.files and not filenames:
+        print("No files matched the given patterns.", file=sys.stderr)
+        return 1
+
+    try:
+        start_text, end_text = core.load_templates(args.templates_dir)
+    except FileNotFoundError as e:
+        print(f"Error loading standard messages: {e}", file=sys.stderr)
+        return 1
+    start_text, end_text = start_text.strip(), end_text.strip()
+    try:
+        reduction = ReductionPipeline([step.strip() for step in args.reduce.split(",") if step.strip()])
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    metrics = Telemetry()
+    started = time.perf_counter()
+    files, errors = load_source_files(filenames, index=TokenIndex(), reduction=reduction)
+    metrics.record(
+        INGEST,
+        files=len(files),
+        errors=len(errors),
+        bytes=sum(len(source_file.section) for source_file in files),
+        tokens=sum(source_file.tokens for source_file in files),
+        saved_tokens=sum(source_file.original_tokens - source_file.tokens for source_file in files),
+        seconds=time.perf_counter() - started,
+    )
+    for path, error in errors:
+        print(f"Error reading {path}: {error}", file=sys.stderr)
+    if errors:
+        return 1
+    sections = [source_file.section for source_file in files]
+
+    prompts = {}
+    token_estimates = {}
+    snapshot_root = snapshot_sections = None
+    if args.fan_out:
+        if args.per_file or args.chunk or args.changes_only or len(models) < 2:
+            print("Error: --fan-out sends a single merged prompt to at least two models.", file=sys.stderr)
+            return 1
+        final_prompt = core.build_prompt(start_text, "".join(sections), end_text)
+        prompt_tokens = fanout.count_prompt_tokens(final_prompt, models)
+        fitting, skipped = fanout.split_models_by_budget(prompt_tokens, models)
+        for model, model_tokens, limit in skipped:
+            print(f"Skipping {model}: the prompt's {model_tokens} tokens exceed its limit of {limit}.", file=sys.stderr)
+        if not fitting:
+            print("Error: The prompt exceeds the token limit of every selected model.", file=sys.stderr)
+            return 1
+        models = fitting
+        for model in models:
+            prompts[model] = [("Merged prompt", final_prompt, None, None, filenames)]
+            token_estimates[model] = (prompt_tokens[model], 0)
+    if args.changes_only:
+        if args.per_file or args.chunk or len(models) > 1:
+            print("Error: --changes-only sends a single merged prompt to a single model.", file=sys.stderr)
+            return 1
+        snapshot_root = session_root(filenames)
+        snapshot_sections = {os.path.abspath(source_file.path): source_file.section for source_file in files}
+        snapshot = load_snapshot(snapshot_root)
+        if snapshot is not None:
+            middle_text = build_changes_text(snapshot_root, snapshot, snapshot_sections)
+            if middle_text is None:
+                print("No files changed since the last response.", file=sys.stderr)
+                return 0
+            final_prompt = core.build_prompt(start_text, middle_text, end_text)
+            prompt_tokens = core.count_prompt_tokens(final_prompt, models[0])
+            full_tokens = core.count_prompt_tokens(core.build_prompt(start_text, "".join(sections), end_text), models[0])
+            if prompt_tokens < full_tokens:
+                print(f"Changes only: {prompt_tokens} instead of {full_tokens} prompt tokens ({full_tokens - prompt_tokens} saved).", file=sys.stderr)
+                prompts[models[0]] = [("Changes since last response", final_prompt, None, None, filenames)]
+            else:
+                print(f"Changes need {prompt_tokens} prompt tokens, sending the full merge ({full_tokens}).", file=sys.stderr)
+        else:
+            print(f"No previous response for {snapshot_root}, sending the full merge.", file=sys.stderr)
+    for model in models:
+        if model in prompts:
+            continue
+        try:
+            prompts[model] = build_prompts(args, start_text, end_text, sections, filenames, model)
+        except ChunkPlanError as e:
+            if len(models) == 1:
+                print(f"Error: {e}", file=sys.stderr)
+                return 1
+            # One model's limit must not stop the send to the others
+            print(f"Skipping {model}: {e}", file=sys.stderr)
+    if not prompts:
+        return 1
+    saved_tokens = sum(source_file.original_tokens - source_file.tokens for source_file in files)
+    if reduction.steps and args.dry_run:
+        for source_file in files:
+            print(f"{source_file.name}: {source_file.original_tokens} -> {source_file.tokens} tokens", file=sys.stderr)
+    saved = f", {saved_tokens} saved by reduction" if reduction.steps else ""
+    print(f"Merged {len(files)} files ({sum(source_file.tokens for source_file in files)} tokens{saved}).", file=sys.stderr)
+
+    if args.dry_run:
+        for model, model_prompts in prompts.items():
+            for name, final_prompt, _, _, _ in model_prompts:
+                try:
+                    prompt_tokens, _ = core.check_prompt_budget(final_prompt, model)
+                    print(f"{name} [{model}]: {prompt_tokens} prompt tokens.", file=sys.stderr)
+                except core.PromptTooLargeError as e:
+                    print(f"{name} [{model}]: {e}", file=sys.stderr)
+                print(final_prompt)
+        return 0
+
+    if not configure_api_key():
+        print("API Key is missing or could not be loaded.", file=sys.stderr)
+        return 1
+    # Requests are still sent without the journal, they just cannot be resumed
+    journal = open_journal()
+    unfinished = journal.unfinished() if journal is not None else []
+    if unfinished:
+        print(
+            f"{len(unfinished)} earlier requests did not finish, list them with --unfinished "
+            "and continue them with --resume or --resend.",
+            file=sys.stderr,
+        )
+
+    jobs = []
+    for model, model_prompts in prompts.items():
+        for name, final_prompt, merge_id, max_tokens, sources in model_prompts:
+            jobs.append(PromptJob(
+                name,
+                final_prompt,
+                model,
+                response_number=len(jobs) + 1,
+                stream=args.stream,
+                max_tokens=max_tokens,
+                use_cache=not args.no_cache,
+                merge_id=merge_id,
+                responses_dir=args.responses_dir,
+                sources=[os.path.abspath(filename) for filename in sources],
+                token_estimate=token_estimates.get(model),
+            ))
+    return send_jobs(args, jobs, metrics, journal, snapshot_root, snapshot_sections)
+
+
+def send_jobs(args, jobs, metrics, journal, snapshot_root=None, snapshot_sections=None):
+    """Send the jobs, print their responses and return the exit code."""
+    # A single streamed response is echoed live, several are printed once complete
+    live = any(job.stream for job in jobs) and len(jobs) == 1
+
+    def report(job):
+        if job.status == dispatcher.RETRYING:
+            print(f"Request {job.job_id} ({job.name}, {job.model_name}) failed: {job.error}, retrying...", file=sys.stderr)
+        elif live and job.status == dispatcher.RUNNING and job.attempts == 1:
+            # Retries continue the answer printed so far
+            sys.stdout.write(core.format_response_header(job.response_number) + job.partial)
+            sys.stdout.flush()
+
+    def echo(job, piece):
+        sys.stdout.write(piece)
+        sys.stdout.flush()
+
+    pool = Dispatcher(
+        max_workers=max(1, args.concurrency),
+        requests_per_minute=args.rpm,
+        tokens_per_minute=args.tpm,
+        max_retries=args.max_retries,
+        cache=ResponseCache(),
+        archive=open_archive(),
+        telemetry=metrics,
+        journal=journal,
+        on_update=report,
+        on_piece=echo if live else None,
+    )
+    futures = []
+    merges = {}
+    if args.fan_out == fanout.FIRST_WINS:
+        futures = pool.submit_first_wins(jobs)
+    else:
+        for job in jobs:
+            if args.sequential and job.merge_id:
+                merges.setdefault(job.merge_id, []).append(job)
+            else:
+                futures.append(pool.submit(job))
+        for merge_jobs in merges.values():
+            futures.extend(pool.submit_sequence(merge_jobs))
+
+    exit_code = 0
+    finished = []
+    for future in as_completed(futures):
+        job = future.result()
+        finished.append(job)
+        if job.status == dispatcher.CANCELLED:
+            print(f"Request {job.job_id} ({job.name}, {job.model_name}) cancelled, another model answered first.", file=sys.stderr)
+            continue
+        if job.status == dispatcher.FAILED:
+            if live:
+                sys.stdout.write("\n")
+                sys.stdout.flush()
+            print(f"Request {job.job_id} ({job.name}, {job.model_name}): An error occurred: {job.error}", file=sys.stderr)
+            if dispatcher.is_resendable_error(job.error):
+                print(f"It is kept as unfinished request {job.journal_id}, see --unfinished.", file=sys.stderr)
+            exit_code = 1
+            continue
+        if job.cached:
+            print(f"Cache hit for {job.name} ({job.model_name}).", file=sys.stderr)
+        if live and not job.cached:
+            sys.stdout.write("\n")
+        else:
+            sys.stdout.write(core.format_response(job.response_number, job.result))
+        sys.stdout.flush()
+        print(f"GPT response for {job.name} ({job.model_name}) saved to {job.file_path}.", file=sys.stderr)
+        if job.archive_error:
+            print(f"Error archiving the response: {job.archive_error}", file=sys.stderr)
+        if snapshot_root:
+            save_snapshot(snapshot_root, Snapshot(snapshot_sections, job.result))
+
+    pool.shutdown()
+    if args.fan_out == fanout.COMPARE_ALL:
+        print(fanout.format_comparison(finished), file=sys.stderr)
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
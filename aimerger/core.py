@@ -0,0 +1,269 @@
+"""Merge, count and send pipeline shared by the GUI and the command line.
+
+Nothing in here touches Tk widgets. The openai and cryptography packages are
+imported on first use so headless runs start quickly.
+"""
+import itertools
+import os
+from datetime import datetime
+
+from aimerger.model_registry import get_model, get_registry
+from aimerger.tokens import message_frame_tokens, num_tokens_from_messages
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+TEMPLATES_DIR = os.path.join(BASE_DIR, "active_templates")
+RESPONSES_DIR = os.path.join(BASE_DIR, "Responses")
+
+# Sent after the partial answer of an interrupted request to have it continued
+CONTINUE_MESSAGE = "Your answer was cut off. Continue it exactly where it stopped, without repeating anything."
+
+
+class PromptTooLargeError(ValueError):
+    """Raised when a prompt does not fit into the selected model's token limit."""
+
+
+class StreamInterruptedError(ConnectionError):
+    """Raised when a streamed answer stops before the server finished it."""
+
+
+def get_model_max_tokens(model_name):
+    """Return the context window of a model from the model registry."""
+    return get_model(model_name).context_window
+
+
+def load_templates(templates_dir=TEMPLATES_DIR):
+    """Load the standard start and end messages from a templates directory."""
+    with open(os.path.join(templates_dir, "start_message.txt"), "r", encoding="utf-8") as f:
+        start_message = f.read()
+    with open(os.path.join(templates_dir, "end_message.txt"), "r", encoding="utf-8") as f:
+        end_message = f.read()
+    return start_message, end_message
+
+
+def decode_source(data):
+    """Decode a source file read as bytes, normalising line endings like text mode does."""
+    return data.decode("utf-8").replace("\r\n", "\n").replace("\r", "\n")
+
+
+def format_source_file(filename, file_content):
+    """Return a source file's content prefixed with its name as merged into the prompt."""
+    return f"--- {os.path.basename(filename)} ---\n{file_content}"
+
+
+def build_prompt(start_text, middle_text, end_text):
+    """Join the three message parts into the final prompt."""
+    return f"{start_text}\n{middle_text}\n{end_text}"
+
+
+def build_messages(final_prompt, partial=""):
+    """Return the chat messages sent for a final prompt.
+
+    With the partial answer of an interrupted request the model is asked to
+    continue it.
+    """
+    messages = [{"role": "system", "content": final_prompt}]
+    if partial:
+        messages.append({"role": "assistant", "content": partial})
+        messages.append({"role": "user", "content": CONTINUE_MESSAGE})
+    return messages
+
+
+def count_prompt_tokens(final_prompt, model_name, partial=""):
+    """Count the tokens of the chat messages sent for a final prompt, as the model counts them."""
+    return num_tokens_from_messages(build_messages(final_prompt, partial), model_name)
+
+
+def prompt_frame_tokens(model_name):
+    """Return the tokens the chat messages add around a final prompt."""
+    return message_frame_tokens(model_name, "system")
+
+
+def check_prompt_budget(final_prompt, model_name, token_estimate=None, partial=""):
+    """Return (prompt_tokens, max_tokens) for a prompt or raise PromptTooLargeError.
+
+    max_tokens is the model's output limit, lowered so that prompt and
+    completion together fit into its context window. token_estimate is an
+    optional (tokens, margin) pair. The prompt is only counted with the
+    model's encoding when the estimate does not tell whether it fits. A
+    partial answer to be continued is sent with the prompt and counted too.
+    """
+    model = get_model(model_name)
+    context_window = model.context_window
+
+    if token_estimate and not partial and not (
+        token_estimate[0] - token_estimate[1] < context_window <= token_estimate[0] + token_estimate[1]
+    ):
+        total_prompt_tokens, margin = token_estimate
+    else:
+        total_prompt_tokens = count_prompt_tokens(final_prompt, model_name, partial)
+        margin = 0
+
+    if total_prompt_tokens >= context_window:
+        raise PromptTooLargeError("Prompt token count exceeds the model's limit.")
+    return total_prompt_tokens, min(model.max_output_tokens, context_window - total_prompt_tokens - margin)
+
+
+def create_completion(final_prompt, model_name, max_tokens, partial=""):
+    """Send the prompt and return the content of the complete answer, or its continuation of partial."""
+    import openai
+
+    response = openai.ChatCompletion.create(
+        model=model_name,
+        messages=build_messages(final_prompt, partial),
+        max_tokens=max_tokens,
+    )
+    return response["choices"][0]["message"]["content"]
+
+
+def stream_completion(final_prompt, model_name, max_tokens, on_connected=None, partial=""):
+    """Send the prompt and yield the answer's content pieces as they arrive.
+
+    on_connected is called once the response headers were received. Raises
+    StreamInterruptedError when the connection drops or the stream ends
+    before the server reported why the answer finished.
+    """
+    import openai
+
+    response = openai.ChatCompletion.create(
+        model=model_name,
+        messages=build_messages(final_prompt, partial),
+        max_tokens=max_tokens,
+        stream=True,
+    )
+    if on_connected:
+        on_connected()
+    finished = False
+    try:
+        for chunk in response:
+            choice = chunk["choices"][0]
+            content = choice["delta"].get("content")
+            if content:
+                yield content
+            if choice.get("finish_reason"):
+                finished = True
+    except OSError as e:
+        # The errors of requests are OSErrors, e.g. a connection reset while reading
+        raise StreamInterruptedError(f"The answer stream was interrupted: {e}") from e
+    if not finished:
+        raise StreamInterruptedError("The answer stream ended before the answer was complete.")
+
+
+def list_models():
+    """Fetch the ids of the available chat models that are listed in the model registry."""
+    import openai
+
+    response = openai.Model.list()
+    allowed_models = set(get_registry().chat_models())
+    models = [model["id"] for model in response["data"] if model["id"] in allowed_models]
+    models.sort()
+    return models
+
+
+def format_response_header(response_number):
+    """Return the header line that starts every response."""
+    return f"--- Response {response_number} ---\n"
+
+
+def format_response(response_number, content):
+    """Return a response as it is shown and saved."""
+    return f"{format_response_header(response_number)}{content}\n"
+
+
+def get_response_file_path(model_name, responses_dir=RESPONSES_DIR, subdir=None):
+    """Create a new, empty response file in today's responses directory and return its path.
+
+    Responses belonging together, like the chunks of one merge, are grouped in
+    subdir. A numeric suffix is added when several responses for the same
+    model are saved within the same second.
+    """
+    day_dir = os.path.join(responses_dir, datetime.now().strftime("%Y-%m-%d"), subdir or "")
+    os.makedirs(day_dir, exist_ok=True)
+
+    timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    suffix = ""
+    for attempt in itertools.count(2):
+        file_path = os.path.join(day_dir, f"{timestamp}-{model_name}{suffix}-Response.txt")
+        try:
+            # Opening with "x" reserves the name even when other threads save concurrently
+            with open(file_path, "x", encoding="utf-8"):
+                return file_path
+        except FileExistsError:
+            suffix = f"-{attempt}"
+
+
+def save_response(response_text, model_name, responses_dir=RESPONSES_DIR):
+    """Save a response to a new file and return its path."""
+    file_path = get_response_file_path(model_name, responses_dir)
+    with open(file_path, "w", encoding="utf-8") as f:
+        f.write(response_text)
+    return file_path
+
+
+def save_streamed_response(file_path, response_number, pieces, on_piece=None, partial=""):
+    """Write streamed content pieces to file_path as they arrive.
+
+    Every piece is flushed right away so a partial answer survives a crash.
+    The pieces of a continued answer follow its partial content. on_piece is
+    called as on_piece(piece, received) for every content piece, where
+    received is the number of pieces written so far. Returns the number of
+    content pieces received.
+    """
+    received = 0
+    with open(file_path, "w", encoding="utf-8") as f:
+        f.write(format_response_header(response_number))
+        f.write(partial)
+        f.flush()
+        for piece in pieces:
+            received += 1
+            f.write(piece)
+            f.flush()
+            if on_piece:
+                on_piece(piece, received)
+        f.write("\n")
+    return received
+
+
+def send_prompt(final_prompt, model_name, max_tokens, file_path, response_number, stream=False, on_piece=None,
+                on_connected=None, partial=""):
+    """Send a prompt, save the response to file_path and return the response content.
+
+    With stream=True the content is written to the file and passed to on_piece
+    as it arrives, otherwise it is saved once the complete answer is received.
+    on_connected is called when a streamed response starts to arrive. With the
+    partial answer of an interrupted request only its continuation is
+    requested, the saved and returned content starts with partial.
+    """
+    if not stream:
+        content = partial + create_completion(final_prompt, model_name, max_tokens, partial)
+        with open(file_path, "w", encoding="utf-8") as f:
+            f.write(format_response(response_number, content))
+        return content
+
+    received_pieces = []
+
+    def collect(piece, received):
+        received_pieces.append(piece)
+        if on_piece:
+            on_piece(piece, received)
+
+    pieces = stream_completion(final_prompt, model_name, max_tokens, on_connected, partial)
+    save_streamed_response(file_path, response_number, pieces, collect, partial)
+    return partial + "".join(received_pieces)
+
+
+def load_stored_api_key(directory="."):
+    """Decrypt the API key saved by the GUI, or return an empty string."""
+    from cryptography.fernet import Fernet, InvalidToken
+
+    try:
+        with open(os.path.join(directory, "encryption_key.key"), "rb") as f:
+            key = f.read()
+        with open(os.path.join(directory, "api_key.txt"), "rb") as f:
+            encrypted_api_key = f.read()
+    except FileNotFoundError:
+        return ""
+
+    try:
+        return Fernet(key).decrypt(encrypted_api_key).decode()
+    except InvalidToken:
+        return ""
@@ -0,0 +1,133 @@
+"""Bounded, thread-safe debug log.
+
+Entries are kept in a ring buffer, so memory stays bounded no matter how long
+the application runs. Any thread may log; the GUI drains new entries on the Tk
+thread and appends them to its widget. Huge entries such as full prompts are
+truncated, with the full text written next to the log file when a file sink
+is enabled.
+"""
+import collections
+import itertools
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+
+from aimerger import core
+
+LOG_DIR = os.path.join(core.BASE_DIR, "Logs")
+DEFAULT_MAX_ENTRIES = 5000
+DEFAULT_MAX_ENTRY_CHARS = 4000
+DEFAULT_MAX_FILE_BYTES = 5 * 1024 * 1024
+DEFAULT_BACKUP_COUNT = 3
+MAX_STORED_ENTRIES = 200  # Full texts of truncated entries kept next to the log file
+
+LEVELS = {
+    "DEBUG": logging.DEBUG,
+    "INFO": logging.INFO,
+    "WARNING": logging.WARNING,
+    "ERROR": logging.ERROR,
+}
+
+
+class LogEntry:
+    """A single log message."""
+
+    def __init__(self, level, message, created):
+        self.level = level
+        self.message = message
+        self.created = created
+
+    def format(self):
+        """Return the entry as a line of the log."""
+        timestamp = time.strftime("%H:%M:%S", time.localtime(self.created))
+        return f"{timestamp} {logging.getLevelName(self.level):<7} {self.message}"
+
+
+class DebugLog:
+    """Ring buffer of log entries with a queue of entries not yet drained."""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, max_entry_chars=DEFAULT_MAX_ENTRY_CHARS):
+        self.max_entry_chars = max_entry_chars
+        self._entries = collections.deque(maxlen=max_entries)
+        self._pending = queue.Queue()
+        self._lock = threading.Lock()
+        self._file_handler = None
+        self._attachment_ids = itertools.count(1)
+        self._attachments = collections.deque()
+
+    def set_file_sink(self, path, max_bytes=DEFAULT_MAX_FILE_BYTES, backup_count=DEFAULT_BACKUP_COUNT):
+        """Also write entries to a rotating log file, or stop doing so if path is None."""
+        with self._lock:
+            if self._file_handler:
+                self._file_handler.close()
+                self._file_handler = None
+            self._attachments.clear()
+            if path:
+                os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+                self._file_handler = logging.handlers.RotatingFileHandler(
+                    path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8"
+                )
+                directory = self._attachment_dir()
+                if os.path.isdir(directory):
+                    self._attachments.extend(
+                        os.path.join(directory, name) for name in sorted(os.listdir(directory))
+                    )
+
+    def _attachment_dir(self):
+        return os.path.join(os.path.dirname(self._file_handler.baseFilename), "entries")
+
+    def _shorten(self, message, created):
+        """Truncate a huge message, keeping the full text in a file next to the log file."""
+        if len(message) <= self.max_entry_chars:
+            return message
+        omitted = len(message) - self.max_entry_chars
+        note = f"[{omitted} more characters]"
+        if self._file_handler:
+            directory = self._attachment_dir()
+            os.makedirs(directory, exist_ok=True)
+            name = time.strftime("%Y%m%d-%H%M%S", time.localtime(created))
+            path = os.path.join(directory, f"{name}-{next(self._attachment_ids):06d}.txt")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(message)
+            self._attachments.append(path)
+            while len(self._attachments) > MAX_STORED_ENTRIES:
+                try:
+                    os.remove(self._attachments.popleft())
+                except OSError:
+                    pass
+            note = f"[{omitted} more characters, full text in {path}]"
+        return f"{message[:self.max_entry_chars]}... {note}"
+
+    def log(self, message, level=logging.INFO):
+        """Add an entry. Safe to call from any thread."""
+        created = time.time()
+        with self._lock:
+            entry = LogEntry(level, self._shorten(str(message), created), created)
+            self._entries.append(entry)
+            if self._file_handler:
+                record = logging.LogRecord("aimerger", level, "", 0, entry.format(), None, None)
+                self._file_handler.emit(record)
+        self._pending.put(entry)
+
+    def drain(self):
+        """Return the entries logged since the last drain."""
+        entries = []
+        while True:
+            try:
+                entries.append(self._pending.get_nowait())
+            except queue.Empty:
+                return entries
+
+    def entries(self, min_level=logging.DEBUG):
+        """Return the buffered entries at or above min_level, oldest first."""
+        with self._lock:
+            return [entry for entry in self._entries if entry.level >= min_level]
+
+    def clear(self):
+        """Remove all buffered entries."""
+        with self._lock:
+            self._entries.clear()
+        self.drain()
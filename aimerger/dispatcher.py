@@ -0,0 +1,528 @@
+"""Concurrent, rate limited sending of several prompts at once.
+
+A Dispatcher runs PromptJobs on a bounded thread pool. Jobs are first looked
+up in the optional response cache, and finished ones are added to the
+optional response archive and recorded by the optional telemetry. Before every attempt a job reserves one
+request and its prompt plus completion tokens from a RateLimiter, and from
+the model's own one if the model registry lists rate limits for it. Rate
+limit (429) or server (5xx) errors are retried with exponential backoff, a
+streamed answer cut off by a dropped connection is continued where it stopped.
+Jobs can be cancelled, e.g. once another model answered the same prompt. With
+an optional request journal every job is journaled before it is sent.
+"""
+import itertools
+import os
+import queue
+import random
+import threading
+import time
+from concurrent.futures import Future
+
+from aimerger import core, telemetry
+from aimerger.archive import prompt_hash
+from aimerger.model_registry import get_model
+from aimerger.response_cache import cache_key
+from aimerger.tokens import count_text_tokens, get_encoding
+
+# Job states
+QUEUED = "queued"
+RUNNING = "running"
+RETRYING = "retrying"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+# Errors without an HTTP status that are worth another attempt
+RETRYABLE_ERROR_NAMES = {
+    "APIConnectionError", "Timeout", "TryAgain", "ServiceUnavailableError", "StreamInterruptedError",
+}
+
+
+class JobCancelled(Exception):
+    """Raised in a worker to stop a job that was cancelled while running."""
+
+
+class PromptJob:
+    """A single prompt request and its progress.
+
+    partial holds the answer received before the current attempt, which the
+    attempt continues, and pieces the content received by the attempt.
+    """
+
+    _ids = itertools.count(1)
+
+    def __init__(self, name, final_prompt, model_name, response_number=1, stream=False,
+                 max_tokens=None, use_cache=True, merge_id=None, responses_dir=core.RESPONSES_DIR,
+                 token_estimate=None, sources=(), partial="", journal_id=None):
+        self.job_id = next(PromptJob._ids)
+        self.name = name
+        self.final_prompt = final_prompt
+        self.model_name = model_name
+        self.max_tokens = max_tokens
+        self.prompt_tokens = None
+        self.token_estimate = token_estimate
+        self.response_number = response_number
+        self.stream = stream
+        self.use_cache = use_cache
+        self.merge_id = merge_id
+        self.responses_dir = responses_dir
+        self.sources = list(sources)  # Paths of the files merged into the prompt
+        self.partial = partial
+        self.pieces = []
+        self.journal_id = journal_id
+
+        self.status = QUEUED
+        self.attempts = 0
+        self.received_tokens = 0
+        self.result = None
+        self.error = None
+        self.file_path = None
+        self.cache_key = None
+        self.cached = False
+        self.archive_error = None
+        self.journal_error = None
+        self.cancel_event = threading.Event()
+        self.completion_tokens = None
+        self.count_seconds = None
+        self.submitted_at = time.monotonic()
+        self.started_at = None
+        self.attempt_started_at = None
+        self.connected_at = None
+        self.first_piece_at = None
+        self.finished_at = None
+
+    @property
+    def cancelled(self):
+        """True once the job was cancelled."""
+        return self.cancel_event.is_set()
+
+    @property
+    def elapsed(self):
+        """Seconds since the first attempt started, or None while queued."""
+        if self.started_at is None:
+            return None
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+
+def prepare_prompt_job(job):
+    """Count the job's prompt tokens and check them against the model's limit.
+
+    Jobs for models that cannot stream are sent without streaming. A job
+    continuing a partial answer sends it with the prompt, so it asks for at
+    most the completion tokens the context window has left after both.
+    """
+    if job.stream and not get_model(job.model_name).streaming:
+        job.stream = False
+    started = time.perf_counter()
+    prompt_tokens, max_tokens = core.check_prompt_budget(
+        job.final_prompt, job.model_name, job.token_estimate, job.partial
+    )
+    job.count_seconds = time.perf_counter() - started
+    job.prompt_tokens = prompt_tokens
+    if job.max_tokens is None:
+        job.max_tokens = max_tokens
+    elif job.partial:
+        job.max_tokens = min(job.max_tokens, max_tokens)
+
+
+def send_prompt_job(job, on_piece=None):
+    """Send a job's prompt and save the response, reusing its file on retries."""
+    if job.file_path is None:
+        job.file_path = core.get_response_file_path(job.model_name, job.responses_dir, job.merge_id)
+
+    def track(piece, received):
+        if job.cancelled:
+            raise JobCancelled()
+        job.pieces.append(piece)
+        job.received_tokens = received
+        if received == 1:
+            job.first_piece_at = time.monotonic()
+        if on_piece:
+            on_piece(job, piece)
+
+    def connected():
+        job.connected_at = time.monotonic()
+
+    return core.send_prompt(
+        job.final_prompt,
+        job.model_name,
+        job.max_tokens,
+        job.file_path,
+        job.response_number,
+        stream=job.stream,
+        on_piece=track,
+        on_connected=connected,
+        partial=job.partial,
+    )
+
+
+def save_cached_job_response(job, content):
+    """Save a response served from the cache like a freshly received one."""
+    job.file_path = core.get_response_file_path(job.model_name, job.responses_dir, job.merge_id)
+    with open(job.file_path, "w", encoding="utf-8") as f:
+        f.write(core.format_response(job.response_number, content))
+
+
+def request_metrics(job):
+    """Return the telemetry fields of a finished job.
+
+    Connect time, time to first token and latency are measured from the start
+    of the last attempt. Without streaming the first token arrives with the
+    complete answer.
+    """
+    def since_attempt(moment):
+        if moment is None or job.attempt_started_at is None:
+            return None
+        return moment - job.attempt_started_at
+
+    latency = since_attempt(job.finished_at) if not job.cached else job.elapsed
+    first_token = since_attempt(job.first_piece_at if job.stream else job.finished_at)
+    tokens_per_second = None
+    if job.completion_tokens and not job.cached:
+        generation_started = job.first_piece_at if job.stream else job.attempt_started_at
+        if generation_started is not None and job.finished_at > generation_started:
+            tokens_per_second = job.completion_tokens / (job.finished_at - generation_started)
+    return {
+        "job_id": job.job_id,
+        "name": job.name,
+        "model": job.model_name,
+        "status": job.status,
+        "error": type(job.error).__name__ if job.error else None,
+        "cached": job.cached,
+        "stream": job.stream,
+        "retries": max(job.attempts - 1, 0),
+        "queue_seconds": job.started_at - job.submitted_at if job.started_at is not None else None,
+        "count_seconds": job.count_seconds,
+        "connect_seconds": since_attempt(job.connected_at),
+        "ttft_seconds": first_token if job.status == DONE else None,
+        "latency_seconds": latency,
+        "total_seconds": job.elapsed,
+        "prompt_tokens": job.prompt_tokens,
+        "completion_tokens": job.completion_tokens,
+        "tokens_per_second": tokens_per_second,
+    }
+
+
+def is_resendable_error(error):
+    """Return False for errors that sending the request again cannot fix, like a prompt over the model's limit."""
+    return not isinstance(error, core.PromptTooLargeError)
+
+
+def is_retryable_error(error):
+    """Return True for rate limit, server and connection errors."""
+    status = getattr(error, "http_status", None)
+    if status is not None:
+        return status == 429 or status >= 500
+    return type(error).__name__ in RETRYABLE_ERROR_NAMES
+
+
+def get_retry_after(error):
+    """Return the Retry-After delay in seconds sent with an error, if any."""
+    headers = getattr(error, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after") or headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimiter:
+    """Token bucket limiter for requests per minute and tokens per minute.
+
+    Each bucket holds at most one minute's allowance and refills continuously.
+    A limit of None disables that bucket.
+    """
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None, clock=time.monotonic):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._clock = clock
+        self._condition = threading.Condition()
+        self._requests = float(requests_per_minute or 0)
+        self._tokens = float(tokens_per_minute or 0)
+        self._updated = clock()
+
+    def _refill(self):
+        now = self._clock()
+        elapsed = now - self._updated
+        self._updated = now
+        if self.requests_per_minute:
+            self._requests = min(
+                self.requests_per_minute, self._requests + elapsed * self.requests_per_minute / 60
+            )
+        if self.tokens_per_minute:
+            self._tokens = min(
+                self.tokens_per_minute, self._tokens + elapsed * self.tokens_per_minute / 60
+            )
+
+    def _wait_time(self, tokens):
+        wait = 0.0
+        if self.requests_per_minute and self._requests < 1:
+            wait = max(wait, (1 - self._requests) * 60 / self.requests_per_minute)
+        if self.tokens_per_minute and self._tokens < tokens:
+            wait = max(wait, (tokens - self._tokens) * 60 / self.tokens_per_minute)
+        return wait
+
+    def acquire(self, tokens=0):
+        """Block until one request and the given number of tokens are available."""
+        if self.tokens_per_minute:
+            # A request larger than the whole budget only waits for a full bucket
+            tokens = min(tokens, self.tokens_per_minute)
+        with self._condition:
+            while True:
+                self._refill()
+                wait = self._wait_time(tokens)
+                if wait <= 0:
+                    break
+                self._condition.wait(wait)
+            if self.requests_per_minute:
+                self._requests -= 1
+            if self.tokens_per_minute:
+                self._tokens -= tokens
+
+
+class Dispatcher:
+    """Run prompt jobs on a bounded pool of daemon worker threads with rate limiting and retries.
+
+    The optional cache, archive, telemetry and journal see every job the pool runs.
+    """
+
+    def __init__(self, max_workers=4, requests_per_minute=None, tokens_per_minute=None,
+                 max_retries=5, backoff_base=1.0, backoff_max=60.0, cache=None, archive=None,
+                 telemetry=None, journal=None,
+                 prepare=prepare_prompt_job, send=send_prompt_job, on_update=None, on_piece=None):
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+        self._model_limiters = {}
+        self._model_limiters_lock = threading.Lock()
+        self.cache = cache
+        self.archive = archive
+        self.telemetry = telemetry
+        self.journal = journal
+        self._prepare = prepare
+        self._send = send
+        self._on_update = on_update
+        self._on_piece = on_piece
+        self._queue = queue.Queue()
+        self._workers = []
+        for index in range(max_workers):
+            worker = threading.Thread(target=self._work, name=f"prompt-{index + 1}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def submit(self, job):
+        """Queue a job and return a future that resolves to the finished job."""
+        future = Future()
+        self._set_status(job, QUEUED)
+        self._queue.put((job, future))
+        return future
+
+    def submit_sequence(self, jobs):
+        """Queue jobs that run one after another and return their futures.
+
+        Each job is handed to the workers once the previous one has finished,
+        whether it succeeded or not.
+        """
+        futures = [Future() for _ in jobs]
+        for job in jobs:
+            self._set_status(job, QUEUED)
+
+        def enqueue(index):
+            if index < len(jobs):
+                self._queue.put((jobs[index], futures[index]))
+                futures[index].add_done_callback(lambda _: enqueue(index + 1))
+
+        enqueue(0)
+        return futures
+
+    def submit_first_wins(self, jobs):
+        """Queue jobs racing for the same answer and return their futures.
+
+        The first job to finish successfully wins, the others are cancelled.
+        """
+        futures = [self.submit(job) for job in jobs]
+
+        def cancel_others(future):
+            winner = future.result()
+            if winner.status == DONE:
+                for job in jobs:
+                    if job is not winner:
+                        self.cancel(job)
+
+        for future in futures:
+            future.add_done_callback(cancel_others)
+        return futures
+
+    def cancel(self, job):
+        """Cancel a job that has not finished yet.
+
+        A queued job is dropped when its turn comes, a streamed answer stops at
+        its next piece, and a plain answer is discarded once it arrives. The
+        response file of a cancelled job is removed.
+        """
+        job.cancel_event.set()
+
+    def model_limiter(self, model_name):
+        """Return the RateLimiter for a model's own limits from the model registry, or None."""
+        with self._model_limiters_lock:
+            if model_name not in self._model_limiters:
+                model = get_model(model_name)
+                limiter = None
+                if model.requests_per_minute or model.tokens_per_minute:
+                    limiter = RateLimiter(model.requests_per_minute, model.tokens_per_minute)
+                self._model_limiters[model_name] = limiter
+            return self._model_limiters[model_name]
+
+    def retry_delay(self, attempt, error=None):
+        """Exponential backoff with jitter, honouring a server supplied Retry-After."""
+        retry_after = get_retry_after(error)
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max)
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1))
+        return delay * random.uniform(0.5, 1.0)
+
+    def _set_status(self, job, status):
+        job.status = status
+        if self.journal is not None:
+            self._write_journal(job)
+        if self._on_update:
+            self._on_update(job)
+
+    def _write_journal(self, job):
+        try:
+            if job.status == QUEUED:
+                self.journal.begin(job)
+            elif job.status in (DONE, CANCELLED):
+                self.journal.finish(job)
+            elif job.status == FAILED:
+                self.journal.finish(job, keep=is_resendable_error(job.error))
+            else:
+                self.journal.update(job)
+        except Exception as e:
+            job.journal_error = e
+
+    def _handle_piece(self, job, piece):
+        if self.journal is not None:
+            try:
+                self.journal.save_partial(job)
+            except Exception as e:
+                job.journal_error = e
+        if self._on_piece:
+            self._on_piece(job, piece)
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            job, future = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            if job.cancelled:
+                future.set_result(self._finish(job, CANCELLED))
+            else:
+                future.set_result(self._run(job))
+
+    def _finish(self, job, status, error=None):
+        job.error = error
+        job.finished_at = time.monotonic()
+        job.status = status
+        if status == DONE and job.result:
+            job.completion_tokens = count_text_tokens(get_encoding(job.model_name), job.result)
+        if status == DONE and self.archive is not None:
+            self._archive(job)
+        if status == CANCELLED and job.file_path:
+            try:
+                os.remove(job.file_path)
+            except OSError:
+                pass
+        if self.telemetry is not None:
+            self.telemetry.record(telemetry.REQUEST, **request_metrics(job))
+        self._set_status(job, status)
+        return job
+
+    def _archive(self, job):
+        try:
+            self.archive.add(
+                job.result,
+                job.model_name,
+                file_path=job.file_path,
+                name=job.name,
+                prompt_hash=prompt_hash(job.final_prompt),
+                prompt_tokens=job.prompt_tokens,
+                completion_tokens=job.completion_tokens,
+                latency=job.elapsed,
+                sources=job.sources,
+            )
+        except Exception as e:
+            job.archive_error = e
+
+    def _run(self, job):
+        job.started_at = time.monotonic()
+        try:
+            self._prepare(job)
+        except Exception as e:
+            return self._finish(job, FAILED, e)
+
+        if self.cache is not None:
+            job.cache_key = cache_key(job.final_prompt, job.model_name, job.max_tokens)
+            content = self.cache.get(job.cache_key) if job.use_cache else None
+            if content is not None:
+                try:
+                    save_cached_job_response(job, content)
+                except Exception as e:
+                    return self._finish(job, FAILED, e)
+                job.result = content
+                job.cached = True
+                # The cached answer is complete, nothing is continued
+                job.partial = ""
+                return self._finish(job, DONE)
+
+        model_limiter = self.model_limiter(job.model_name)
+        while True:
+            # The model's own limit first, so waiting for it does not hold back other models
+            if model_limiter is not None:
+                model_limiter.acquire(job.prompt_tokens + job.max_tokens)
+            self.limiter.acquire(job.prompt_tokens + job.max_tokens)
+            if job.cancelled:
+                return self._finish(job, CANCELLED)
+            job.attempts += 1
+            job.received_tokens = 0
+            job.pieces = []
+            job.attempt_started_at = time.monotonic()
+            job.connected_at = job.first_piece_at = None
+            self._set_status(job, RUNNING)
+
+            try:
+                job.result = self._send(job, self._handle_piece)
+            except Exception as e:
+                if job.cancelled:
+                    return self._finish(job, CANCELLED)
+                if job.pieces:
+                    # Continue the answer received so far instead of starting over
+                    job.partial += "".join(job.pieces)
+                    job.pieces = []
+                    try:
+                        self._prepare(job)
+                    except Exception as prepare_error:
+                        return self._finish(job, FAILED, prepare_error)
+                if job.attempts <= self.max_retries and is_retryable_error(e):
+                    job.error = e
+                    self._set_status(job, RETRYING)
+                    job.cancel_event.wait(self.retry_delay(job.attempts, e))
+                    continue
+                return self._finish(job, FAILED, e)
+
+            # A resumed answer is stitched from several sends, only whole answers are cached
+            if self.cache is not None and job.result and not job.partial:
+                self.cache.put(job.cache_key, job.model_name, job.result)
+            if job.cancelled:
+                return self._finish(job, CANCELLED)
+            return self._finish(job, DONE)
+
+    def shutdown(self):
+        """Let the workers exit once the queued jobs are done."""
+        for _ in self._workers:
+            self._queue.put(None)
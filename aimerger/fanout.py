@@ -0,0 +1,70 @@
+"""Sending one prompt to several models at once.
+
+In first-wins mode the first complete answer is used and the requests to the
+other models are cancelled, in compare-all mode every model answers and the
+results are compared by latency and token usage. Models whose token limit the
+prompt exceeds are skipped instead of failing the whole send. The prompt is
+encoded once per tokenizer, not once per model.
+"""
+from aimerger import core, dispatcher
+from aimerger.tokens import count_text_tokens, get_encoding
+
+FIRST_WINS = "first-wins"
+COMPARE_ALL = "compare-all"
+MODES = (FIRST_WINS, COMPARE_ALL)
+
+
+def count_prompt_tokens(final_prompt, models):
+    """Return the prompt tokens of a final prompt per model, as each model counts them."""
+    counts = {}
+    content_tokens = {}  # Encoding name -> tokens of the prompt
+    for model_name in models:
+        encoding = get_encoding(model_name)
+        if encoding.name not in content_tokens:
+            content_tokens[encoding.name] = count_text_tokens(encoding, final_prompt)
+        counts[model_name] = content_tokens[encoding.name] + core.prompt_frame_tokens(model_name)
+    return counts
+
+
+def split_models_by_budget(prompt_tokens, models):
+    """Return (fitting models, [(skipped model, prompt tokens, its context window)]).
+
+    prompt_tokens maps every model to the prompt's tokens as returned by
+    count_prompt_tokens. A model fits when the prompt leaves room for at least
+    one completion token.
+    """
+    fitting, skipped = [], []
+    for model_name in models:
+        limit = core.get_model_max_tokens(model_name)
+        if prompt_tokens[model_name] >= limit:
+            skipped.append((model_name, prompt_tokens[model_name], limit))
+        else:
+            fitting.append(model_name)
+    return fitting, skipped
+
+
+def format_job_summary(job):
+    """Return a job's model, state, latency and token usage on one line."""
+    parts = [job.model_name, "cached" if job.cached else job.status]
+    if job.elapsed is not None:
+        parts.append(f"{job.elapsed:.1f}s")
+    if job.prompt_tokens is not None:
+        parts.append(f"{job.prompt_tokens} prompt tokens")
+    if job.completion_tokens is not None:
+        parts.append(f"{job.completion_tokens} completion tokens")
+    if job.status == dispatcher.FAILED and job.error:
+        parts.append(str(job.error))
+    return ", ".join(parts)
+
+
+def format_comparison(jobs):
+    """Return a table comparing the finished jobs of a compare-all send, fastest first."""
+    lines = [f"{'Model':<28}{'status':>10}{'seconds':>9}{'prompt':>9}{'completion':>12}"]
+    for job in sorted(jobs, key=lambda job: (job.status != dispatcher.DONE, job.elapsed or 0)):
+        lines.append(
+            f"{job.model_name:<28}{'cached' if job.cached else job.status:>10}"
+            f"{'' if job.elapsed is None else f'{job.elapsed:.2f}':>9}"
+            f"{'' if job.prompt_tokens is None else job.prompt_tokens:>9}"
+            f"{'' if job.completion_tokens is None else job.completion_tokens:>12}"
+        )
+    return "\n".join(lines)
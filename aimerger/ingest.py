@@ -0,0 +1,159 @@
+"""Parallel loading of the source files of a merge.
+
+Files are found with include and exclude globs, read in bulk on a thread pool
+and token counted while they load, so the caller only has to show the result.
+With a TokenIndex, unchanged files are neither read nor encoded again. An
+optional ReductionPipeline shrinks the files before they are merged.
+"""
+import fnmatch
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from aimerger import core
+from aimerger.tokens import count_text_tokens, get_encoding
+
+DEFAULT_INCLUDE = ("*.cs",)
+DEFAULT_EXCLUDE = ("bin/*", "obj/*", ".git/*", ".vs/*")
+READ_WORKERS = 8
+
+
+class SourceFile:
+    """A loaded source file with its merged prompt section and token count.
+
+    original_tokens is the count before the section was reduced.
+    """
+
+    def __init__(self, path, section, tokens, original_tokens=None):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.section = section
+        self.tokens = tokens
+        self.original_tokens = tokens if original_tokens is None else original_tokens
+
+    @property
+    def content(self):
+        """The file content without the section header."""
+        return self.section.split("\n", 1)[1]
+
+
+def split_patterns(text):
+    """Split a ';' or ',' separated list of glob patterns."""
+    return [pattern.strip() for pattern in text.replace(",", ";").split(";") if pattern.strip()]
+
+
+def _matches(relative_path, patterns):
+    """Match a path relative to the search root, or its last component, against globs.
+
+    Directory paths end with "/" so that a pattern like "bin/*" matches them.
+    """
+    name = relative_path[relative_path.rstrip("/").rfind("/") + 1:]
+    return any(
+        fnmatch.fnmatch(relative_path, pattern) or fnmatch.fnmatch(name, pattern)
+        for pattern in patterns
+    )
+
+
+def find_source_files(root, include=DEFAULT_INCLUDE, exclude=DEFAULT_EXCLUDE):
+    """Return the sorted files below root matching include but not exclude.
+
+    Patterns are matched against paths relative to root using forward slashes,
+    and against their last component. Directories matched by an exclude pattern such
+    as "bin/*" are not descended into.
+    """
+    found = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        relative_dir = os.path.relpath(dirpath, root).replace(os.sep, "/")
+        prefix = "" if relative_dir == "." else relative_dir + "/"
+        dirnames[:] = [
+            dirname for dirname in dirnames
+            if not _matches(f"{prefix}{dirname}/", exclude)
+        ]
+        for filename in filenames:
+            relative_path = prefix + filename
+            if _matches(relative_path, include) and not _matches(relative_path, exclude):
+                found.append(os.path.join(dirpath, filename))
+    found.sort()
+    return found
+
+
+def read_source_file(path):
+    """Read a file in one go, normalising line endings like text mode does."""
+    with open(path, "rb") as f:
+        return core.decode_source(f.read())
+
+
+def _count_section(path, section, digest, encoding, index, index_key):
+    """Count a section's tokens, using the index entry of path under index_key if it matches digest."""
+    if index is None:
+        return count_text_tokens(encoding, section)
+    tokens = index.get_tokens(path, digest, index_key)
+    if tokens is None:
+        token_ids = encoding.encode(section, disallowed_special=())
+        index.put_tokens(path, digest, index_key, token_ids)
+        tokens = len(token_ids)
+    return tokens
+
+
+def _load(path, encoding, index):
+    if index is None:
+        section = core.format_source_file(path, read_source_file(path))
+        return SourceFile(path, section, count_text_tokens(encoding, section))
+
+    content, digest = index.read(path)
+    section = core.format_source_file(path, content)
+    return SourceFile(path, section, _count_section(path, section, digest, encoding, index, encoding.name))
+
+
+def _reduce(source_file, content, encoding, index, index_key):
+    """Return the file with its reduced content, or unchanged if that does not save tokens."""
+    if content == source_file.content:
+        return source_file
+    section = core.format_source_file(source_file.path, content)
+    digest = hashlib.sha256(section.encode("utf-8")).hexdigest()
+    tokens = _count_section(source_file.path, section, digest, encoding, index, index_key)
+    if tokens >= source_file.tokens:
+        return source_file
+    return SourceFile(source_file.path, section, tokens, source_file.tokens)
+
+
+def load_source_files(filenames, max_workers=READ_WORKERS, on_progress=None, index=None, reduction=None,
+                      encoding=None):
+    """Read and token count files in parallel, with encoding or the default one.
+
+    on_progress(done, total) is called from the worker threads after every
+    file. If a TokenIndex is given, contents and counts of unchanged files are
+    taken from it. With a ReductionPipeline the files are reduced in order
+    after loading and recounted, keeping a file's original content where the
+    reduction saves no tokens. Returns (files, errors): the loaded SourceFiles
+    in the order of filenames and (path, exception) pairs for files that could
+    not be read.
+    """
+    filenames = list(filenames)
+    encoding = encoding or get_encoding()
+    results = [None] * len(filenames)
+    errors = []
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest") as executor:
+        futures = {
+            executor.submit(_load, path, encoding, index): position
+            for position, path in enumerate(filenames)
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            position = futures[future]
+            try:
+                results[position] = future.result()
+            except (OSError, UnicodeDecodeError) as e:
+                errors.append((filenames[position], e))
+            if on_progress:
+                on_progress(done, len(filenames))
+
+        files = [source_file for source_file in results if source_file is not None]
+        if reduction is not None and reduction.steps:
+            index_key = f"{encoding.name}|{reduction.key}"
+            contents = reduction.run(source_file.content for source_file in files)
+            files = list(executor.map(
+                lambda item: _reduce(item[0], item[1], encoding, index, index_key), zip(files, contents)
+            ))
+
+    return files, errors
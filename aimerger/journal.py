@@ -0,0 +1,228 @@
+"""Write-ahead journal of the requests sent to the API.
+
+Every request is journaled with its prompt, model and parameters when it is
+queued, before anything is sent. Its state is updated as it runs and the
+answer streamed so far is saved at most once per flush interval; the response
+file receives every piece as it arrives. Finished requests are removed again,
+so whatever the journal holds after the application was closed, crashed or
+lost its connection during a long answer can be resumed from its partial
+answer or sent again on the next start.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from aimerger import core
+from aimerger.archive import prompt_hash
+from aimerger.dispatcher import PromptJob
+from aimerger.response_cache import CACHE_DIR
+
+DEFAULT_FLUSH_INTERVAL = 1.0  # Seconds between saves of a streamed answer
+
+# PromptJob arguments restored from the journal
+PARAMS = ("response_number", "stream", "max_tokens", "use_cache", "merge_id", "responses_dir", "sources")
+
+
+class JournalEntry:
+    """An unfinished request as it was journaled."""
+
+    def __init__(self, entry_id, created, updated, status, name, model_name, prompt_hash, params,
+                 partial, file_path, error):
+        self.entry_id = entry_id
+        self.created = created
+        self.updated = updated
+        self.status = status
+        self.name = name
+        self.model_name = model_name
+        self.prompt_hash = prompt_hash
+        self.params = params
+        self.partial = partial
+        self.file_path = file_path
+        self.error = error
+
+
+def read_partial(entry):
+    """Return the partial answer of an entry, taken from its response file if that got further.
+
+    The file is written piece by piece, so it usually holds more than the
+    journal's last save.
+    """
+    partial = entry.partial
+    if not entry.file_path:
+        return partial
+    header = core.format_response_header(entry.params.get("response_number", 1))
+    try:
+        with open(entry.file_path, "r", encoding="utf-8") as f:
+            content = f.read()
+    except (OSError, UnicodeDecodeError):
+        return partial
+    if content.startswith(header) and content[len(header):].startswith(partial):
+        return content[len(header):]
+    return partial
+
+
+class RequestJournal:
+    """Thread-safe SQLite journal of the requests that have not finished yet.
+
+    Prompts are stored once per hash, so the requests of a fan-out share one
+    copy.
+    """
+
+    def __init__(self, path=None, flush_interval=DEFAULT_FLUSH_INTERVAL):
+        if path is None:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            path = os.path.join(CACHE_DIR, "journal.sqlite3")
+        self.path = path
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._saved_at = {}  # Journal id -> monotonic time the partial answer was last saved
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS prompts ("
+                " hash TEXT PRIMARY KEY,"
+                " prompt TEXT NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS requests ("
+                " id INTEGER PRIMARY KEY,"
+                " created REAL NOT NULL,"
+                " updated REAL NOT NULL,"
+                " status TEXT NOT NULL,"
+                " name TEXT,"
+                " model TEXT NOT NULL,"
+                " prompt_hash TEXT NOT NULL,"
+                " params TEXT NOT NULL,"
+                " partial TEXT NOT NULL DEFAULT '',"
+                " file_path TEXT,"
+                " error TEXT)"
+            )
+
+    def begin(self, job):
+        """Journal a queued job before it is sent, or mark a restored job queued again."""
+        now = time.time()
+        with self._lock, self._connection:
+            if job.journal_id is not None:
+                self._connection.execute(
+                    "UPDATE requests SET status = ?, updated = ?, error = NULL WHERE id = ?",
+                    (job.status, now, job.journal_id),
+                )
+                return
+            key = prompt_hash(job.final_prompt)
+            self._connection.execute(
+                "INSERT OR IGNORE INTO prompts (hash, prompt) VALUES (?, ?)", (key, job.final_prompt)
+            )
+            params = {name: getattr(job, name) for name in PARAMS}
+            cursor = self._connection.execute(
+                "INSERT INTO requests (created, updated, status, name, model, prompt_hash, params, partial)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (now, now, job.status, job.name, job.model_name, key, json.dumps(params), job.partial),
+            )
+            job.journal_id = cursor.lastrowid
+
+    def update(self, job):
+        """Save a job's state, response file, last error and the answer received so far."""
+        with self._lock, self._connection:
+            self._update(job)
+
+    def _update(self, job):
+        self._connection.execute(
+            "UPDATE requests SET status = ?, updated = ?, partial = ?, file_path = ?, error = ? WHERE id = ?",
+            (
+                job.status,
+                time.time(),
+                job.partial + "".join(job.pieces),
+                job.file_path,
+                None if job.error is None else str(job.error),
+                job.journal_id,
+            ),
+        )
+
+    def save_partial(self, job):
+        """Save the answer a job received so far, unless it was saved within the flush interval.
+
+        The first save also records the response file the pieces are written to.
+        """
+        now = time.monotonic()
+        if now - self._saved_at.get(job.journal_id, float("-inf")) < self.flush_interval:
+            return
+        self._saved_at[job.journal_id] = now
+        self.update(job)
+
+    def finish(self, job, keep=False):
+        """Remove a finished job, or with keep set save its final state to offer it again later."""
+        with self._lock, self._connection:
+            if keep:
+                self._update(job)
+            else:
+                self._delete(job.journal_id)
+            self._saved_at.pop(job.journal_id, None)
+
+    def _delete(self, entry_id):
+        row = self._connection.execute("SELECT prompt_hash FROM requests WHERE id = ?", (entry_id,)).fetchone()
+        if row is None:
+            return
+        self._connection.execute("DELETE FROM requests WHERE id = ?", (entry_id,))
+        self._connection.execute(
+            "DELETE FROM prompts WHERE hash = ? AND NOT EXISTS (SELECT 1 FROM requests WHERE prompt_hash = ?)",
+            (row[0], row[0]),
+        )
+
+    def unfinished(self):
+        """Return the journaled requests, oldest first.
+
+        Outside of a running send these are the requests that were
+        interrupted or failed with an error worth another attempt.
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT id, created, updated, status, name, model, prompt_hash, params, partial, file_path, error"
+                " FROM requests ORDER BY id"
+            ).fetchall()
+        return [JournalEntry(*row[:7], json.loads(row[7]), *row[8:]) for row in rows]
+
+    def get_prompt(self, entry):
+        """Return the prompt of a journaled request, or None if it is missing."""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT prompt FROM prompts WHERE hash = ?", (entry.prompt_hash,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def restore_job(self, entry, resume=True):
+        """Return a job that sends a journaled request again under its journal entry.
+
+        With resume set the job continues the partial answer, otherwise the
+        answer starts over. The response is saved to the same file. Returns
+        None if the prompt is missing.
+        """
+        final_prompt = self.get_prompt(entry)
+        if final_prompt is None:
+            return None
+        params = {name: entry.params[name] for name in PARAMS if name in entry.params}
+        job = PromptJob(
+            entry.name,
+            final_prompt,
+            entry.model_name,
+            partial=read_partial(entry) if resume else "",
+            journal_id=entry.entry_id,
+            **params,
+        )
+        if entry.file_path and os.path.exists(entry.file_path):
+            job.file_path = entry.file_path
+        return job
+
+    def discard(self, entry_id):
+        """Remove a request from the journal."""
+        with self._lock, self._connection:
+            self._delete(entry_id)
+            self._saved_at.pop(entry_id, None)
+
+    def close(self):
+        """Close the database connection."""
+        with self._lock:
+            self._connection.close()
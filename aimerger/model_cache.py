@@ -0,0 +1,47 @@
+"""On-disk cache of the model list offered by the GUI.
+
+Listing the models is a network round trip, so the filtered list is stored
+with the time it was fetched and the account it belongs to. The GUI fills its
+dropdown from the cache right away and refreshes it in the background once
+the entry is older than the TTL.
+"""
+import hashlib
+import json
+import os
+import time
+
+from aimerger.response_cache import CACHE_DIR
+
+DEFAULT_TTL = 24 * 60 * 60  # Seconds
+
+
+def default_cache_path():
+    """Return the path of the model list cache file."""
+    return os.path.join(CACHE_DIR, "models.json")
+
+
+def account_fingerprint(api_key, api_base=None):
+    """Identify the account a model list belongs to without storing the key itself."""
+    return hashlib.sha256(f"{api_base or ''}\n{api_key or ''}".encode("utf-8")).hexdigest()[:16]
+
+
+def load_cached_models(account, path=None, ttl=DEFAULT_TTL):
+    """Return (models, fresh) from the cache, or (None, False) if nothing is cached for the account."""
+    try:
+        with open(path or default_cache_path(), "r", encoding="utf-8") as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None, False
+    if entry.get("account") != account or not isinstance(entry.get("models"), list):
+        return None, False
+    return entry["models"], time.time() - entry.get("fetched", 0) < ttl
+
+
+def save_cached_models(account, models, path=None):
+    """Store a fetched model list, replacing the file atomically."""
+    path = path or default_cache_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "w", encoding="utf-8") as f:
+        json.dump({"account": account, "fetched": time.time(), "models": models}, f)
+    os.replace(temporary_path, path)
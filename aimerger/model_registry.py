@@ -0,0 +1,120 @@
+"""Capabilities of the supported models, loaded once from models.json.
+
+Every model's context window, maximum completion tokens, tokenizer encoding,
+chat message framing, chat and streaming support and optional rate limits are kept in one config
+file instead of being spread over the code. Models missing from the file get
+the file's defaults. Set AIMERGER_MODELS_FILE to use another file.
+"""
+import json
+import os
+import threading
+
+MODELS_FILE = os.environ.get("AIMERGER_MODELS_FILE") or os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "models.json"
+)
+
+# Fields of a model entry and their values when the defaults leave them out
+FIELDS = {
+    "context_window": 128000,
+    "max_output_tokens": 4096,
+    "encoding": None,  # None lets tiktoken pick by model name
+    # Tokens the chat format adds per message, for a message's name and to prime the reply
+    "tokens_per_message": 3,
+    "tokens_per_name": 1,
+    "tokens_per_reply": 3,
+    "chat": True,
+    "streaming": True,
+    "requests_per_minute": None,  # None leaves a model to the global rate limits only
+    "tokens_per_minute": None,
+}
+
+
+class ModelRegistryError(ValueError):
+    """Raised when the models file cannot be read or holds an invalid entry."""
+
+
+class ModelInfo:
+    """What a model accepts and how its tokens are counted."""
+
+    def __init__(self, name, context_window, max_output_tokens, encoding=None, tokens_per_message=3,
+                 tokens_per_name=1, tokens_per_reply=3, chat=True, streaming=True, requests_per_minute=None,
+                 tokens_per_minute=None):
+        self.name = name
+        self.context_window = context_window
+        self.max_output_tokens = max_output_tokens
+        self.encoding = encoding
+        self.tokens_per_message = tokens_per_message
+        self.tokens_per_name = tokens_per_name
+        self.tokens_per_reply = tokens_per_reply
+        self.chat = chat
+        self.streaming = streaming
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+
+
+def _parse_entry(name, entry, defaults):
+    unknown = set(entry) - set(FIELDS)
+    if unknown:
+        raise ModelRegistryError(f"Unknown field(s) for {name}: {', '.join(sorted(unknown))}")
+    values = {**defaults, **entry}
+    for field in ("context_window", "max_output_tokens"):
+        if not isinstance(values[field], int) or values[field] <= 0:
+            raise ModelRegistryError(f"{field} of {name} must be a positive integer")
+    return ModelInfo(name, **values)
+
+
+class ModelRegistry:
+    """Model capabilities by name, with defaults for models not listed."""
+
+    def __init__(self, models, defaults=None):
+        self.defaults = {**FIELDS, **(defaults or {})}
+        self._models = {name: _parse_entry(name, entry, self.defaults) for name, entry in models.items()}
+
+    @classmethod
+    def from_file(cls, path=MODELS_FILE):
+        """Load a registry from a JSON file with "defaults" and "models" objects."""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                config = json.load(f)
+        except (OSError, ValueError) as e:
+            raise ModelRegistryError(f"Unable to load the models file {path}: {e}") from e
+        if not isinstance(config.get("models"), dict):
+            raise ModelRegistryError(f"The models file {path} has no models object")
+        return cls(config["models"], config.get("defaults"))
+
+    def get(self, name):
+        """Return a model's capabilities, the defaults for a model that is not listed."""
+        model = self._models.get(name)
+        if model is None:
+            model = ModelInfo(name, **self.defaults)
+        return model
+
+    def __contains__(self, name):
+        return name in self._models
+
+    def names(self):
+        """Return the names of the listed models."""
+        return list(self._models)
+
+    def chat_models(self):
+        """Return the names of the listed models that are used through the chat API."""
+        return [name for name, model in self._models.items() if model.chat]
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    """Return the registry loaded from MODELS_FILE, reading the file only once."""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = ModelRegistry.from_file()
+    return _registry
+
+
+def get_model(name):
+    """Return the capabilities of a model from the registry."""
+    return get_registry().get(name)
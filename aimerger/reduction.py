@@ -0,0 +1,161 @@
+"""Token-saving transforms applied to source files before they are merged.
+
+A ReductionPipeline chains the enabled steps as generators over the file
+contents of a merge, so files stream through every step one at a time in
+merge order. The per-file steps are regular expression passes; only
+header deduplication keeps state, the header lines already sent in an
+earlier file of the same merge.
+"""
+import re
+
+SIGNATURES_ONLY = "signatures"
+STRIP_COMMENTS = "comments"
+COLLAPSE_WHITESPACE = "whitespace"
+DEDUPE_HEADERS = "headers"
+
+# All steps in the order they run
+STEPS = (SIGNATURES_ONLY, STRIP_COMMENTS, COLLAPSE_WHITESPACE, DEDUPE_HEADERS)
+
+_COMMENTS_AND_LITERALS = re.compile(
+    r"""
+    (?P<comment>//[^\n]*|/\*.*?\*/)
+    | \$*\"\"\"(?:.|\n)*?\"\"\"                # Raw string literals
+    | (?:@\$?|\$@)"(?:[^"]|"")*"                # Verbatim strings
+    | \$?"(?:\\.|[^"\\\n])*"                    # Regular and interpolated strings
+    | '(?:\\.|[^'\\\n])'                        # Character literals
+    """,
+    re.S | re.X,
+)
+_BRACES_AND_SEMICOLONS = re.compile(r"[{};]")
+_TYPE_DECLARATION = re.compile(r"\b(?:namespace|class|struct|interface|enum|record)\b")
+_NOT_NEWLINE = re.compile(r"[^\n]")
+_TRAILING_WHITESPACE = re.compile(r"[ \t]+$", re.M)
+_BLANK_LINES = re.compile(r"\n{2,}")
+_HEADER_LINE = re.compile(r"\s*(?:(?:global\s+)?using\b|//|/\*|\*|#(?:nullable|pragma)\b|$)")
+
+
+def _blank_comments_and_literals(text):
+    """Replace comments and literals by spaces, keeping every other character in place."""
+    return _COMMENTS_AND_LITERALS.sub(lambda match: _NOT_NEWLINE.sub(" ", match.group()), text)
+
+
+def strip_comments(text):
+    """Remove line, block and documentation comments, leaving string literals alone."""
+    return _COMMENTS_AND_LITERALS.sub(lambda match: "" if match.group("comment") else match.group(), text)
+
+
+def collapse_whitespace(text):
+    """Remove trailing whitespace and blank lines."""
+    return _BLANK_LINES.sub("\n", _TRAILING_WHITESPACE.sub("", text)).lstrip("\n")
+
+
+def signatures_only(text):
+    """Replace the bodies of members that span several lines with "{ ... }".
+
+    Namespace and type bodies are kept, so the result lists every type with
+    its fields and member signatures.
+    """
+    code = _blank_comments_and_literals(text)
+    tokens = [(match.start(), match.group()) for match in _BRACES_AND_SEMICOLONS.finditer(code)]
+    pieces = []
+    copied = 0
+    boundary = -1
+    index = 0
+    while index < len(tokens):
+        position, token = tokens[index]
+        if token != "{":
+            boundary = position
+            index += 1
+            continue
+
+        declaration = code[boundary + 1:position]
+        keyword = _TYPE_DECLARATION.search(declaration)
+        parenthesis = declaration.find("(")
+        if keyword and (parenthesis < 0 or keyword.start() < parenthesis):
+            boundary = position
+            index += 1
+            continue
+
+        # A member body, find its closing brace
+        depth = 0
+        end = index
+        while end < len(tokens):
+            if tokens[end][1] == "{":
+                depth += 1
+            elif tokens[end][1] == "}":
+                depth -= 1
+                if depth == 0:
+                    break
+            end += 1
+        if end == len(tokens):
+            break  # Unbalanced braces, keep the rest as it is
+        close = tokens[end][0]
+        if "\n" in code[position:close]:
+            pieces.append(text[copied:position + 1])
+            pieces.append(" ... ")
+            copied = close
+        boundary = close
+        index = end + 1
+
+    pieces.append(text[copied:])
+    return "".join(pieces)
+
+
+def _map_step(function):
+    def step(contents):
+        for content in contents:
+            yield function(content)
+
+    return step
+
+
+def dedupe_headers(contents):
+    """Drop using directives and banner comment lines that an earlier file already started with."""
+    seen = set()
+    for content in contents:
+        lines = content.splitlines(keepends=True)
+        header_end = 0
+        while header_end < len(lines) and _HEADER_LINE.match(lines[header_end]):
+            header_end += 1
+
+        header = []
+        for line in lines[:header_end]:
+            key = line.strip()
+            if not key:
+                header.append(line)
+            elif key not in seen:
+                seen.add(key)
+                header.append(line)
+        if len(header) == header_end:
+            yield content
+        else:
+            yield "".join(header) + "".join(lines[header_end:])
+
+
+_STEP_FUNCTIONS = {
+    SIGNATURES_ONLY: _map_step(signatures_only),
+    STRIP_COMMENTS: _map_step(strip_comments),
+    COLLAPSE_WHITESPACE: _map_step(collapse_whitespace),
+    DEDUPE_HEADERS: dedupe_headers,
+}
+
+
+class ReductionPipeline:
+    """The enabled reduction steps, run in the order of STEPS."""
+
+    def __init__(self, steps):
+        unknown = set(steps) - set(STEPS)
+        if unknown:
+            raise ValueError(f"Unknown reduction steps: {', '.join(sorted(unknown))}")
+        self.steps = tuple(step for step in STEPS if step in steps)
+
+    @property
+    def key(self):
+        """Identify the pipeline's configuration, e.g. for caching token counts."""
+        return "+".join(self.steps)
+
+    def run(self, contents):
+        """Reduce an iterable of file contents, yielding the results in the same order."""
+        for step in self.steps:
+            contents = _STEP_FUNCTIONS[step](contents)
+        return contents
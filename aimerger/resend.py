@@ -0,0 +1,102 @@
+"""Diff-only resends of a merge after some of its files were edited.
+
+The sections of the last merge sent for a folder are kept as a snapshot
+together with the response they got. The next send can then be limited to
+unified diffs of the files that changed since, with the previous response as
+context, instead of the whole merge.
+"""
+import difflib
+import hashlib
+import json
+import os
+
+from aimerger.response_cache import CACHE_DIR
+
+SNAPSHOT_DIR = os.path.join(CACHE_DIR, "snapshots")
+
+
+class Snapshot:
+    """The sections of a sent merge by path and the response they got."""
+
+    def __init__(self, sections, response):
+        self.sections = sections
+        self.response = response
+
+
+def session_root(paths):
+    """Return the folder a merge session is kept for, the common parent of its files."""
+    paths = [os.path.abspath(path) for path in paths]
+    if len(paths) == 1:
+        return os.path.dirname(paths[0])
+    return os.path.commonpath(paths)
+
+
+def _snapshot_path(root, directory=None):
+    key = hashlib.sha256(os.path.normcase(root).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(directory or SNAPSHOT_DIR, f"{key}.json")
+
+
+def load_snapshot(root, directory=None):
+    """Return the snapshot last saved for a session root, or None."""
+    try:
+        with open(_snapshot_path(root, directory), "r", encoding="utf-8") as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if entry.get("root") != root or not isinstance(entry.get("sections"), dict):
+        return None
+    return Snapshot(entry["sections"], entry.get("response", ""))
+
+
+def save_snapshot(root, snapshot, directory=None):
+    """Store the snapshot of a session root, replacing the file atomically."""
+    path = _snapshot_path(root, directory)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "w", encoding="utf-8") as f:
+        json.dump({"root": root, "sections": snapshot.sections, "response": snapshot.response}, f)
+    os.replace(temporary_path, path)
+
+
+def _content_lines(section):
+    # Sections start with the "--- name ---" line added when merging
+    return section.split("\n", 1)[-1].splitlines(keepends=True)
+
+
+def diff_sections(root, old_sections, new_sections):
+    """Yield a unified diff for every file added, changed or removed between two snapshots.
+
+    Both arguments map absolute paths to merged sections, the diffs name the
+    files relative to root.
+    """
+    removed = [path for path in old_sections if path not in new_sections]
+    for path in list(new_sections) + removed:
+        old_section = old_sections.get(path)
+        new_section = new_sections.get(path)
+        if old_section == new_section:
+            continue
+        name = os.path.relpath(path, root).replace(os.sep, "/")
+        old_lines = _content_lines(old_section) if old_section is not None else []
+        new_lines = _content_lines(new_section) if new_section is not None else []
+        lines = difflib.unified_diff(
+            old_lines,
+            new_lines,
+            fromfile=f"a/{name}" if old_section is not None else "/dev/null",
+            tofile=f"b/{name}" if new_section is not None else "/dev/null",
+        )
+        # difflib leaves a last line without newline as is
+        yield "".join(line if line.endswith("\n") else f"{line}\n" for line in lines)
+
+
+def build_changes_text(root, snapshot, sections):
+    """Return the middle part sent instead of the merge, or None if no file changed.
+
+    It holds the previous response followed by the diffs of the changed files.
+    """
+    diffs = list(diff_sections(root, snapshot.sections, sections))
+    if not diffs:
+        return None
+    return (
+        f"Your previous response:\n{snapshot.response.strip()}\n\n"
+        f"{len(diffs)} file(s) changed since then, as unified diffs:\n{''.join(diffs)}"
+    )
@@ -0,0 +1,140 @@
+"""On-disk response cache keyed on the request that produced the response.
+
+Responses are stored in a SQLite database under a SHA-256 key of the chat
+messages, model and max_tokens, so a lookup is a single primary key query no
+matter how many responses are stored. The cache is bounded by age and total
+size; when it grows too large the least recently used entries are evicted.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from aimerger import core
+
+CACHE_DIR = os.environ.get("AIMERGER_CACHE_DIR") or os.path.join(core.BASE_DIR, "Cache")
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+DEFAULT_MAX_AGE = 30 * 24 * 60 * 60  # Seconds
+
+
+def cache_key(final_prompt, model_name, max_tokens):
+    """Return the cache key of a request."""
+    request = {
+        "model": model_name,
+        "max_tokens": max_tokens,
+        "messages": core.build_messages(final_prompt),
+    }
+    encoded = json.dumps(request, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class ResponseCache:
+    """Thread-safe, size and age bounded store of response contents."""
+
+    def __init__(self, path=None, max_bytes=DEFAULT_MAX_BYTES, max_age=DEFAULT_MAX_AGE):
+        if path is None:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            path = os.path.join(CACHE_DIR, "responses.sqlite3")
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY,"
+                " model TEXT NOT NULL,"
+                " content TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " created REAL NOT NULL,"
+                " last_used REAL NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS responses_created ON responses (created)"
+            )
+        self._total_bytes = self._connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()[0]
+        self.evict()
+
+    def _delete(self, keys_and_sizes):
+        self._connection.executemany(
+            "DELETE FROM responses WHERE key = ?", [(key,) for key, _ in keys_and_sizes]
+        )
+        self._total_bytes -= sum(size for _, size in keys_and_sizes)
+
+    def get(self, key):
+        """Return the cached content for a key, or None on a miss."""
+        now = time.time()
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                "SELECT content, size, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            content, size, created = row
+            if now - created > self.max_age:
+                self._delete([(key, size)])
+                return None
+            self._connection.execute(
+                "UPDATE responses SET last_used = ? WHERE key = ?", (now, key)
+            )
+            return content
+
+    def put(self, key, model_name, content):
+        """Store the content for a key and evict old entries if the cache is too large."""
+        now = time.time()
+        size = len(content.encode("utf-8"))
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                "SELECT size FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses (key, model, content, size, created, last_used)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model_name, content, size, now, now),
+            )
+            self._total_bytes += size - (row[0] if row else 0)
+        if self._total_bytes > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        """Remove expired entries, then least recently used ones until under max_bytes."""
+        with self._lock, self._connection:
+            expired = self._connection.execute(
+                "SELECT key, size FROM responses WHERE created < ?",
+                (time.time() - self.max_age,),
+            ).fetchall()
+            self._delete(expired)
+
+            excess = self._total_bytes - self.max_bytes
+            if excess <= 0:
+                return
+            evicted = []
+            for key, size in self._connection.execute(
+                "SELECT key, size FROM responses ORDER BY last_used"
+            ):
+                evicted.append((key, size))
+                excess -= size
+                if excess <= 0:
+                    break
+            self._delete(evicted)
+
+    def clear(self):
+        """Remove all cached responses."""
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM responses")
+            self._total_bytes = 0
+
+    def close(self):
+        """Close the database connection."""
+        with self._lock:
+            self._connection.close()
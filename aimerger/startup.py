@@ -0,0 +1,40 @@
+"""Timing of the startup phases, reported by ``ai_merger_tool.py --profile-startup``."""
+import threading
+import time
+from contextlib import contextmanager
+
+
+class StartupProfile:
+    """Record how long named startup phases take, on any thread."""
+
+    def __init__(self, started=None, clock=time.perf_counter):
+        self._clock = clock
+        self.started = clock() if started is None else started
+        self._phases = []
+        self._lock = threading.Lock()
+
+    def add(self, name, start, end=None):
+        """Record a phase that ran from start until end, or until now."""
+        end = self._clock() if end is None else end
+        with self._lock:
+            self._phases.append((name, start, end, threading.current_thread().name))
+
+    @contextmanager
+    def phase(self, name):
+        """Record the time spent in the with block as a phase."""
+        start = self._clock()
+        try:
+            yield
+        finally:
+            self.add(name, start)
+
+    def report(self):
+        """Return the phases as a table of start offsets and durations in milliseconds."""
+        with self._lock:
+            phases = sorted(self._phases, key=lambda phase: phase[1])
+        lines = [f"{'Phase':<32}{'start ms':>10}{'took ms':>10}  Thread"]
+        for name, start, end, thread in phases:
+            lines.append(
+                f"{name:<32}{(start - self.started) * 1000:>10.1f}{(end - start) * 1000:>10.1f}  {thread}"
+            )
+        return "\n".join(lines)
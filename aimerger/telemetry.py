@@ -0,0 +1,197 @@
+"""Per-request and per-load metrics with aggregates per model.
+
+Every finished request and every file load is appended as one JSON line to
+Logs/metrics.jsonl, so measurements survive restarts and can be analysed with
+any tool. The latest records are also kept in memory to summarise latency,
+time to first token, throughput, cache hits and retries per model.
+"""
+import collections
+import csv
+import json
+import os
+import threading
+import time
+
+from aimerger.debug_log import LOG_DIR
+
+DEFAULT_MAX_RECORDS = 10000  # Records kept in memory for the summaries
+
+# Record kinds
+REQUEST = "request"
+INGEST = "ingest"
+
+# Columns of the CSV export, in order
+REQUEST_FIELDS = [
+    "time", "job_id", "name", "model", "status", "error", "cached", "stream", "retries",
+    "queue_seconds", "count_seconds", "connect_seconds", "ttft_seconds", "latency_seconds",
+    "total_seconds", "prompt_tokens", "completion_tokens", "tokens_per_second",
+]
+INGEST_FIELDS = ["time", "files", "errors", "bytes", "tokens", "saved_tokens", "seconds"]
+
+
+def default_metrics_path():
+    """Return the path of the metrics file."""
+    return os.path.join(LOG_DIR, "metrics.jsonl")
+
+
+def percentile(values, fraction):
+    """Return the percentile of values by linear interpolation, or None without values."""
+    values = sorted(values)
+    if not values:
+        return None
+    position = (len(values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def _values(records, field):
+    return [record[field] for record in records if record.get(field) is not None]
+
+
+def _mean(values):
+    return sum(values) / len(values) if values else None
+
+
+def summarize_requests(records):
+    """Aggregate request records per model, sorted by model name.
+
+    Latency, time to first token and connect time are only taken from
+    requests that were actually sent, cache hits are counted separately.
+    """
+    by_model = collections.defaultdict(list)
+    for record in records:
+        by_model[record["model"]].append(record)
+
+    summary = []
+    for model, model_records in sorted(by_model.items()):
+        sent = [record for record in model_records if not record.get("cached") and record["status"] == "done"]
+        latencies = _values(sent, "latency_seconds")
+        first_tokens = _values(sent, "ttft_seconds")
+        summary.append({
+            "model": model,
+            "requests": len(model_records),
+            "failed": sum(record["status"] == "failed" for record in model_records),
+            "cache_hit_rate": sum(bool(record.get("cached")) for record in model_records) / len(model_records),
+            "retries": sum(record.get("retries") or 0 for record in model_records),
+            "latency_p50": percentile(latencies, 0.5),
+            "latency_p95": percentile(latencies, 0.95),
+            "ttft_p50": percentile(first_tokens, 0.5),
+            "ttft_p95": percentile(first_tokens, 0.95),
+            "connect_p50": percentile(_values(sent, "connect_seconds"), 0.5),
+            "tokens_per_second": percentile(_values(sent, "tokens_per_second"), 0.5),
+            "prompt_tokens": _mean(_values(model_records, "prompt_tokens")),
+            "completion_tokens": _mean(_values(sent, "completion_tokens")),
+        })
+    return summary
+
+
+def summarize_ingest(records):
+    """Aggregate file load records, or return None without any."""
+    if not records:
+        return None
+    seconds = _values(records, "seconds")
+    total_seconds = sum(seconds)
+    return {
+        "loads": len(records),
+        "seconds_p50": percentile(seconds, 0.5),
+        "seconds_p95": percentile(seconds, 0.95),
+        "megabytes_per_second": sum(_values(records, "bytes")) / 1e6 / total_seconds if total_seconds else None,
+        "files_per_second": sum(_values(records, "files")) / total_seconds if total_seconds else None,
+    }
+
+
+def _format(value, pattern):
+    return "" if value is None else pattern.format(value)
+
+
+def format_request_summary(summary):
+    """Return a per-model summary as a text table."""
+    lines = [
+        f"{'Model':<28}{'reqs':>6}{'fail':>6}{'cache':>7}{'retry':>7}{'p50 s':>8}{'p95 s':>8}"
+        f"{'ttft50':>8}{'ttft95':>8}{'tok/s':>8}"
+    ]
+    for row in summary:
+        lines.append(
+            f"{row['model']:<28}{row['requests']:>6}{row['failed']:>6}{row['cache_hit_rate']:>7.0%}"
+            f"{row['retries']:>7}{_format(row['latency_p50'], '{:.2f}'):>8}{_format(row['latency_p95'], '{:.2f}'):>8}"
+            f"{_format(row['ttft_p50'], '{:.2f}'):>8}{_format(row['ttft_p95'], '{:.2f}'):>8}"
+            f"{_format(row['tokens_per_second'], '{:.0f}'):>8}"
+        )
+    return "\n".join(lines)
+
+
+class Telemetry:
+    """Thread-safe recorder of metrics records.
+
+    The metrics file is only read when the records are first asked for, so
+    recording does not slow down startup.
+    """
+
+    def __init__(self, path=None, max_records=DEFAULT_MAX_RECORDS):
+        self.path = path or default_metrics_path()
+        self._lock = threading.Lock()
+        self._records = collections.deque(maxlen=max_records)
+        self._loaded = False
+
+    def record(self, kind, **fields):
+        """Add a record of the given kind and append it to the metrics file.
+
+        Metrics are best effort, a record that cannot be written is only kept
+        in memory.
+        """
+        record = {"kind": kind, "time": time.time(), **fields}
+        line = json.dumps(record) + "\n"
+        with self._lock:
+            self._records.append(record)
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line)
+            except OSError:
+                pass
+        return record
+
+    def _read_file(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        # A line cut short by a crash
+                        continue
+        except FileNotFoundError:
+            return
+
+    def records(self, kind=None):
+        """Return the latest records, optionally of one kind, oldest first."""
+        with self._lock:
+            if not self._loaded:
+                # The file also holds everything recorded so far
+                self._records.clear()
+                self._records.extend(self._read_file())
+                self._loaded = True
+            records = list(self._records)
+        return [record for record in records if kind is None or record.get("kind") == kind]
+
+    def export_csv(self, path, kind=REQUEST):
+        """Write all records of a kind in the metrics file to a CSV file and return their number."""
+        fields = REQUEST_FIELDS if kind == REQUEST else INGEST_FIELDS
+        with self._lock:
+            records = [record for record in self._read_file() if record.get("kind") == kind]
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=fields, extrasaction="ignore")
+            writer.writeheader()
+            writer.writerows(records)
+        return len(records)
+
+    def clear(self):
+        """Remove all records, including the metrics file."""
+        with self._lock:
+            self._records.clear()
+            self._loaded = True
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,137 @@
+"""Persistent index of source file contents and token counts.
+
+Files are keyed by path and validated with their size and modification time,
+so reloading an unchanged file costs a stat call and a primary key query. A
+file whose stat changed is re-read and compared by its SHA-256 hash; token
+counts are stored per encoding and only recomputed when the content changed.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+
+from aimerger import core
+from aimerger.response_cache import CACHE_DIR
+
+DEFAULT_MAX_AGE = 30 * 24 * 60 * 60  # Seconds
+TOUCH_INTERVAL = 24 * 60 * 60  # Seconds between last_used updates of an entry
+
+
+class TokenIndex:
+    """Thread-safe store of file contents and per-encoding token counts."""
+
+    def __init__(self, path=None, max_age=DEFAULT_MAX_AGE, store_token_ids=False):
+        if path is None:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            path = os.path.join(CACHE_DIR, "token_index.sqlite3")
+        self.path = path
+        self.max_age = max_age
+        self.store_token_ids = store_token_ids
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                " path TEXT PRIMARY KEY,"
+                " size INTEGER NOT NULL,"
+                " mtime_ns INTEGER NOT NULL,"
+                " sha256 TEXT NOT NULL,"
+                " content TEXT NOT NULL,"
+                " last_used REAL NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS token_counts ("
+                " path TEXT NOT NULL,"
+                " encoding TEXT NOT NULL,"
+                " sha256 TEXT NOT NULL,"
+                " tokens INTEGER NOT NULL,"
+                " token_ids BLOB,"
+                " PRIMARY KEY (path, encoding))"
+            )
+        self.prune()
+
+    def read(self, path):
+        """Return (content, sha256) of a file, reading it only if its size or mtime changed."""
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT size, mtime_ns, sha256, content, last_used FROM files WHERE path = ?",
+                (path,),
+            ).fetchone()
+            if row and row[0] == stat.st_size and row[1] == stat.st_mtime_ns:
+                if now - row[4] > TOUCH_INTERVAL:
+                    with self._connection:
+                        self._connection.execute(
+                            "UPDATE files SET last_used = ? WHERE path = ?", (now, path)
+                        )
+                return row[3], row[2]
+
+        with open(path, "rb") as f:
+            data = f.read()
+        digest = hashlib.sha256(data).hexdigest()
+        content = row[3] if row and row[2] == digest else core.decode_source(data)
+
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO files (path, size, mtime_ns, sha256, content, last_used)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (path, stat.st_size, stat.st_mtime_ns, digest, content, now),
+            )
+        return content, digest
+
+    def get_tokens(self, path, sha256, encoding_name):
+        """Return the stored token count of a file's prompt section, or None if unknown."""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT tokens FROM token_counts WHERE path = ? AND encoding = ? AND sha256 = ?",
+                (os.path.abspath(path), encoding_name, sha256),
+            ).fetchone()
+        return row[0] if row else None
+
+    def get_token_ids(self, path, sha256, encoding_name):
+        """Return the stored token ids of a file's prompt section, or None if they were not stored."""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT token_ids FROM token_counts WHERE path = ? AND encoding = ? AND sha256 = ?",
+                (os.path.abspath(path), encoding_name, sha256),
+            ).fetchone()
+        if row is None or row[0] is None:
+            return None
+        return array("I", row[0]).tolist()
+
+    def put_tokens(self, path, sha256, encoding_name, token_ids):
+        """Store the token count, and the ids if store_token_ids is set, of a file's prompt section."""
+        blob = array("I", token_ids).tobytes() if self.store_token_ids else None
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO token_counts (path, encoding, sha256, tokens, token_ids)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (os.path.abspath(path), encoding_name, sha256, len(token_ids), blob),
+            )
+
+    def prune(self):
+        """Remove files that were not loaded within max_age and their token counts."""
+        with self._lock, self._connection:
+            self._connection.execute(
+                "DELETE FROM files WHERE last_used < ?", (time.time() - self.max_age,)
+            )
+            self._connection.execute(
+                "DELETE FROM token_counts WHERE path NOT IN (SELECT path FROM files)"
+            )
+
+    def clear(self):
+        """Remove all indexed files."""
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM files")
+            self._connection.execute("DELETE FROM token_counts")
+
+    def close(self):
+        """Close the database connection."""
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,273 @@
+import os
+import re
+from bisect import bisect_right
+from functools import lru_cache
+
+from aimerger.model_registry import get_model
+
+# Model whose tokenizer is used when no model is given
+DEFAULT_TOKEN_MODEL = "gpt-3.5-turbo-0613"
+
+# tiktoken keeps the downloaded BPE files here unless TIKTOKEN_CACHE_DIR is set,
+# so the encodings can be shipped with the tool and loaded offline
+TIKTOKEN_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tiktoken_cache")
+OFFLINE_ENCODINGS = ("cl100k_base", "o200k_base")
+
+# Block boundaries of the encodings whose pre-tokenizer ends a piece after the
+# last newline of a whitespace run. Text can be split at those points and each
+# block encoded on its own without changing the total token count. Both split at
+# the start of every non-blank line; o200k's punctuation pieces also take the
+# slashes following their newlines ("};\n//"), so it never splits before a "/".
+_BLOCK_BOUNDARIES = {
+    "cl100k_base": re.compile(r"(?<=\n)(?=[^\S\r\n]*[^\s])"),
+    "o200k_base": re.compile(r"(?<=\n)(?=[^\S\r\n]*[^\s])(?!/)"),
+}
+BLOCK_SAFE_ENCODINGS = set(_BLOCK_BOUNDARIES)
+
+
+def _import_tiktoken():
+    """Import tiktoken on first use, pointing its BPE cache at the local cache directory."""
+    os.environ.setdefault("TIKTOKEN_CACHE_DIR", TIKTOKEN_CACHE_DIR)
+    import tiktoken
+
+    return tiktoken
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model=DEFAULT_TOKEN_MODEL):
+    """Return the tiktoken encoding for a model, loading it only once per model.
+
+    The encoding listed in the model registry is used, tiktoken picks one for
+    models without.
+    """
+    tiktoken = _import_tiktoken()
+    name = get_model(model).encoding
+    if name:
+        return tiktoken.get_encoding(name)
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def download_encodings(names=OFFLINE_ENCODINGS):
+    """Fetch the BPE files of the given encodings into the cache directory for offline use."""
+    tiktoken = _import_tiktoken()
+    for name in names:
+        tiktoken.get_encoding(name)
+    return os.environ["TIKTOKEN_CACHE_DIR"]
+
+
+def count_text_tokens(encoding, text):
+    """Count the tokens of a plain text, treating special tokens as ordinary text."""
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def num_tokens_from_messages(messages, model=DEFAULT_TOKEN_MODEL):
+    """Calculate the number of tokens in a list of messages.
+
+    The model's encoding and chat framing are taken from the model registry.
+    """
+    encoding = get_encoding(model)
+    model_info = get_model(model)
+
+    num_tokens = 0
+    for message in messages:
+        num_tokens += model_info.tokens_per_message
+        for key, value in message.items():
+            num_tokens += count_text_tokens(encoding, value)
+            if key == "name":
+                num_tokens += model_info.tokens_per_name
+    num_tokens += model_info.tokens_per_reply
+
+    return num_tokens
+
+
+@lru_cache(maxsize=None)
+def message_frame_tokens(model=DEFAULT_TOKEN_MODEL, role="system"):
+    """Return the tokens a single chat message with the given role adds to its content."""
+    return num_tokens_from_messages([{"role": role, "content": ""}], model)
+
+
+class TextTokens:
+    """Token count of a text together with its first and last line blocks.
+
+    Counts of texts that are joined later can be combined exactly by
+    join_text_tokens, which only encodes the blocks around every join again.
+    A text without a block boundary is a single block, its head is the text.
+    """
+
+    def __init__(self, tokens, head, head_tokens, tail, tail_tokens, single=False):
+        self.tokens = tokens
+        self.head = head
+        self.head_tokens = head_tokens
+        self.tail = tail
+        self.tail_tokens = tail_tokens
+        self.single = single
+
+
+def _last_block_start(boundary, text):
+    """Return the position of the last block boundary in text, or None."""
+    position = len(text)
+    while True:
+        newline = text.rfind("\n", 0, position)
+        if newline < 0:
+            return None
+        if boundary.match(text, newline + 1):
+            return newline + 1
+        position = newline
+
+
+def text_tokens(encoding, text, tokens=None):
+    """Return the TextTokens of a text, tokens is its token count if already known."""
+    if tokens is None:
+        tokens = count_text_tokens(encoding, text)
+    boundary = _BLOCK_BOUNDARIES.get(encoding.name)
+    first = boundary.search(text) if boundary else None
+    if first is None:
+        return TextTokens(tokens, text, tokens, text, tokens, single=True)
+    head = text[:first.start()]
+    tail = text[_last_block_start(boundary, text):]
+    return TextTokens(tokens, head, count_text_tokens(encoding, head), tail, count_text_tokens(encoding, tail))
+
+
+def join_text_tokens(encoding, parts):
+    """Return the TextTokens of the concatenation of texts given as TextTokens.
+
+    Block boundaries stay boundaries when texts are joined, so only the last
+    block of every text and the first block of the next are counted together.
+    Texts of other encodings are single blocks and encoded together in full,
+    so the count always equals a full encode.
+    """
+    head = None
+    head_tokens = inner_tokens = 0
+    open_text = ""  # Text after the last boundary seen so far
+    for part in parts:
+        if part.single:
+            open_text += part.head
+            continue
+        joined_tokens = count_text_tokens(encoding, open_text + part.head)
+        if head is None:
+            head, head_tokens = open_text + part.head, joined_tokens
+        else:
+            inner_tokens += joined_tokens
+        inner_tokens += part.tokens - part.head_tokens - part.tail_tokens
+        open_text = part.tail
+    tail_tokens = count_text_tokens(encoding, open_text)
+    if head is None:
+        return TextTokens(tail_tokens, open_text, tail_tokens, open_text, tail_tokens, single=True)
+    return TextTokens(head_tokens + inner_tokens + tail_tokens, head, head_tokens, open_text, tail_tokens)
+
+
+def _common_prefix_length(a, b):
+    """Length of the common prefix of two strings, found by binary search on slices."""
+    low, high = 0, min(len(a), len(b))
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[low:middle] == b[low:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def _common_suffix_length(a, b, limit):
+    """Length of the common suffix of two strings, capped at limit characters."""
+    low, high = 0, limit
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[len(a) - middle:len(a) - low] == b[len(b) - middle:len(b) - low]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+class IncrementalTokenCounter:
+    """Count the tokens of a text that changes a little between calls.
+
+    The text is kept as a list of line blocks with their token counts. On every
+    call the edited region is located by comparing against the previous text and
+    only the blocks around it are encoded again. The result always equals a full
+    encode of the text.
+    """
+
+    def __init__(self, model=DEFAULT_TOKEN_MODEL):
+        self.model = model
+        self.reset()
+
+    @property
+    def encoding(self):
+        """The tiktoken encoding, loaded on first use."""
+        return get_encoding(self.model)
+
+    def reset(self):
+        """Forget the previous text so the next call encodes everything."""
+        self._text = None
+        self._block_starts = []
+        self._block_counts = []
+        self._total = 0
+
+    def count(self, text):
+        """Return the number of tokens in text."""
+        encoding = self.encoding
+        if encoding.name not in BLOCK_SAFE_ENCODINGS:
+            if text != self._text:
+                self._text = text
+                self._total = count_text_tokens(encoding, text)
+            return self._total
+
+        previous = self._text
+        if previous is None:
+            first, stop = 0, 0
+            segment_start, old_segment_end = 0, 0
+        elif text == previous:
+            return self._total
+        else:
+            prefix = _common_prefix_length(previous, text)
+            limit = min(len(previous), len(text)) - prefix
+            suffix = _common_suffix_length(previous, text, limit)
+            starts = self._block_starts
+
+            # A block start depends on the character before it and on the rest of
+            # its line, so re-encode from the block before the first changed one
+            first = max(bisect_right(starts, prefix - 1) - 2, 0)
+            stop = bisect_right(starts, len(previous) - suffix)
+            segment_start = starts[first]
+            old_segment_end = starts[stop] if stop < len(starts) else len(previous)
+
+        delta = len(text) - (len(previous) if previous is not None else 0)
+        segment_end = old_segment_end + delta if previous is not None else len(text)
+
+        new_starts = []
+        new_counts = []
+        offset = segment_start
+        for block in _BLOCK_BOUNDARIES[encoding.name].split(text[segment_start:segment_end]):
+            new_starts.append(offset)
+            new_counts.append(count_text_tokens(encoding, block))
+            offset += len(block)
+
+        self._total += sum(new_counts) - sum(self._block_counts[first:stop])
+        self._block_starts[first:stop] = new_starts
+        self._block_counts[first:stop] = new_counts
+        if delta:
+            starts = self._block_starts
+            for index in range(first + len(new_starts), len(starts)):
+                starts[index] += delta
+        self._text = text
+        return self._total
+
+    def text_tokens(self):
+        """Return the TextTokens of the text counted last, from its blocks."""
+        if self._text is None:
+            return TextTokens(0, "", 0, "", 0, single=True)
+        starts = self._block_starts
+        if len(starts) <= 1:
+            return TextTokens(self._total, self._text, self._total, self._text, self._total, single=True)
+        return TextTokens(
+            self._total,
+            self._text[:starts[1]],
+            self._block_counts[0],
+            self._text[starts[-1]:],
+            self._block_counts[-1],
+        )
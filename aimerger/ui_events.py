@@ -0,0 +1,55 @@
+"""Hand updates from worker threads to the GUI thread.
+
+Tk widgets may only be touched from the thread running the main loop, so
+worker threads post events to an EventQueue and the GUI drains it from an
+after() loop. Events of high-frequency kinds are coalesced per key while they
+wait: streamed text is joined and progress keeps only its latest value, so a
+drain applies at most one update per key and kind in a row.
+"""
+import queue
+
+APPEND = "append"  # Payloads are strings joined in order
+REPLACE = "replace"  # Only the latest payload is kept
+
+
+class EventQueue:
+    """Thread-safe queue of (kind, key, payload) events with per-kind coalescing."""
+
+    def __init__(self, coalesce=None):
+        self.coalesce = dict(coalesce or {})
+        self._queue = queue.Queue()
+
+    def post(self, kind, key, payload=None):
+        """Queue an event. Safe to call from any thread."""
+        self._queue.put((kind, key, payload))
+
+    def drain(self):
+        """Return the queued events in order, coalescing consecutive events of a key.
+
+        Two events are only merged if no other event for their key came in
+        between, so every key still sees its events in the order they were posted.
+        """
+        events = []
+        last_index = {}
+        while True:
+            try:
+                kind, key, payload = self._queue.get_nowait()
+            except queue.Empty:
+                break
+
+            index = last_index.get(key)
+            mode = self.coalesce.get(kind)
+            if mode and index is not None and events[index][0] == kind:
+                if mode == APPEND:
+                    events[index][2].append(payload)
+                else:
+                    events[index][2] = payload
+                continue
+
+            last_index[key] = len(events)
+            events.append([kind, key, [payload] if mode == APPEND else payload])
+
+        return [
+            (kind, key, "".join(payload) if self.coalesce.get(kind) == APPEND else payload)
+            for kind, key, payload in events
+        ]
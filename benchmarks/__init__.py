@@ -0,0 +1,4 @@
+"""Benchmarks for the AI Merger Tool hot paths.
+
+Run them from the repository root, e.g. ``python -m benchmarks.bench_token_counter``.
+"""
@@ -0,0 +1,95 @@
+"""Import and search times of the response archive for a large Responses tree.
+
+Writes a synthetic tree of response files like months of use produce, imports
+it into a fresh archive and times searches against grepping the files. The
+models read from response file names are checked first, including dated model
+ids that end in digits like the collision counter.
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from aimerger import core
+from aimerger.archive import ResponseArchive, parse_response_file_name
+
+# Response file name -> model it was saved for
+CHECK_FILE_NAMES = {
+    "20240613-101010-gpt-4o-Response.txt": "gpt-4o",
+    "20240613-101010-gpt-4o-2-Response.txt": "gpt-4o",
+    "20240613-101010-gpt-4-0613-Response.txt": "gpt-4-0613",
+    "20240613-101010-gpt-4-0613-2-Response.txt": "gpt-4-0613",
+    "20240613-101010-gpt-4o-2024-05-13-Response.txt": "gpt-4o-2024-05-13",
+    "20240613-101010-gpt-4o-2024-05-13-3-Response.txt": "gpt-4o-2024-05-13",
+}
+
+_WORDS = (
+    "player enemy physics coroutine update rigidbody transform vector quaternion shader mesh "
+    "collider animation network inventory serialization pooling allocation garbage raycast"
+).split()
+
+
+def write_tree(root, count, words_per_response, seed):
+    """Write count response files spread over dated folders."""
+    rng = random.Random(seed)
+    for number in range(count):
+        day = os.path.join(root, f"2024-{1 + number % 12:02d}-{1 + number % 28:02d}")
+        os.makedirs(day, exist_ok=True)
+        file_name = f"2024{1 + number % 12:02d}{1 + number % 28:02d}-{number // 3600 % 24:02d}{number // 60 % 60:02d}{number % 60:02d}-gpt-4o-{number}-Response.txt"
+        content = " ".join(rng.choice(_WORDS) for _ in range(words_per_response))
+        with open(os.path.join(day, file_name), "w", encoding="utf-8") as f:
+            f.write(core.format_response(number, f"{content} marker{number}"))
+
+
+def check_file_names():
+    """Exit with an error if a response file name is parsed to the wrong model."""
+    for file_name, model in CHECK_FILE_NAMES.items():
+        parsed = parse_response_file_name(file_name)
+        if parsed is None or parsed[1] != model:
+            raise SystemExit(f"{file_name} parsed as {parsed and parsed[1]!r}, expected {model!r}")
+    print("Response file names resolve to their models.")
+
+
+def grep(root, text):
+    matches = 0
+    for directory, _, file_names in os.walk(root):
+        for file_name in file_names:
+            with open(os.path.join(directory, file_name), "r", encoding="utf-8") as f:
+                matches += text in f.read()
+    return matches
+
+
+def run(count, words_per_response, seed):
+    with tempfile.TemporaryDirectory() as directory:
+        root = os.path.join(directory, "Responses")
+        write_tree(root, count, words_per_response, seed)
+        archive = ResponseArchive(os.path.join(directory, "archive.sqlite3"))
+
+        start = time.perf_counter()
+        imported = archive.import_tree(root)
+        print(f"Import of {imported:,} responses: {time.perf_counter() - start:.2f} s")
+
+        start = time.perf_counter()
+        grep(root, f"marker{count // 2} ")
+        print(f"Grep for one response:          {(time.perf_counter() - start) * 1000:>8.1f} ms")
+        for query in (f"marker{count // 2}", "quaternion raycast", "pool", ""):
+            start = time.perf_counter()
+            results = archive.search(query)
+            elapsed = (time.perf_counter() - start) * 1000
+            print(f"Search {query!r:<24} {elapsed:>8.1f} ms  {len(results)} results")
+        archive.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--responses", type=int, default=20000)
+    parser.add_argument("--words", type=int, default=400, help="Words per response")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    check_file_names()
+    run(args.responses, args.words, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Throughput of the prompt dispatcher against the local mock server.
+
+Sends a fixed number of prompts at increasing concurrency levels. With a fixed
+server latency the throughput should grow roughly linearly up to the
+configured worker count.
+"""
+import argparse
+import tempfile
+import threading
+import time
+from concurrent.futures import wait
+
+import openai
+
+from aimerger import dispatcher
+from aimerger.dispatcher import Dispatcher, PromptJob
+from benchmarks.mock_openai_server import MockOpenAIServer
+
+
+def start_mock_server(**settings):
+    """Start a mock server on a free port and point openai at it."""
+    server = MockOpenAIServer(("127.0.0.1", 0), **settings)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    openai.api_base = f"http://127.0.0.1:{server.server_port}/v1"
+    openai.api_key = "mock-key"
+    return server
+
+
+def run_batch(requests, concurrency, stream, responses_dir, rpm=None, tpm=None):
+    pool = Dispatcher(
+        max_workers=concurrency,
+        requests_per_minute=rpm,
+        tokens_per_minute=tpm,
+        backoff_base=0.05,
+    )
+    jobs = [
+        PromptJob(f"prompt {index}", "Review this code.", "gpt-4o", stream=stream,
+                  responses_dir=responses_dir)
+        for index in range(requests)
+    ]
+    start = time.perf_counter()
+    wait([pool.submit(job) for job in jobs])
+    seconds = time.perf_counter() - start
+    pool.shutdown()
+
+    failed = sum(job.status == dispatcher.FAILED for job in jobs)
+    retries = sum(job.attempts - 1 for job in jobs)
+    return seconds, failed, retries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=32)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--latency", type=float, default=0.2, help="Mock server latency in seconds")
+    parser.add_argument("--tokens", type=int, default=20, help="Tokens per mock answer")
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--rpm", type=int, help="Requests per minute limit")
+    parser.add_argument("--tpm", type=int, help="Tokens per minute limit")
+    parser.add_argument("--stream", action="store_true")
+    args = parser.parse_args()
+
+    start_mock_server(latency=args.latency, tokens=args.tokens, failure_rate=args.failure_rate)
+    with tempfile.TemporaryDirectory() as responses_dir:
+        print(f"{'workers':>8} {'seconds':>8} {'req/s':>8} {'failed':>7} {'retries':>8}")
+        for concurrency in args.concurrency:
+            seconds, failed, retries = run_batch(
+                args.requests, concurrency, args.stream, responses_dir, args.rpm, args.tpm
+            )
+            print(f"{concurrency:>8} {seconds:>8.2f} {args.requests / seconds:>8.1f} {failed:>7} {retries:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""Load time of a source tree without and with the persistent token index.
+
+Writes a synthetic tree of C# files and loads it with the parallel loader:
+once without an index, then twice with a fresh index, where the second,
+warm load should only stat the files.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from aimerger.ingest import find_source_files, load_source_files
+from aimerger.token_index import TokenIndex
+from benchmarks.corpus import generate_cs_source
+
+
+def _timed_load(filenames, index=None):
+    start = time.perf_counter()
+    files, errors = load_source_files(filenames, index=index)
+    seconds = time.perf_counter() - start
+    if errors:
+        raise SystemExit(f"Failed to read {errors[0][0]}: {errors[0][1]}")
+    return files, seconds
+
+
+def run(file_count, file_size, seed):
+    with tempfile.TemporaryDirectory() as directory:
+        for number in range(file_count):
+            path = os.path.join(directory, f"Script{number:05d}.cs")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(generate_cs_source(file_size, seed + number))
+        filenames = find_source_files(directory)
+
+        files, plain_seconds = _timed_load(filenames)
+        index = TokenIndex(os.path.join(directory, "token_index.sqlite3"))
+        _, cold_seconds = _timed_load(filenames, index)
+        indexed_files, warm_seconds = _timed_load(filenames, index)
+        index.close()
+
+        if [f.tokens for f in indexed_files] != [f.tokens for f in files]:
+            raise SystemExit("Indexed token counts differ from the counts of a plain load.")
+
+    print(f"Files:                   {file_count:,} x {file_size:,} bytes, {sum(f.tokens for f in files):,} tokens")
+    print(f"Load without index:      {plain_seconds * 1000:.0f} ms")
+    print(f"Load, cold index:        {cold_seconds * 1000:.0f} ms")
+    print(f"Load, warm index:        {warm_seconds * 1000:.0f} ms")
+    print("Indexed token counts match a plain load.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=2000)
+    parser.add_argument("--size", type=int, default=8000, help="Size of every file in bytes")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    run(args.files, args.size, args.seed)
+
+
+if __name__ == "__main__":
+    main()
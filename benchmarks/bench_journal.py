@@ -0,0 +1,85 @@
+"""Recovery of interrupted requests through the request journal.
+
+Streams answers from the local mock server while it drops every connection
+partway, without retries, so all requests fail and stay in a temporary
+journal. The server then stops dropping connections and the requests are
+resumed from their partial answers, or for comparison sent again from the
+start. Reports the time and the tokens streamed to recover and checks that
+every response file holds the complete answer and the journal is empty.
+"""
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import wait
+
+from aimerger import core, dispatcher
+from aimerger.dispatcher import Dispatcher, PromptJob
+from aimerger.journal import RequestJournal
+from benchmarks.bench_dispatcher import start_mock_server
+
+
+def interrupt_requests(server, journal, requests, responses_dir):
+    """Send requests whose answers are all cut off and return their journal entries."""
+    server.drop_rate = 1.0
+    pool = Dispatcher(max_workers=4, max_retries=0, journal=journal)
+    jobs = [
+        PromptJob(f"prompt {index}", f"Review file {index}.", "gpt-4o", stream=True, responses_dir=responses_dir)
+        for index in range(requests)
+    ]
+    wait([pool.submit(job) for job in jobs])
+    pool.shutdown()
+    return journal.unfinished()
+
+
+def recover(server, journal, entries, resume, tokens):
+    """Send the journaled requests again and return (seconds, tokens streamed, failed, incomplete files).
+
+    A response file is complete when it holds all tokens of the mock answer.
+    """
+    server.drop_rate = 0.0
+    pool = Dispatcher(max_workers=4, journal=journal)
+    jobs = [journal.restore_job(entry, resume=resume) for entry in entries]
+    start = time.perf_counter()
+    wait([pool.submit(job) for job in jobs])
+    seconds = time.perf_counter() - start
+    pool.shutdown()
+
+    failed = sum(job.status == dispatcher.FAILED for job in jobs)
+    answer = "".join(f"token{index} " for index in range(tokens))
+    incomplete = 0
+    for job in jobs:
+        with open(job.file_path, "r", encoding="utf-8") as f:
+            if f.read() != core.format_response(job.response_number, answer):
+                incomplete += 1
+    return seconds, sum(job.received_tokens for job in jobs), failed, incomplete
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=16)
+    parser.add_argument("--tokens", type=int, default=400, help="Tokens per mock answer")
+    parser.add_argument("--drop-after", type=int, default=300, help="Tokens streamed before the connection drops")
+    parser.add_argument("--token-delay", type=float, default=0.002, help="Seconds between streamed tokens")
+    args = parser.parse_args()
+
+    server = start_mock_server(tokens=args.tokens, token_delay=args.token_delay, drop_after=args.drop_after)
+    print(f"{'mode':>8} {'seconds':>8} {'tokens':>8} {'failed':>7} {'incomplete':>11} {'journal':>8}")
+    try:
+        for resume in (True, False):
+            with tempfile.TemporaryDirectory() as directory:
+                journal = RequestJournal(os.path.join(directory, "journal.sqlite3"))
+                entries = interrupt_requests(server, journal, args.requests, directory)
+                seconds, tokens, failed, incomplete = recover(server, journal, entries, resume, args.tokens)
+                left = len(journal.unfinished())
+                journal.close()
+            print(
+                f"{'resume' if resume else 'resend':>8} {seconds:>8.2f} {tokens:>8} {failed:>7} "
+                f"{incomplete:>11} {left:>8}"
+            )
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
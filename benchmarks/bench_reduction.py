@@ -0,0 +1,49 @@
+"""Throughput and token savings of the prompt reduction steps on a large corpus.
+
+Runs every reduction step on its own and all of them together over a
+synthetic project and compares the time with encoding the same text, which
+the load has to do anyway, so a slow step shows up as a new bottleneck.
+"""
+import argparse
+import time
+
+from aimerger.reduction import STEPS, ReductionPipeline
+from aimerger.tokens import count_text_tokens, get_encoding
+from benchmarks.corpus import generate_cs_source
+
+
+def run(file_count, file_size, seed):
+    contents = [generate_cs_source(file_size, seed + number, banner=True) for number in range(file_count)]
+    total_bytes = sum(len(content) for content in contents)
+    encoding = get_encoding()
+
+    start = time.perf_counter()
+    original_tokens = sum(count_text_tokens(encoding, content) for content in contents)
+    encode_seconds = time.perf_counter() - start
+
+    print(f"Corpus:                                  {file_count:,} files, {total_bytes / 1e6:.1f} MB, {original_tokens:,} tokens")
+    print(f"Encode only:                             {encode_seconds * 1000:>8.0f} ms  {total_bytes / 1e6 / encode_seconds:>6.1f} MB/s")
+    for steps in [[step] for step in STEPS] + [list(STEPS)]:
+        pipeline = ReductionPipeline(steps)
+        start = time.perf_counter()
+        reduced = list(pipeline.run(contents))
+        seconds = time.perf_counter() - start
+        tokens = sum(count_text_tokens(encoding, content) for content in reduced)
+        saved = 1 - tokens / original_tokens
+        print(
+            f"{pipeline.key:<40} {seconds * 1000:>8.0f} ms  {total_bytes / 1e6 / seconds:>6.1f} MB/s"
+            f"  {tokens:>12,} tokens  {saved:>6.1%} saved"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=5000)
+    parser.add_argument("--size", type=int, default=10000, help="Size of every file in bytes")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    run(args.files, args.size, args.seed)
+
+
+if __name__ == "__main__":
+    main()
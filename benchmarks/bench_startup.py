@@ -0,0 +1,78 @@
+"""Time to first window and to a filled model dropdown, with and without the model cache.
+
+Launches the GUI against the local mock server, whose models endpoint answers
+after --latency seconds, and times the markers printed by its
+--exit-after-startup mode. Without a cached model list the dropdown is only
+filled once the endpoint answers; with one it is filled right away. The window
+itself should appear just as fast in both cases. Needs a display.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.bench_dispatcher import start_mock_server
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ai_merger_tool.py")
+
+
+def launch(env, work_dir):
+    """Start the GUI once and return the seconds until each startup marker."""
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, APP_PATH, "--exit-after-startup"],
+        cwd=work_dir,
+        env=env,
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    markers = {}
+    for line in process.stdout:
+        markers[line.strip()] = time.perf_counter() - start
+    process.wait()
+    if "window" not in markers or "models" not in markers:
+        raise SystemExit(f"The application did not report its startup, markers: {sorted(markers)}")
+    return markers
+
+
+def run(runs, latency):
+    server = start_mock_server(latency=latency)
+    with tempfile.TemporaryDirectory() as work_dir:
+        cache_dir = os.path.join(work_dir, "Cache")
+        env = dict(
+            os.environ,
+            OPENAI_API_KEY="mock-key",
+            OPENAI_API_BASE=f"http://127.0.0.1:{server.server_port}/v1",
+            AIMERGER_CACHE_DIR=cache_dir,
+        )
+        models_cache = os.path.join(cache_dir, "models.json")
+
+        results = {"without cache": [], "with cache": []}
+        for _ in range(runs):
+            if os.path.exists(models_cache):
+                os.remove(models_cache)
+            results["without cache"].append(launch(env, work_dir))
+            results["with cache"].append(launch(env, work_dir))
+    server.shutdown()
+
+    print(f"Models endpoint latency: {latency:.1f} s, median of {runs} runs")
+    print(f"{'':<16}{'first window':>14}{'models listed':>15}")
+    for name, timings in results.items():
+        window = statistics.median(timing["window"] for timing in timings)
+        models = statistics.median(timing["models"] for timing in timings)
+        print(f"{name:<16}{window * 1000:>11.0f} ms{models * 1000:>12.0f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=2.0, help="Models endpoint latency in seconds")
+    args = parser.parse_args()
+    run(args.runs, args.latency)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""Keystroke latency of the incremental token counter on a large buffer.
+
+Simulates typing into the middle message part and measures how long a recount
+takes after every keystroke, compared with a full re-encode of the buffer.
+Block-split counts and prompt budgets are first checked against full encodes
+for every block safe encoding, including comments following punctuation that
+o200k joins into one token across the newline.
+"""
+import argparse
+import random
+import statistics
+import time
+
+from aimerger import core
+from aimerger.budget import build_budget, section_text_tokens
+from aimerger.tokens import IncrementalTokenCounter, count_text_tokens, get_encoding, text_tokens
+from benchmarks.corpus import generate_cs_source
+
+# One model per block safe encoding
+CHECK_MODELS = ("gpt-3.5-turbo-0613", "gpt-4o")
+CHECK_SNIPPETS = [
+    "};\n// x\nint y;\n",
+    "x = 1;\n\n// comment\n",
+    "};\r\n/* block */\r\n",
+    "a(b);\n//\n//\n    // indented\n}\n",
+    "});\n/// <summary>\n",
+]
+
+
+def _percentile(values, percent):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def check_block_counts(seed, texts=300):
+    """Exit with an error if a block-split count differs from a full encode of the same text."""
+    rng = random.Random(seed)
+    for model in CHECK_MODELS:
+        encoding = get_encoding(model)
+        samples = list(CHECK_SNIPPETS)
+        for _ in range(texts):
+            samples.append("".join(rng.choice(CHECK_SNIPPETS + ["\n", " ", "{", "}", "/"]) for _ in range(rng.randint(1, 12))))
+        samples.append(generate_cs_source(20_000, seed))
+        for text in samples:
+            counted = IncrementalTokenCounter(model).count(text)
+            expected = count_text_tokens(encoding, text)
+            if counted != expected:
+                raise SystemExit(f"{encoding.name} block count mismatch for {text[:40]!r}: {counted}, full {expected}")
+    print(f"Block counts match full encodes for {', '.join(CHECK_MODELS)}.")
+
+
+def check_budget(seed, prompts=200):
+    """Exit with an error if a prompt budget differs from the framed count of the built prompt."""
+    rng = random.Random(seed)
+    pieces = CHECK_SNIPPETS + ["\n", " ", "{", "}", "/", "// end\n"]
+    for model in CHECK_MODELS:
+        encoding = get_encoding(model)
+        for _ in range(prompts):
+            start, end = ("".join(rng.choice(pieces) for _ in range(rng.randint(0, 6))) for _ in range(2))
+            files = ["".join(rng.choice(pieces) for _ in range(rng.randint(0, 8))) for _ in range(rng.randint(0, 4))]
+            middle_parts = list(zip(map(str, range(len(files))), section_text_tokens(model, files)))
+            budget = build_budget(model, text_tokens(encoding, start), middle_parts, text_tokens(encoding, end))
+            expected = core.count_prompt_tokens(core.build_prompt(start, "".join(files), end), model)
+            if budget.prompt_tokens != expected:
+                raise SystemExit(f"{encoding.name} budget mismatch: {budget.prompt_tokens}, full {expected}")
+    print(f"Prompt budgets match full encodes for {', '.join(CHECK_MODELS)}.")
+
+
+def run(size_bytes, keystrokes, model, seed):
+    rng = random.Random(seed)
+    text = generate_cs_source(size_bytes, seed)
+    encoding = get_encoding(model)
+
+    start = time.perf_counter()
+    full_count = count_text_tokens(encoding, text)
+    full_seconds = time.perf_counter() - start
+
+    counter = IncrementalTokenCounter(model)
+    start = time.perf_counter()
+    counter.count(text)
+    initial_seconds = time.perf_counter() - start
+
+    # Type a few characters at a random position, one recount per keystroke
+    latencies = []
+    position = rng.randrange(len(text))
+    for _ in range(keystrokes):
+        if rng.random() < 0.05:
+            position = rng.randrange(len(text))
+        text = text[:position] + rng.choice("abcxyz ;(){}\n") + text[position:]
+        position += 1
+        start = time.perf_counter()
+        counter.count(text)
+        latencies.append(time.perf_counter() - start)
+
+    incremental_count = counter.count(text)
+    expected_count = count_text_tokens(encoding, text)
+    if incremental_count != expected_count:
+        raise SystemExit(
+            f"Token count mismatch: incremental {incremental_count}, full {expected_count}"
+        )
+
+    print(f"Buffer size:             {len(text):,} characters, {full_count:,} tokens")
+    print(f"Full re-encode:          {full_seconds * 1000:.1f} ms")
+    print(f"Initial block count:     {initial_seconds * 1000:.1f} ms")
+    print(f"Keystroke recount p50:   {statistics.median(latencies) * 1000:.2f} ms")
+    print(f"Keystroke recount p95:   {_percentile(latencies, 95) * 1000:.2f} ms")
+    print(f"Keystroke recount max:   {max(latencies) * 1000:.2f} ms")
+    print(f"Counts match full encode after {keystrokes} keystrokes.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=1_000_000, help="Buffer size in bytes")
+    parser.add_argument("--keystrokes", type=int, default=200)
+    parser.add_argument("--model", default="gpt-3.5-turbo-0613")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    check_block_counts(args.seed)
+    check_budget(args.seed)
+    run(args.size, args.keystrokes, args.model, args.seed)
+
+
+if __name__ == "__main__":
+    main()
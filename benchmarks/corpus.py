@@ -0,0 +1,66 @@
+"""Synthetic C# sources used by the benchmarks."""
+import random
+
+_TYPES = ["int", "float", "string", "bool", "Vector3", "GameObject", "List<int>"]
+_VERBS = ["Update", "Load", "Apply", "Compute", "Reset", "Spawn", "Handle", "Validate"]
+_NOUNS = ["Player", "Enemy", "Score", "Inventory", "Camera", "Path", "Weapon", "Level"]
+
+
+def _identifier(rng):
+    return rng.choice(_VERBS) + rng.choice(_NOUNS) + str(rng.randint(0, 999))
+
+
+def _method(rng):
+    name = _identifier(rng)
+    lines = [
+        f"        // {rng.choice(_VERBS)} the {rng.choice(_NOUNS).lower()} state",
+        f"        public {rng.choice(_TYPES)} {name}({rng.choice(_TYPES)} value)",
+        "        {",
+    ]
+    for _ in range(rng.randint(2, 12)):
+        lines.append(
+            f"            var {name.lower()}{rng.randint(0, 99)} = "
+            f"{_identifier(rng)}(value) * {rng.randint(1, 1000)};"
+        )
+    lines.append("            return default;")
+    lines.append("        }")
+    return "\n".join(lines)
+
+
+_LICENSE_BANNER = [
+    "// ------------------------------------------------------------------",
+    "// Copyright (c) Example Studio. All rights reserved.",
+    "// Licensed under the MIT License. See LICENSE in the project root.",
+    "// ------------------------------------------------------------------",
+    "",
+]
+
+
+def generate_cs_source(size_bytes, seed=0, banner=False):
+    """Return a synthetic C# file of roughly size_bytes characters.
+
+    With banner set the file starts with the same license comment as every
+    other generated file, like the sources of a real project.
+    """
+    rng = random.Random(seed)
+    class_name = rng.choice(_NOUNS) + "Controller" + str(seed)
+    parts = list(_LICENSE_BANNER) if banner else []
+    parts += [
+        "using System;",
+        "using System.Collections.Generic;",
+        "using UnityEngine;",
+        "",
+        "namespace Game.Scripts",
+        "{",
+        f"    public class {class_name} : MonoBehaviour",
+        "    {",
+    ]
+    size = sum(len(part) + 1 for part in parts)
+    while size < size_bytes:
+        method = _method(rng)
+        parts.append(method)
+        parts.append("")
+        size += len(method) + 2
+    parts.append("    }")
+    parts.append("}")
+    return "\n".join(parts) + "\n"
@@ -0,0 +1,219 @@
+"""Local stand-in for the OpenAI models and chat completions endpoints.
+
+Start it with ``python -m benchmarks.mock_openai_server --port 8000`` and point
+the tool at it by setting ``OPENAI_API_BASE=http://127.0.0.1:8000/v1`` before
+launching. Streaming requests are answered as server-sent events, one token
+per event, so streaming, progress and incremental saving can be exercised
+without network access. ``--drop-rate`` drops the connection partway through
+some answers to exercise retries and resuming interrupted requests.
+"""
+import argparse
+import json
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Model ids reported by the models endpoint
+MOCK_MODELS = ["gpt-3.5-turbo", "gpt-4", "gpt-4o", "gpt-4o-mini"]
+
+
+class MockOpenAIHandler(BaseHTTPRequestHandler):
+    """Serve /v1/models and /v1/chat/completions with synthetic content."""
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        if self.path.rstrip("/").endswith("/models"):
+            models = [{"id": model, "object": "model"} for model in self.server.models]
+            self._send_json(200, {"object": "list", "data": models})
+        else:
+            self._send_json(404, {"error": {"message": "Not found", "type": "invalid_request_error"}})
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "Not found", "type": "invalid_request_error"}})
+            return
+
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        time.sleep(self.server.latency_for(request.get("model")))
+
+        if self.server.should_fail():
+            status = random.choice([429, 500, 503])
+            self.send_response(status)
+            body = json.dumps({"error": {"message": f"Mock error {status}", "type": "server_error"}}).encode("utf-8")
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            if status == 429:
+                self.send_header("Retry-After", str(self.server.retry_after))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        tokens = self.server.completion_tokens(request)
+        drop_at = self.server.drop_point(len(tokens))
+        if request.get("stream"):
+            self._stream_completion(request, tokens, drop_at)
+        elif drop_at is not None:
+            body = json.dumps(self._completion(request, "".join(tokens))).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body[:len(body) * drop_at // max(len(tokens), 1)])
+            self._drop_connection()
+        else:
+            self._send_json(200, self._completion(request, "".join(tokens)))
+
+    def _drop_connection(self):
+        """End the response early by closing the connection, like a dropped network link."""
+        self.wfile.flush()
+        self.close_connection = True
+
+    def _completion(self, request, content):
+        return {
+            "id": "chatcmpl-mock",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", ""),
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop",
+                }
+            ],
+        }
+
+    def _stream_chunk(self, request, delta, finish_reason=None):
+        chunk = {
+            "id": "chatcmpl-mock",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": request.get("model", ""),
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+    def _stream_completion(self, request, tokens, drop_at=None):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+
+        try:
+            for token in tokens[:drop_at]:
+                self._stream_chunk(request, {"content": token})
+                time.sleep(self.server.token_delay)
+            if drop_at is not None:
+                self._drop_connection()
+                return
+            # Like the API, the last chunk tells why the answer ended
+            self._stream_chunk(request, {}, "stop")
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # The client stopped reading, e.g. a cancelled request
+            self.close_connection = True
+
+
+class MockOpenAIServer(ThreadingHTTPServer):
+    """Threaded HTTP server holding the mock behaviour settings."""
+
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, address, latency=0.0, token_delay=0.0, tokens=200, failure_rate=0.0,
+                 retry_after=0.1, verbose=False, model_latency=None, drop_rate=0.0, drop_after=None):
+        super().__init__(address, MockOpenAIHandler)
+        self.latency = latency
+        self.model_latency = model_latency or {}
+        self.token_delay = token_delay
+        self.tokens = tokens
+        self.failure_rate = failure_rate
+        self.retry_after = retry_after
+        self.drop_rate = drop_rate
+        self.drop_after = drop_after
+        self.verbose = verbose
+        self.models = MOCK_MODELS
+
+    def latency_for(self, model):
+        """Return the seconds to wait before answering a completion request for a model."""
+        return self.model_latency.get(model, self.latency)
+
+    def should_fail(self):
+        """Decide whether the next request is answered with a 429 or 5xx error."""
+        return random.random() < self.failure_rate
+
+    def drop_point(self, count):
+        """Decide whether the next answer of count tokens is cut off and return after how many tokens, or None."""
+        if random.random() >= self.drop_rate:
+            return None
+        return min(count // 2 if self.drop_after is None else self.drop_after, count)
+
+    def completion_tokens(self, request):
+        """Return the tokens of the synthetic answer, capped at the request's max_tokens.
+
+        A request continuing a partial answer gets the tokens following the
+        ones it already has.
+        """
+        messages = request.get("messages") or []
+        first = 0
+        if len(messages) > 1 and messages[-2].get("role") == "assistant":
+            first = len(messages[-2].get("content", "").split())
+        count = min(self.tokens - first, request.get("max_tokens") or self.tokens)
+        return [f"token{index} " for index in range(first, first + count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local mock OpenAI API server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds before answering")
+    parser.add_argument("--model-latency", action="append", default=[], metavar="MODEL=SECONDS", help="Latency of one model, repeatable")
+    parser.add_argument("--token-delay", type=float, default=0.01, help="Seconds between streamed tokens")
+    parser.add_argument("--tokens", type=int, default=200, help="Tokens per answer")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Fraction of requests answered with 429/5xx")
+    parser.add_argument("--retry-after", type=float, default=0.1, help="Retry-After seconds sent with 429 errors")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="Fraction of answers whose connection is dropped partway")
+    parser.add_argument("--drop-after", type=int, help="Tokens sent before a connection is dropped (default: half the answer)")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    server = MockOpenAIServer(
+        (args.host, args.port),
+        latency=args.latency,
+        token_delay=args.token_delay,
+        tokens=args.tokens,
+        failure_rate=args.failure_rate,
+        retry_after=args.retry_after,
+        verbose=args.verbose,
+        drop_rate=args.drop_rate,
+        drop_after=args.drop_after,
+        model_latency={
+            model: float(seconds) for model, seconds in (entry.split("=", 1) for entry in args.model_latency)
+        },
+    )
+    print(f"Mock OpenAI API listening on http://{args.host}:{server.server_port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
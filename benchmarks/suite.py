@@ -0,0 +1,312 @@
+"""Reproducible benchmark suite for the merge, count and send pipeline.
+
+Generates synthetic C# corpora from 10 to 5,000 files (up to 50 MB) with fixed
+seeds and times file ingestion, token counting, prompt assembly, debug
+logging, response saving and sending against the local mock server. Results
+are written as JSON together with the commit they were measured on, and a
+previous result file can be passed to flag regressions::
+
+    python -m benchmarks.suite --output before.json
+    python -m benchmarks.suite --compare before.json
+
+The exit code is 1 when a benchmark got slower than the threshold allows.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import wait
+
+from aimerger import core, dispatcher
+from aimerger.chunking import estimate_prompt_tokens
+from aimerger.debug_log import DebugLog
+from aimerger.dispatcher import Dispatcher, PromptJob
+from aimerger.ingest import find_source_files, load_source_files
+from aimerger.token_index import TokenIndex
+from aimerger.tokens import DEFAULT_TOKEN_MODEL
+from benchmarks.bench_dispatcher import start_mock_server
+from benchmarks.corpus import generate_cs_source
+
+SCHEMA_VERSION = 1
+
+# name -> (file count, bytes per file)
+CORPORA = {
+    "tiny": (10, 2_000),
+    "small": (100, 5_000),
+    "medium": (1_000, 10_000),
+    "large": (5_000, 10_000),
+}
+DEFAULT_CORPORA = ["tiny", "small", "medium", "large"]
+
+START_TEXT = "Review the following C# scripts and list every bug you find."
+END_TEXT = "Answer with one section per script."
+
+
+def git_commit():
+    """Return the commit of the working tree, or None outside a git checkout."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_corpus(directory, file_count, file_size, seed=0):
+    """Write a corpus of deterministic C# files spread over folders and return their paths."""
+    for number in range(file_count):
+        folder = os.path.join(directory, f"Module{number // 100:03d}")
+        os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, f"Script{number:05d}.cs"), "w", encoding="utf-8") as f:
+            f.write(generate_cs_source(file_size, seed + number, banner=True))
+    return find_source_files(directory)
+
+
+def measure(function, repeat):
+    """Run function repeat times and return the durations in seconds."""
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def result(name, corpus, durations, size_bytes=None, items=None, **extra):
+    """Return a result record with the median and minimum of the durations."""
+    median = statistics.median(durations)
+    record = {
+        "name": name,
+        "corpus": corpus,
+        "median_seconds": median,
+        "min_seconds": min(durations),
+        "runs": durations,
+    }
+    if size_bytes is not None:
+        record["bytes"] = size_bytes
+        record["megabytes_per_second"] = size_bytes / 1e6 / median if median else None
+    if items is not None:
+        record["items"] = items
+        record["items_per_second"] = items / median if median else None
+    record.update(extra)
+    return record
+
+
+def bench_corpus(corpus, file_count, file_size, repeat, seed):
+    """Benchmark ingestion, token counting and prompt assembly on one corpus."""
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        filenames = write_corpus(os.path.join(directory, "src"), file_count, file_size, seed)
+        size_bytes = sum(os.path.getsize(filename) for filename in filenames)
+
+        loaded = []
+        results.append(result(
+            "ingest", corpus,
+            measure(lambda: loaded.append(load_source_files(filenames)[0]), repeat),
+            size_bytes, file_count,
+        ))
+        files = loaded[-1]
+        sections = [source_file.section for source_file in files]
+        section_tokens = [source_file.tokens for source_file in files]
+
+        index = TokenIndex(os.path.join(directory, "token_index.sqlite3"))
+        results.append(result(
+            "ingest_index_cold", corpus, measure(lambda: load_source_files(filenames, index=index), 1),
+            size_bytes, file_count,
+        ))
+        results.append(result(
+            "ingest_index_warm", corpus, measure(lambda: load_source_files(filenames, index=index), repeat),
+            size_bytes, file_count,
+        ))
+        index.close()
+
+        def assemble():
+            estimate_prompt_tokens(START_TEXT, END_TEXT, section_tokens)
+            return core.build_prompt(START_TEXT, "".join(sections), END_TEXT)
+
+        results.append(result("assemble_prompt", corpus, measure(assemble, repeat), size_bytes))
+        final_prompt = assemble()
+        results.append(result(
+            "count_tokens", corpus,
+            measure(lambda: core.count_prompt_tokens(final_prompt, DEFAULT_TOKEN_MODEL), repeat),
+            len(final_prompt.encode("utf-8")), tokens=sum(section_tokens),
+        ))
+    return results
+
+
+def bench_debug_log(repeat, messages=20_000, prompt_size=2_000_000):
+    """Benchmark logging many short messages and a full prompt, in memory and to a file."""
+    prompt = generate_cs_source(prompt_size)
+    results = []
+    for sink in (False, True):
+        with tempfile.TemporaryDirectory() as directory:
+            def log():
+                debug_log = DebugLog()
+                if sink:
+                    debug_log.set_file_sink(os.path.join(directory, "debug.log"))
+                for number in range(messages):
+                    debug_log.log(f"Request {number} queued.")
+                debug_log.log(f"Prompt Content:\n{prompt}")
+                debug_log.drain()
+                debug_log.set_file_sink(None)
+
+            results.append(result(
+                "debug_log_file" if sink else "debug_log", None, measure(log, repeat), items=messages + 1,
+            ))
+    return results
+
+
+def bench_save_responses(repeat, responses=200, response_size=20_000):
+    """Benchmark saving responses to new files in the dated responses tree."""
+    content = generate_cs_source(response_size)
+
+    def save():
+        with tempfile.TemporaryDirectory() as directory:
+            for number in range(responses):
+                core.save_response(core.format_response(number, content), "gpt-4o", directory)
+
+    return [result("save_responses", None, measure(save, repeat), responses * len(content), responses)]
+
+
+def bench_send(repeat, requests=32, concurrency=4, latency=0.05, tokens=200, token_delay=0.001):
+    """Benchmark complete sends through the dispatcher against the local mock server.
+
+    The mock server answers after a fixed latency, so the reported overhead
+    is the time spent on top of what the server needed.
+    """
+    server = start_mock_server(latency=latency, tokens=tokens, token_delay=token_delay)
+    prompt = core.build_prompt(START_TEXT, generate_cs_source(20_000), END_TEXT)
+    results = []
+    try:
+        for stream in (False, True):
+            latencies = []
+            with tempfile.TemporaryDirectory() as directory:
+                def send():
+                    pool = Dispatcher(max_workers=concurrency)
+                    jobs = [
+                        PromptJob(f"prompt {number}", prompt, "gpt-4o", stream=stream, responses_dir=directory)
+                        for number in range(requests)
+                    ]
+                    wait([pool.submit(job) for job in jobs])
+                    pool.shutdown()
+                    failed = [job for job in jobs if job.status == dispatcher.FAILED]
+                    if failed:
+                        raise RuntimeError(f"Request failed: {failed[0].error}")
+                    latencies.extend(job.finished_at - job.started_at for job in jobs)
+
+                durations = measure(send, repeat)
+            server_seconds = latency + (tokens * token_delay if stream else 0)
+            latencies.sort()
+            results.append(result(
+                "send_stream" if stream else "send", None, durations, items=requests,
+                latency_p50=statistics.median(latencies),
+                latency_p95=latencies[int(0.95 * (len(latencies) - 1))],
+                overhead_p50=statistics.median(latencies) - server_seconds,
+            ))
+    finally:
+        server.shutdown()
+    return results
+
+
+def run(corpora, repeat, seed):
+    """Run the whole suite and return the result document."""
+    results = []
+    for corpus in corpora:
+        file_count, file_size = CORPORA[corpus]
+        print(f"Corpus {corpus}: {file_count:,} files of {file_size:,} bytes...", file=sys.stderr)
+        results.extend(bench_corpus(corpus, file_count, file_size, repeat, seed))
+    print("Debug log, response saving and sending...", file=sys.stderr)
+    results.extend(bench_debug_log(repeat))
+    results.extend(bench_save_responses(repeat))
+    results.extend(bench_send(repeat))
+    return {
+        "schema": SCHEMA_VERSION,
+        "commit": git_commit(),
+        "created": time.time(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": seed,
+        "repeat": repeat,
+        "results": results,
+    }
+
+
+def _key(record):
+    return record["name"], record["corpus"]
+
+
+def compare(document, baseline, threshold):
+    """Return (key, baseline median, median, change) for every benchmark that got slower than threshold."""
+    previous = {_key(record): record for record in baseline["results"]}
+    regressions = []
+    for record in document["results"]:
+        old = previous.get(_key(record))
+        if not old or not old["median_seconds"]:
+            continue
+        change = record["median_seconds"] / old["median_seconds"] - 1
+        if change > threshold:
+            regressions.append((_key(record), old["median_seconds"], record["median_seconds"], change))
+    return regressions
+
+
+def format_results(document, baseline=None):
+    """Return the results as a text table, with the change against a baseline if given."""
+    previous = {_key(record): record for record in baseline["results"]} if baseline else {}
+    lines = [f"{'Benchmark':<22}{'Corpus':<8}{'median ms':>11}{'min ms':>10}{'MB/s':>9}{'items/s':>11}{'change':>9}"]
+    for record in document["results"]:
+        old = previous.get(_key(record))
+        change = f"{record['median_seconds'] / old['median_seconds'] - 1:+.0%}" if old and old["median_seconds"] else ""
+        throughput = record.get("megabytes_per_second")
+        items = record.get("items_per_second")
+        lines.append(
+            f"{record['name']:<22}{record['corpus'] or '-':<8}{record['median_seconds'] * 1000:>11.1f}"
+            f"{record['min_seconds'] * 1000:>10.1f}{'' if throughput is None else f'{throughput:.1f}':>9}"
+            f"{'' if items is None else f'{items:.0f}':>11}{change:>9}"
+        )
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--corpora", nargs="+", choices=list(CORPORA), default=DEFAULT_CORPORA)
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per benchmark, the median is compared")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--compare", metavar="BASELINE", help="Results JSON of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Slowdown reported as regression (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    document = run(args.corpora, args.repeat, args.seed)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(document, f, indent=2)
+    print(format_results(document, baseline))
+
+    if baseline:
+        regressions = compare(document, baseline, args.threshold)
+        for (name, corpus), old, new, change in regressions:
+            print(
+                f"Regression: {name} ({corpus or '-'}) {old * 1000:.1f} ms -> {new * 1000:.1f} ms ({change:+.0%})",
+                file=sys.stderr,
+            )
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())